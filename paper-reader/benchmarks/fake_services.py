@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""MinerU 和 NVIDIA NIM 的本地替身服务
+
+在本机端口上模拟两个外部 API，用于不消耗配额地测量 parser.py / analyze_images.py 的吞吐：
+    MinerU   POST /api/v4/extract/task          提交任务
+             GET  /api/v4/extract/task/{id}     查询状态（前 N 次返回 running 和解析进度）
+             POST /api/v4/file-urls/batch       申请本地文件的上传地址
+             PUT  /upload/{batch_id}            上传文件（按内容 sha256 匹配登记的论文）
+             GET  /api/v4/extract-results/batch/{batch_id}  查询上传文件的解析状态
+             GET  /files/{id}.zip               下载解析结果 ZIP
+    NIM      POST /v1/chat/completions          返回固定的分析文本和 token 用量（支持 stream）
+
+每个服务的延迟、失败率和 429 限流率由 ServiceProfile 配置，随机数使用固定种子，结果可复现。
+脚本通过环境变量 MINERU_API_BASE / NVIDIA_API_BASE（或同名模块属性）指向这里。
+"""
+
+import json
+import time
+import hashlib
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+class ServiceProfile:
+    """单个替身服务的行为
+
+    Args:
+        latency: 每个请求的基础延迟（秒）
+        jitter: 在基础延迟上叠加的随机延迟上限（秒）
+        failure_rate: 返回 503（MinerU GET）或 500（NIM）的概率
+        throttle_rate: 返回 429 的概率
+        retry_after: 429 响应的 Retry-After（秒）
+        tokens_per_s: NIM 的模拟输出速度，用于按输出长度追加生成耗时，0 表示不追加
+        seed: 随机数种子
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 0.0, tokens_per_s: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.tokens_per_s = tokens_per_s
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def to_dict(self) -> Dict:
+        return {k: getattr(self, k) for k in
+                ('latency', 'jitter', 'failure_rate', 'throttle_rate', 'retry_after', 'tokens_per_s')}
+
+    def _roll(self) -> float:
+        with self.lock:
+            return self.random.random()
+
+    def delay(self) -> None:
+        extra = self._roll() * self.jitter if self.jitter else 0.0
+        if self.latency or extra:
+            time.sleep(self.latency + extra)
+
+    def should_fail(self) -> bool:
+        return self.failure_rate > 0 and self._roll() < self.failure_rate
+
+    def should_throttle(self) -> bool:
+        return self.throttle_rate > 0 and self._roll() < self.throttle_rate
+
+
+class FakeServices:
+    """在同一个本地 HTTP 服务上运行 MinerU 和 NIM 替身
+
+    用法：
+        with FakeServices(mineru=ServiceProfile(), nim=ServiceProfile()) as services:
+            services.add_paper(pdf_url, zip_bytes)
+            parser.MINERU_API_BASE = services.mineru_base
+    """
+
+    ANALYSIS_TEXT = (
+        "1. 图像类型：实验结果图。\n"
+        "2. 核心信息：横轴为训练步数，纵轴为准确率，所提方法在所有设置下均优于基线。\n"
+        "3. 与上下文的关系：支持正文中关于收敛速度的结论。\n"
+    )
+
+    def __init__(self, mineru: Optional[ServiceProfile] = None, nim: Optional[ServiceProfile] = None,
+                 processing_polls: int = 0, host: str = '127.0.0.1', port: int = 0):
+        """
+        Args:
+            mineru: MinerU 替身的行为，默认无延迟、不失败
+            nim: NIM 替身的行为
+            processing_polls: 任务在返回 done 之前以 running 应答的查询次数
+        """
+        self.mineru = mineru or ServiceProfile()
+        self.nim = nim or ServiceProfile()
+        self.processing_polls = processing_polls
+        self.papers: Dict[str, bytes] = {}
+        self.tasks: Dict[str, Dict] = {}
+        self.counters: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def mineru_base(self) -> str:
+        return f"{self.base_url}/api/v4"
+
+    @property
+    def nim_base(self) -> str:
+        return f"{self.base_url}/v1"
+
+    def add_paper(self, pdf_url: str, zip_bytes: bytes) -> None:
+        """登记 pdf_url 对应的解析结果 ZIP；上传的本地文件以 "sha256:{内容哈希}" 登记"""
+        self.papers[pdf_url] = zip_bytes
+
+    def zip_url(self, pdf_url: str) -> str:
+        """为已登记的论文创建一个已完成的任务，返回其 ZIP 下载地址（跳过提交和轮询）"""
+        with self.lock:
+            task_id = f"task-{len(self.tasks) + 1}"
+            self.tasks[task_id] = {"pdf_url": pdf_url, "polls": self.processing_polls}
+        return f"{self.base_url}/files/{task_id}.zip"
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def reset_counters(self) -> Dict[str, int]:
+        """返回并清空各类请求的计数"""
+        with self.lock:
+            counters, self.counters = self.counters, {}
+        return counters
+
+    def start(self) -> 'FakeServices':
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _handler_class(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头和响应体分两次写出，不关闭 Nagle 时 keep-alive 连接上每个请求会多出约 40ms 的延迟确认
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def read_body(self) -> bytes:
+                length = int(self.headers.get('Content-Length') or 0)
+                return self.rfile.read(length) if length else b''
+
+            def send(self, status: int, body: bytes, content_type: str = 'application/json', headers: Dict = None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_json(self, status: int, data: Dict, headers: Dict = None):
+                self.send(status, json.dumps(data, ensure_ascii=False).encode('utf-8'), headers=headers)
+
+            def do_POST(self):
+                body = self.read_body()
+                if self.path == '/api/v4/extract/task':
+                    services.count('mineru.submit')
+                    services.mineru.delay()
+                    self.submit(json.loads(body or b'{}'))
+                elif self.path == '/api/v4/file-urls/batch':
+                    services.count('mineru.upload_url')
+                    services.mineru.delay()
+                    self.file_urls(json.loads(body or b'{}'))
+                elif self.path == '/v1/chat/completions':
+                    services.count('nim.chat')
+                    services.nim.delay()
+                    self.chat(json.loads(body or b'{}'))
+                else:
+                    self.send_json(404, {"error": "not found"})
+
+            def do_PUT(self):
+                if not self.path.startswith('/upload/'):
+                    return self.send_json(404, {"error": "not found"})
+                services.count('mineru.upload')
+                # 按块读取，与真实的预签名地址一样不关心 Content-Type
+                remaining = int(self.headers.get('Content-Length') or 0)
+                digest = hashlib.sha256()
+                while remaining:
+                    chunk = self.rfile.read(min(remaining, 1 << 20))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    remaining -= len(chunk)
+                services.mineru.delay()
+                task = services.tasks.get(self.path[len('/upload/'):])
+                if task is None:
+                    return self.send_json(404, {"error": "unknown upload"})
+                task["pdf_url"] = f"sha256:{digest.hexdigest()}"
+                self.send(200, b'', 'text/plain')
+
+            def do_GET(self):
+                if self.path.startswith('/api/v4/extract/task/'):
+                    services.count('mineru.status')
+                    services.mineru.delay()
+                    if services.mineru.should_fail():
+                        return self.send_json(503, {"error": "service unavailable"})
+                    self.status(self.path.rsplit('/', 1)[-1])
+                elif self.path.startswith('/api/v4/extract-results/batch/'):
+                    services.count('mineru.status')
+                    services.mineru.delay()
+                    if services.mineru.should_fail():
+                        return self.send_json(503, {"error": "service unavailable"})
+                    self.batch_status(self.path.rsplit('/', 1)[-1])
+                elif self.path.startswith('/files/') and self.path.endswith('.zip'):
+                    services.count('mineru.download')
+                    services.mineru.delay()
+                    if services.mineru.should_fail():
+                        return self.send_json(503, {"error": "service unavailable"})
+                    task = services.tasks.get(self.path[len('/files/'):-len('.zip')])
+                    if task is None:
+                        return self.send_json(404, {"error": "unknown task"})
+                    self.send(200, services.papers[task["pdf_url"]], 'application/zip')
+                else:
+                    self.send_json(404, {"error": "not found"})
+
+            def submit(self, data: Dict):
+                pdf_url = data.get('url')
+                if pdf_url not in services.papers:
+                    return self.send_json(200, {"code": -1, "msg": f"unknown url: {pdf_url}"})
+                with services.lock:
+                    task_id = f"task-{len(services.tasks) + 1}"
+                    services.tasks[task_id] = {"pdf_url": pdf_url, "polls": 0}
+                self.send_json(200, {"code": 0, "data": {"task_id": task_id}})
+
+            def file_urls(self, data: Dict):
+                files = data.get('files') or []
+                if len(files) != 1:
+                    return self.send_json(200, {"code": -1, "msg": "expected exactly one file"})
+                with services.lock:
+                    batch_id = f"batch-{len(services.tasks) + 1}"
+                    services.tasks[batch_id] = {"pdf_url": None, "polls": 0, "file_name": files[0].get('name'),
+                                                "data_id": files[0].get('data_id')}
+                self.send_json(200, {"code": 0, "data": {
+                    "batch_id": batch_id, "file_urls": [f"{services.base_url}/upload/{batch_id}"]}})
+
+            def task_state(self, task_id: str, task: Dict) -> Dict:
+                """推进一次查询计数并返回任务状态"""
+                with services.lock:
+                    task["polls"] += 1
+                    polls = task["polls"]
+                if polls <= services.processing_polls:
+                    total = services.processing_polls + 1
+                    return {"state": "running", "extract_progress": {"extracted_pages": polls, "total_pages": total}}
+                return {"state": "done", "full_zip_url": f"{services.base_url}/files/{task_id}.zip"}
+
+            def status(self, task_id: str):
+                task = services.tasks.get(task_id)
+                if task is None:
+                    return self.send_json(404, {"error": "unknown task"})
+                self.send_json(200, {"code": 0, "data": {"task_id": task_id, **self.task_state(task_id, task)}})
+
+            def batch_status(self, batch_id: str):
+                task = services.tasks.get(batch_id)
+                if task is None:
+                    return self.send_json(404, {"error": "unknown batch"})
+                item = {"file_name": task["file_name"], "data_id": task["data_id"]}
+                if task["pdf_url"] is None:
+                    item["state"] = "waiting-file"
+                elif task["pdf_url"] not in services.papers:
+                    item.update(state="failed", err_msg="unknown file content")
+                else:
+                    item.update(self.task_state(batch_id, task))
+                self.send_json(200, {"code": 0, "data": {"batch_id": batch_id, "extract_result": [item]}})
+
+            def chat(self, payload: Dict):
+                profile = services.nim
+                if profile.should_throttle():
+                    return self.send_json(429, {"error": "rate limited"},
+                                          headers={"Retry-After": str(profile.retry_after)})
+                if profile.should_fail():
+                    return self.send_json(500, {"error": "internal error"})
+
+                content = payload["messages"][0]["content"]
+                prompt = ''.join(part.get('text', '') for part in content if part.get('type') == 'text')
+                images = sum(1 for part in content if part.get('type') == 'image_url')
+                if images > 1:
+                    # 批量请求：按提示词中的分隔标记逐段回答
+                    text = ''.join(f"<<<IMAGE {i}>>>\n{services.ANALYSIS_TEXT}" for i in range(1, images + 1))
+                else:
+                    text = services.ANALYSIS_TEXT
+                completion_tokens = len(text)
+                usage = {
+                    "prompt_tokens": len(prompt) // 4 + images * 256,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": len(prompt) // 4 + images * 256 + completion_tokens,
+                    "completion_tokens_details": {"reasoning_tokens": 0}
+                }
+                if profile.tokens_per_s:
+                    time.sleep(completion_tokens / profile.tokens_per_s)
+
+                if payload.get('stream'):
+                    return self.stream(text, usage)
+                self.send_json(200, {
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                    "usage": usage
+                })
+
+            def stream(self, text: str, usage: Dict):
+                lines = [f"data: {json.dumps({'choices': [{'delta': {'content': line}}]}, ensure_ascii=False)}\n\n"
+                         for line in text.splitlines(keepends=True)]
+                lines.append(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+                lines.append("data: [DONE]\n\n")
+                self.send(200, ''.join(lines).encode('utf-8'), 'text/event-stream')
+
+        return Handler
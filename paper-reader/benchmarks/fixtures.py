@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""合成的论文样本
+
+按给定的图像数量和 markdown 大小生成一篇结构与 MinerU 输出相同的论文：
+带章节、正文段落、图像引用和图注的 full.md，以及每个图像各不相同的 PNG
+（只用 zlib/struct 编码，不依赖 Pillow）。另外生成一个指定大小的占位 PDF，用于测试本地文件上传。
+同一参数总是生成完全相同的内容。
+"""
+
+import io
+import struct
+import random
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, List
+
+# 预置的样本规模：图像数量、markdown 大小（KB）、占位 PDF 大小（KB）
+FIXTURES = {
+    "small": {"figures": 4, "markdown_kb": 20, "pdf_kb": 512},
+    "medium": {"figures": 16, "markdown_kb": 120, "pdf_kb": 2048},
+    "large": {"figures": 48, "markdown_kb": 600, "pdf_kb": 8192},
+}
+
+IMAGE_SIZE = (640, 480)
+
+_WORDS = (
+    "model training data method results performance baseline dataset accuracy attention layer "
+    "token sequence loss gradient optimization benchmark evaluation ablation architecture encoder "
+    "decoder representation inference latency throughput scaling parameter experiment analysis"
+).split()
+
+
+def make_png(width: int, height: int, seed: int, blocks: int = 8) -> bytes:
+    """生成 blocks x blocks 个随机色块组成的 RGB PNG，不同 seed 的感知哈希互不相同"""
+    rng = random.Random(seed)
+    colors = [[tuple(rng.randrange(256) for _ in range(3)) for _ in range(blocks)] for _ in range(blocks)]
+    rows = []
+    for y in range(height):
+        row_colors = colors[y * blocks // height]
+        row = bytearray(b'\x00')
+        for x in range(width):
+            row.extend(row_colors[x * blocks // width])
+        rows.append(bytes(row))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(b''.join(rows), 6))
+            + chunk(b'IEND', b''))
+
+
+def _paragraph(rng: random.Random, words: int = 120) -> str:
+    text = ' '.join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def make_markdown(figures: int, markdown_kb: int, seed: int = 0) -> str:
+    """生成约 markdown_kb KB、均匀分布 figures 个图像引用的论文 markdown"""
+    rng = random.Random(seed)
+    target = markdown_kb * 1024
+    sections = max(4, figures // 2)
+    per_section = max(1, target // sections)
+    lines = ["# A Synthetic Paper for Benchmarking", "", "## Abstract", "", _paragraph(rng), ""]
+    figure = 0
+    for s in range(1, sections + 1):
+        lines += [f"## {s} Section {s}", ""]
+        size = 0
+        # 图像均匀分布在各章节中
+        quota = figures * s // sections - figures * (s - 1) // sections
+        while size < per_section or quota:
+            paragraph = _paragraph(rng)
+            lines += [paragraph, ""]
+            size += len(paragraph) + 1
+            if quota:
+                figure += 1
+                quota -= 1
+                lines += [f"![](images/fig{figure:03d}.png)", "",
+                          f"Figure {figure}: {_paragraph(rng, 20)}", "",
+                          f"As shown in Figure {figure}, {_paragraph(rng, 40).lower()}", ""]
+    return '\n'.join(lines)
+
+
+def build_paper(figures: int, markdown_kb: int, seed: int = 0) -> Dict[str, bytes]:
+    """生成论文的全部文件：{ZIP 内的路径: 内容}"""
+    files = {"full.md": make_markdown(figures, markdown_kb, seed).encode('utf-8')}
+    width, height = IMAGE_SIZE
+    for i in range(1, figures + 1):
+        files[f"images/fig{i:03d}.png"] = make_png(width, height, seed * 100003 + i)
+    return files
+
+
+def make_pdf(size_kb: int, seed: int = 0) -> bytes:
+    """生成 size_kb KB 的占位 PDF（只有文件头，内容为伪随机字节；替身服务只按内容哈希识别）"""
+    rng = random.Random(seed)
+    header = b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n'
+    return header + rng.randbytes(size_kb * 1024 - len(header))
+
+
+def build_zip(files: Dict[str, bytes]) -> bytes:
+    """打包成 MinerU 解析结果格式的 ZIP（PNG 已压缩，按 stored 存放）"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, data in files.items():
+            compress = zipfile.ZIP_DEFLATED if name.endswith('.md') else zipfile.ZIP_STORED
+            zf.writestr(name, data, compress_type=compress)
+    return buffer.getvalue()
+
+
+def write_paper_dir(files: Dict[str, bytes], paper_dir: Path) -> Path:
+    """写成 backup/{paper_id}/ 的目录结构（paper.md + images/），返回 paper_dir"""
+    paper_dir = Path(paper_dir)
+    (paper_dir / 'images').mkdir(parents=True, exist_ok=True)
+    for name, data in files.items():
+        target = paper_dir / ('paper.md' if name == 'full.md' else name)
+        target.write_bytes(data)
+    return paper_dir
+
+
+def image_names(files: Dict[str, bytes]) -> List[str]:
+    return [name for name in files if name.startswith('images/')]
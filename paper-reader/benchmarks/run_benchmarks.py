@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""离线基准测试
+
+用本地替身服务（fake_services.py）代替 MinerU 和 NVIDIA NIM，在合成论文（fixtures.py）上
+测量各环节的耗时，不消耗任何 API 配额。结果写入 JSON 报告，可与之前的报告对比发现性能回退。
+
+场景：
+    parse_pdf                  提交 → 轮询 → 下载 ZIP → 写入备份目录的完整解析流程
+    parse_local_pdf            本地 PDF：哈希 → 申请上传地址 → 流式上传 → 轮询 → 下载 ZIP
+    download_and_extract_zip   只下载并提取 ZIP
+    collect_images             按 markdown 顺序收集图像
+    find_image_context         为论文中所有图像定位上下文
+    analyze_images             analyze_images.py 的完整运行（预处理、分诊、去重、模型调用、输出 JSON）
+
+每次运行使用全新的临时 backup 目录（PAPER_READER_BACKUP_DIR），缓存不会在两次运行之间生效。
+
+用法：
+    python3 run_benchmarks.py --output report.json
+    python3 run_benchmarks.py --profile realistic --fixtures small,medium,large --baseline report.json
+"""
+
+import io
+import os
+import hashlib
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+from contextlib import redirect_stderr, redirect_stdout
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+import metrics
+import http_client
+import analyze_images
+import parser as paper_parser
+import fixtures
+from fake_services import FakeServices, ServiceProfile
+
+REPORT_VERSION = 1
+
+# 替身服务的预置行为
+PROFILES = {
+    # 没有网络延迟，只测本地处理开销
+    "instant": {"mineru": {}, "nim": {}},
+    # 接近生产环境的延迟：MinerU 每次请求约 50ms，NIM 首字节约 0.4s 并按 2000 tokens/s 输出
+    "realistic": {"mineru": {"latency": 0.05, "jitter": 0.05},
+                  "nim": {"latency": 0.4, "jitter": 0.2, "tokens_per_s": 2000}},
+    # 间歇故障：MinerU GET 10% 返回 503，NIM 20% 返回 429、2% 返回 500
+    "flaky": {"mineru": {"latency": 0.02, "failure_rate": 0.1},
+              "nim": {"latency": 0.1, "throttle_rate": 0.2, "failure_rate": 0.02, "retry_after": 0.2}},
+}
+
+SCENARIOS = ['parse_pdf', 'parse_local_pdf', 'download_and_extract_zip', 'collect_images', 'find_image_context', 'analyze_images']
+
+# analyze_images 场景需要一个 API key，替身服务不校验
+BENCH_API_KEY = 'bench-key'
+
+
+class Context:
+    """一次基准测试运行共享的状态"""
+
+    def __init__(self, services: FakeServices, workdir: Path, concurrency: int, rate_limit: float,
+                 extra_args: List[str]):
+        self.services = services
+        self.workdir = workdir
+        self.concurrency = concurrency
+        self.rate_limit = rate_limit
+        self.extra_args = extra_args
+        self.papers: Dict[str, Dict[str, bytes]] = {}
+        self.paper_dirs: Dict[str, Path] = {}
+        self.pdf_files: Dict[str, Path] = {}
+        self.runs = 0
+
+    def paper(self, name: str) -> Dict[str, bytes]:
+        """生成样本文件并把对应的 ZIP 登记到替身服务"""
+        if name not in self.papers:
+            spec = fixtures.FIXTURES[name]
+            self.papers[name] = fixtures.build_paper(spec["figures"], spec["markdown_kb"])
+            self.services.add_paper(f"https://bench.invalid/papers/{name}.pdf", fixtures.build_zip(self.papers[name]))
+        return self.papers[name]
+
+    def pdf_url(self, name: str) -> str:
+        self.paper(name)
+        return f"https://bench.invalid/papers/{name}.pdf"
+
+    def pdf_file(self, name: str) -> Path:
+        """样本对应的本地占位 PDF，其内容哈希登记到替身服务"""
+        if name not in self.pdf_files:
+            data = fixtures.make_pdf(fixtures.FIXTURES[name]["pdf_kb"])
+            path = self.workdir / 'fixtures' / f'{name}.pdf'
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+            self.services.add_paper(f"sha256:{hashlib.sha256(data).hexdigest()}",
+                                    fixtures.build_zip(self.paper(name)))
+            self.pdf_files[name] = path
+        return self.pdf_files[name]
+
+    def paper_dir(self, name: str) -> Path:
+        """解压后的论文目录（只读场景共用）"""
+        if name not in self.paper_dirs:
+            self.paper_dirs[name] = fixtures.write_paper_dir(self.paper(name), self.workdir / 'fixtures' / name)
+        return self.paper_dirs[name]
+
+    def fresh_backup_dir(self) -> Path:
+        """为本次运行切换到一个全新的 backup 目录"""
+        self.runs += 1
+        path = self.workdir / f'backup-{self.runs}'
+        os.environ['PAPER_READER_BACKUP_DIR'] = str(path)
+        return path
+
+
+# ---- 场景：返回本次运行处理的条目数和附加信息 ----
+
+def scenario_parse_pdf(ctx: Context, name: str) -> Dict:
+    ctx.fresh_backup_dir()
+    result = paper_parser.parse_pdf(ctx.pdf_url(name), BENCH_API_KEY, refresh=True)
+    return {"items": len(result['image_paths']), "downloaded_bytes": result['io_stats']['downloaded_bytes']}
+
+
+def scenario_parse_local_pdf(ctx: Context, name: str) -> Dict:
+    ctx.fresh_backup_dir()
+    result = paper_parser.parse_pdf(str(ctx.pdf_file(name)), BENCH_API_KEY, refresh=True)
+    return {"items": len(result['image_paths']), "uploaded_bytes": ctx.pdf_file(name).stat().st_size}
+
+
+def scenario_download_and_extract_zip(ctx: Context, name: str) -> Dict:
+    ctx.fresh_backup_dir()
+    zip_url = ctx.services.zip_url(ctx.pdf_url(name))
+    result = paper_parser.download_and_extract_zip(zip_url, BENCH_API_KEY, ctx.pdf_url(name))
+    return {"items": len(result['image_paths']), "written_bytes": result['io_stats']['written_bytes']}
+
+
+def scenario_collect_images(ctx: Context, name: str) -> Dict:
+    paper_dir = ctx.paper_dir(name)
+    markdown = (paper_dir / 'paper.md').read_text(encoding='utf-8')
+    images = analyze_images.collect_images(paper_dir / 'images', markdown)
+    return {"items": len(images)}
+
+
+def scenario_find_image_context(ctx: Context, name: str) -> Dict:
+    paper_dir = ctx.paper_dir(name)
+    markdown = (paper_dir / 'paper.md').read_text(encoding='utf-8')
+    images = sorted((paper_dir / 'images').glob('*.png'))
+    contexts = [analyze_images.find_image_context(p, markdown) or '' for p in images]
+    return {"items": len(images), "context_chars": sum(len(c) for c in contexts),
+            "context_tokens": sum(analyze_images.estimate_tokens(c) for c in contexts)}
+
+
+def scenario_analyze_images(ctx: Context, name: str) -> Dict:
+    ctx.fresh_backup_dir()
+    output = ctx.workdir / f'analysis-{ctx.runs}.json'
+    argv = ['analyze_images.py', '--paper-dir', str(ctx.paper_dir(name)), '--output', str(output),
+            '--concurrency', str(ctx.concurrency), '--rate-limit', str(ctx.rate_limit)] + ctx.extra_args
+    saved_argv = sys.argv
+    sys.argv = argv
+    try:
+        analyze_images.main()
+    finally:
+        sys.argv = saved_argv
+    data = json.loads(output.read_text(encoding='utf-8'))
+    return {"items": data["total_images"], "analyzed": data["analyzed_images"],
+            "skipped": data["skipped_images"], "failed": data["failed_images"],
+            "model_calls_saved": data["model_calls_saved"]}
+
+
+SCENARIO_FUNCS: Dict[str, Callable[[Context, str], Dict]] = {
+    "parse_pdf": scenario_parse_pdf,
+    "parse_local_pdf": scenario_parse_local_pdf,
+    "download_and_extract_zip": scenario_download_and_extract_zip,
+    "collect_images": scenario_collect_images,
+    "find_image_context": scenario_find_image_context,
+    "analyze_images": scenario_analyze_images,
+}
+
+
+def api_summary() -> Dict[str, Dict]:
+    """按端点合计 metrics span（调用、失败、重试次数）"""
+    totals = {}
+    for row in metrics.summary():
+        entry = totals.setdefault(row["endpoint"], {"calls": 0, "errors": 0, "retries": 0})
+        for key in entry:
+            entry[key] += row[key]
+    return totals
+
+
+def run_scenario(ctx: Context, scenario: str, name: str, repeat: int, verbose: bool = False) -> Dict:
+    """运行一个场景 repeat 次（另加一次不计时的预热），返回耗时统计"""
+    func = SCENARIO_FUNCS[scenario]
+    timings = []
+    info = {}
+    sink = sys.stderr if verbose else io.StringIO()
+    metrics.reset()
+    ctx.services.reset_counters()
+    # analyze_images.py 会把上下文和分析结果打印到 stdout，与 stderr 一起收起来
+    with redirect_stderr(sink), redirect_stdout(sink if not verbose else sys.stderr):
+        func(ctx, name)
+        metrics.reset()
+        ctx.services.reset_counters()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            info = func(ctx, name)
+            timings.append(time.perf_counter() - start)
+    median = statistics.median(timings)
+    items = info.pop("items", None)
+    return {
+        "scenario": scenario,
+        "fixture": name,
+        "runs": [round(t, 6) for t in timings],
+        "min": round(min(timings), 6),
+        "median": round(median, 6),
+        "mean": round(statistics.mean(timings), 6),
+        "max": round(max(timings), 6),
+        "items": items,
+        "items_per_s": round(items / median, 3) if items and median > 0 else None,
+        "requests": {k: v // repeat for k, v in ctx.services.reset_counters().items()},
+        "api": api_summary(),
+        "info": info
+    }
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[Dict]:
+    """按场景对比两个报告的中位耗时，返回对比结果（regression 为 True 表示变慢超过容差）"""
+    rows = []
+    for key, current in report["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if not base or not base.get("median"):
+            continue
+        ratio = current["median"] / base["median"]
+        rows.append({"key": key, "baseline": base["median"], "current": current["median"],
+                     "ratio": round(ratio, 3), "regression": ratio > 1 + tolerance})
+    return rows
+
+
+def print_results(report: Dict, comparison: Optional[List[Dict]] = None, file=sys.stderr) -> None:
+    ratios = {row["key"]: row for row in comparison or []}
+    print(f"{'场景':<44}{'中位(ms)':>12}{'最小(ms)':>12}{'条目/s':>12}{'对比':>12}", file=file)
+    for key, r in report["results"].items():
+        row = ratios.get(key)
+        mark = f"{row['ratio']:.2f}x{' !' if row['regression'] else ''}" if row else '-'
+        print(f"{key:<44}{r['median'] * 1000:>12.2f}{r['min'] * 1000:>12.2f}"
+              f"{r['items_per_s'] if r['items_per_s'] is not None else '-':>12}{mark:>12}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='paper-reader 离线基准测试（使用本地 MinerU/NIM 替身服务）')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'逗号分隔的场景列表（默认全部：{",".join(SCENARIOS)}）')
+    parser.add_argument('--fixtures', default='small,medium',
+                        help=f'逗号分隔的样本规模（可选：{",".join(fixtures.FIXTURES)}，默认：small,medium）')
+    parser.add_argument('--profile', default='instant', choices=sorted(PROFILES), help='替身服务的延迟/故障配置（默认：instant）')
+    parser.add_argument('--mineru-latency', type=float, default=None, help='覆盖 MinerU 替身的每请求延迟（秒）')
+    parser.add_argument('--nim-latency', type=float, default=None, help='覆盖 NIM 替身的每请求延迟（秒）')
+    parser.add_argument('--failure-rate', type=float, default=None, help='覆盖两个替身的失败率')
+    parser.add_argument('--throttle-rate', type=float, default=None, help='覆盖 NIM 替身返回 429 的概率')
+    parser.add_argument('--processing-polls', type=int, default=0,
+                        help='MinerU 任务完成前返回 running 的查询次数（默认 0；大于 0 时会计入真实的轮询等待）')
+    parser.add_argument('--repeat', type=int, default=3, help='每个场景计时运行的次数（另有一次预热，默认：3）')
+    parser.add_argument('--concurrency', type=int, default=4, help='analyze_images 场景的 --concurrency（默认：4）')
+    parser.add_argument('--rate-limit', type=float, default=6000,
+                        help='analyze_images 场景的 --rate-limit（每分钟请求数，默认：6000，避免限速器主导耗时）')
+    parser.add_argument('--analyze-args', default='', help='追加给 analyze_images.py 的参数，例如 "--batch-size 4"')
+    parser.add_argument('--output', default=None, help='JSON 报告路径（默认输出到 stdout）')
+    parser.add_argument('--baseline', default=None, help='与之前的 JSON 报告对比中位耗时')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='对比时允许的变慢比例，超过即视为回退并以状态码 1 退出（默认：0.2）')
+    parser.add_argument('--workdir', default=None, help='保存临时 backup 目录和样本的目录（默认使用临时目录并在结束后删除）')
+    parser.add_argument('--verbose', action='store_true', help='显示被测脚本的 stderr 输出')
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    names = [n for n in args.fixtures.split(',') if n]
+    for s in scenarios:
+        if s not in SCENARIO_FUNCS:
+            parser.error(f"未知场景: {s}")
+    for n in names:
+        if n not in fixtures.FIXTURES:
+            parser.error(f"未知样本规模: {n}")
+
+    config = {k: dict(v) for k, v in PROFILES[args.profile].items()}
+    if args.mineru_latency is not None:
+        config["mineru"]["latency"] = args.mineru_latency
+    if args.nim_latency is not None:
+        config["nim"]["latency"] = args.nim_latency
+    if args.failure_rate is not None:
+        config["mineru"]["failure_rate"] = config["nim"]["failure_rate"] = args.failure_rate
+    if args.throttle_rate is not None:
+        config["nim"]["throttle_rate"] = args.throttle_rate
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix='paper-reader-bench-'))
+    workdir.mkdir(parents=True, exist_ok=True)
+    saved_backup_dir = os.environ.get('PAPER_READER_BACKUP_DIR')
+
+    services = FakeServices(mineru=ServiceProfile(**config["mineru"]), nim=ServiceProfile(**config["nim"], seed=1),
+                            processing_polls=args.processing_polls)
+    paper_parser.MINERU_API_BASE = services.mineru_base
+    analyze_images.NVIDIA_API_BASE = services.nim_base
+    analyze_images.read_nvidia_api_key = lambda: BENCH_API_KEY
+    http_client.configure_pool_size(args.concurrency)
+
+    report = {
+        "version": REPORT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "profile": args.profile,
+        "services": {"mineru": services.mineru.to_dict(), "nim": services.nim.to_dict(),
+                     "processing_polls": args.processing_polls},
+        "repeat": args.repeat,
+        "concurrency": args.concurrency,
+        "analyze_args": args.analyze_args,
+        "results": {}
+    }
+
+    try:
+        with services:
+            ctx = Context(services, workdir, args.concurrency, args.rate_limit, args.analyze_args.split())
+            for scenario in scenarios:
+                for name in names:
+                    key = f"{scenario}/{name}"
+                    print(f"运行 {key} ...", file=sys.stderr)
+                    report["results"][key] = run_scenario(ctx, scenario, name, max(1, args.repeat), args.verbose)
+    finally:
+        if saved_backup_dir is None:
+            os.environ.pop('PAPER_READER_BACKUP_DIR', None)
+        else:
+            os.environ['PAPER_READER_BACKUP_DIR'] = saved_backup_dir
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("services") != report["services"] or baseline.get("analyze_args") != report["analyze_args"]:
+            print("警告: 基线报告的替身服务配置或 analyze_images 参数与本次不同，对比结果仅供参考", file=sys.stderr)
+        comparison = compare(report, baseline, args.tolerance)
+        report["comparison"] = {"baseline": args.baseline, "tolerance": args.tolerance, "rows": comparison}
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + '\n', encoding='utf-8')
+        print(f"报告已保存到: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+    print_results(report, comparison)
+
+    if comparison and any(row["regression"] for row in comparison):
+        print(f"发现性能回退（超过基线 {args.tolerance:.0%}）", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
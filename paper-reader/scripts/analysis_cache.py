@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""图像分析结果缓存
+
+以 (图像内容哈希, 上下文哈希, 模型配置哈希, 提示词模板哈希) 为键，把视觉模型的
+分析结果持久化到 backup/analysis_cache.sqlite。同一图像在相同上下文、相同模型和
+提示词下再次分析时直接返回缓存结果；不同论文中完全相同的图像也可以复用。
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+import parse_cache
+
+CACHE_FILENAME = 'analysis_cache.sqlite'
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_config(config: Dict) -> str:
+    return hash_text(json.dumps(config, sort_keys=True, ensure_ascii=False))
+
+
+def make_key(image_hash: str, context_hash: str, config_hash: str, prompt_hash: str) -> str:
+    """组合四个哈希得到缓存键"""
+    return hash_text('\n'.join([image_hash, context_hash, config_hash, prompt_hash]))
+
+
+class AnalysisCache:
+    """基于 SQLite 的分析结果缓存（线程安全）"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else parse_cache.get_backup_base_dir() / CACHE_FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                key TEXT PRIMARY KEY,
+                image_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_last_used ON analyses(last_used)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analyses_image_hash ON analyses(image_hash)")
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """查找缓存，命中时更新访问时间和命中次数"""
+        with self.lock:
+            row = self.conn.execute("SELECT analysis FROM analyses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE analyses SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            return row[0]
+
+    def put(self, key: str, analysis: str, image_hash: str, model: str) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO analyses (key, image_hash, model, analysis, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, image_hash, model, analysis, now, now))
+            self.conn.commit()
+
+    def stats(self) -> Dict:
+        """返回缓存统计信息"""
+        with self.lock:
+            entries, total_hits, text_bytes, oldest, newest = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0), COALESCE(SUM(LENGTH(analysis)), 0), "
+                "MIN(created_at), MAX(last_used) FROM analyses").fetchone()
+            by_model = dict(self.conn.execute(
+                "SELECT model, COUNT(*) FROM analyses GROUP BY model").fetchall())
+        return {
+            "path": str(self.path),
+            "file_size": self.path.stat().st_size if self.path.exists() else 0,
+            "entries": entries,
+            "total_hits": total_hits,
+            "analysis_chars": text_bytes,
+            "oldest_created_at": oldest,
+            "last_used_at": newest,
+            "entries_by_model": by_model
+        }
+
+    def evict(self, max_entries: Optional[int] = None, max_age: Optional[float] = None) -> int:
+        """淘汰缓存条目
+
+        Args:
+            max_entries: 最多保留的条目数，超出部分按最近最少使用删除
+            max_age: 超过该时长（秒）未使用的条目会被删除
+
+        Returns:
+            删除的条目数
+        """
+        removed = 0
+        with self.lock:
+            if max_age is not None:
+                removed += self.conn.execute(
+                    "DELETE FROM analyses WHERE last_used < ?", (time.time() - max_age,)).rowcount
+            if max_entries is not None:
+                removed += self.conn.execute(
+                    "DELETE FROM analyses WHERE key IN ("
+                    "SELECT key FROM analyses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (max_entries,)).rowcount
+            self.conn.commit()
+        return removed
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
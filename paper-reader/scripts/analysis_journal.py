@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""图像分析进度日志
+
+分析过程中每完成一个图像只向 JSONL 日志追加一行，不再反复重写整个输出 JSON；
+进程中断时最多丢失最后一行。重新运行时回放日志即可跳过已完成的图像，
+全部完成后再一次性原子地生成 image_analysis.json。
+
+日志记录类型：
+    header   开始分析时写入：模型和图像列表，用于判断日志能否用于续传
+    result   某个图像的最终结果
+    partial  流式模式下某个图像的部分结果（续传时忽略）
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+JOURNAL_SUFFIX = '.journal.jsonl'
+
+
+def journal_path_for(output_path: Path) -> Path:
+    """输出 JSON 对应的日志路径，例如 image_analysis.json -> image_analysis.journal.jsonl"""
+    output_path = Path(output_path)
+    return output_path.with_name(output_path.stem + JOURNAL_SUFFIX)
+
+
+def replay(path: Path) -> Tuple[Optional[Dict], Dict[int, Dict]]:
+    """回放日志
+
+    Returns:
+        (header, {图像序号(从1开始): 最终结果})；日志不存在时 header 为 None。
+        末尾被截断的不完整行会被忽略。
+    """
+    header = None
+    results = {}
+    try:
+        f = open(path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return None, {}
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            kind = record.get("type")
+            if kind == "header":
+                header = record
+                results = {}
+            elif kind == "result" and header is not None:
+                results[record["index"]] = record["result"]
+    return header, results
+
+
+def _ends_with_newline(path: Path) -> bool:
+    """文件为空或以换行结尾"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+class AnalysisJournal:
+    """追加写入的 JSONL 日志（线程安全）"""
+
+    def __init__(self, path: Path, fsync: bool = False, truncate: bool = False):
+        """
+        Args:
+            path: 日志文件路径
+            fsync: 每条记录写入后调用 fsync，断电也不丢失已完成的结果
+            truncate: 清空已有日志重新开始
+        """
+        self.path = Path(path)
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'w' if truncate else 'a', encoding='utf-8')
+        if not truncate and not _ends_with_newline(self.path):
+            # 上次中断时最后一行只写了一半：先补上换行，后续记录另起一行，回放时只丢弃那半行
+            self.file.write('\n')
+            self.file.flush()
+
+    def append(self, record: Dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+
+    def write_header(self, model: str, images: List[str]) -> None:
+        self.append({"type": "header", "model": model, "images": images, "started_at": time.time()})
+
+    def write_result(self, index: int, result: Dict) -> None:
+        self.append({"type": "result", "index": index, "result": result})
+
+    def write_partial(self, index: int, result: Dict) -> None:
+        self.append({"type": "partial", "index": index, "result": result})
+
+    def close(self) -> None:
+        with self.lock:
+            self.file.close()
+
+    def remove(self) -> None:
+        """关闭并删除日志（结果已压缩到输出 JSON 之后调用）"""
+        self.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
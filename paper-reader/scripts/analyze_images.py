@@ -6,71 +6,155 @@
 """
 
 import os
+import re
 import sys
 import json
+import time
 import base64
 import argparse
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+
+import parse_cache
+import metrics
+import catalog
+import search_index
+from analysis_cache import AnalysisCache, hash_text, hash_config, make_key
+from analysis_journal import AnalysisJournal, journal_path_for, replay
+from context_builder import build_context, estimate_tokens, DEFAULT_BUDGET as DEFAULT_CONTEXT_BUDGET
+from figure_index import FigureIndex, get_figure_index
+from image_dedup import Deduplicator, DedupIndex, DEFAULT_THRESHOLD as DEDUP_THRESHOLD
+from image_preprocess import prepare_image, evict_cache as evict_image_cache, DEFAULT_CACHE_MAX_BYTES
+from image_triage import triage_image, SKIP as TRIAGE_SKIP, LIGHT as TRIAGE_LIGHT
+from model_router import ModelRouter, HEDGE_PERCENTILE
 
 try:
     import requests
+    import http_client
 except ImportError:
     print("Error: requests is required. Install with: pip install requests", file=sys.stderr)
     sys.exit(1)
 
 
 def read_nvidia_api_key():
-    """从 .env 文件读取 NVIDIA API key"""
+    """从 .env 文件读取 NVIDIA API key（未设置 NVIDIA_API_KEY 时使用 NVIDIA_API_KEYS 中的第一个）"""
+    keys = _read_env_keys()
+    if not keys:
+        raise ValueError("NVIDIA_API_KEY not found in .env file. Please add it to enable image analysis.")
+    return keys[0]
+
+
+def read_nvidia_api_keys() -> List[str]:
+    """读取全部 NVIDIA API key：NVIDIA_API_KEY 以及 NVIDIA_API_KEYS（逗号分隔），去重后主 key 在前"""
+    # 主 key 经 read_nvidia_api_key 读取，基准测试替换该函数时同样生效（见 benchmarks/）
+    keys = [read_nvidia_api_key()]
+    env_path = Path(__file__).parent / '.env'
+    if env_path.exists():
+        keys += _read_env_keys()
+    return list(dict.fromkeys(keys))
+
+
+def _read_env_keys() -> List[str]:
     env_path = Path(__file__).parent / '.env'
+    primary, extra = [], []
     with open(env_path, 'r', encoding='utf-8') as f:
         for line in f:
-            line = line.strip()
-            if line.startswith('NVIDIA_API_KEY'):
-                key = line.split('=', 1)[1].strip().strip('"\'')
-                return key
-    raise ValueError("NVIDIA_API_KEY not found in .env file. Please add it to enable image analysis.")
+            name, _, value = line.strip().partition('=')
+            value = value.strip().strip('"\'')
+            if name.strip() == 'NVIDIA_API_KEY' and value:
+                primary.append(value)
+            elif name.strip() == 'NVIDIA_API_KEYS':
+                extra += [k.strip() for k in value.split(',') if k.strip()]
+    return primary + extra
+
+
+# NVIDIA NIM API 地址，可用环境变量 NVIDIA_API_BASE 指向本地替身服务（见 benchmarks/）
+NVIDIA_API_BASE = os.environ.get('NVIDIA_API_BASE', 'https://integrate.api.nvidia.com/v1').rstrip('/')
+
+# 流式模式下部分结果写入进度日志的最小间隔（秒）
+PARTIAL_SAVE_INTERVAL = 2.0
+
+# light 分诊结果的输出长度上限（完整分析为 16384）
+LIGHT_MAX_TOKENS = 2048
+
+# 批量分析时模型输出中每个图像分段的分隔标记
+BATCH_MARKER = '<<<IMAGE {}>>>'
+BATCH_MARKER_RE = re.compile(r'^\s*<<<\s*IMAGE\s+(\d+)\s*>>>\s*$', re.MULTILINE)
+
+# 配置不同模型的参数
+MODEL_CONFIGS = {
+    "kimi": {
+        "model": "moonshotai/kimi-k2.5",
+        "temperature": 0.3,
+        "top_p": 1.00,
+        "chat_template_kwargs": {"thinking": True}
+    },
+    "qwen": {
+        "model": "qwen/qwen3.5-397b-a17b",
+        "temperature": 0.60,
+        "top_p": 0.95,
+        "top_k": 20,
+        "presence_penalty": 0,
+        "repetition_penalty": 1,
+        "chat_template_kwargs": {"enable_thinking": True}
+    }
+}
 
+# --model auto：每个请求由 ModelRouter 在所有模型（和所有 API key）中选择当前最快的健康后端
+AUTO_MODEL = "auto"
 
-def find_image_context(image_path: Path, markdown_content: str, context_lines: int = 10) -> str:
+
+def candidate_models(model: str) -> List[str]:
+    """model 可能对应的模型：auto 为 MODEL_CONFIGS 中的全部模型"""
+    return list(MODEL_CONFIGS) if model == AUTO_MODEL else [model]
+
+
+def build_router(model: str, api_keys: List[str], rate_limit: float, burst: int,
+                 hedge_percentile: float = HEDGE_PERCENTILE) -> Optional[ModelRouter]:
+    """为 --model auto 或多个 API key 建立路由器；只有一个模型和一个 key 时返回 None（直接调用）
+
+    Args:
+        rate_limit: 每个 key 每分钟最多发起的请求数
+        burst: 限速器的突发容量
+        hedge_percentile: 对冲阈值分位数，0 表示不对冲
+    """
+    models = candidate_models(model)
+    if len(models) * len(api_keys) < 2:
+        return None
+    return ModelRouter.from_keys(models, api_keys, lambda: RateLimiter(rate=rate_limit / 60, burst=burst),
+                                 hedge_percentile=hedge_percentile)
+
+
+def find_image_context(image_path: Path, markdown_content: str, context_lines: int = 10,
+                       index: FigureIndex = None, context_budget: Optional[int] = DEFAULT_CONTEXT_BUDGET) -> str:
     """根据图像文件名在 markdown 中定位上下文
 
     Args:
         image_path: 图像文件路径
         markdown_content: Markdown 内容
-        context_lines: 前后上下文行数
+        context_lines: 前后上下文行数（仅在不使用 token 预算时生效）
+        index: 可选，预先建立的 FigureIndex；默认按 markdown 内容复用缓存的索引
+        context_budget: 上下文的 token 预算，按图注、章节标题和引用该图的段落组装（见 context_builder.py）；
+            None 或 0 表示使用图像前后 context_lines 行的固定窗口
 
     Returns:
         上下文文本
     """
-    # 提取图像文件名（不含扩展名）
-    image_name = image_path.stem.lower()
-    image_filename = image_path.name.lower()
-
-    lines = markdown_content.split('\n')
-    best_matches = []
-
-    for i, line in enumerate(lines):
-        line_lower = line.lower()
-        # 查找图像引用（多种常见格式）
-        if (image_name in line_lower or
-            image_filename in line_lower or
-            f"![{image_name}" in line_lower or
-            f"figure {image_name}" in line_lower or
-            f"fig. {image_name}" in line_lower or
-            f"fig{image_name}" in line_lower):
-            best_matches.append(i)
-
-    if not best_matches:
-        return None
+    index = index or get_figure_index(markdown_content)
 
-    # 取第一个匹配位置
-    line_num = best_matches[0]
-    start = max(0, line_num - context_lines)
-    end = min(len(lines), line_num + context_lines + 1)
+    if context_budget:
+        built = build_context(index, image_path.name, context_budget)
+        return built["text"] if built else None
 
-    context_lines_list = lines[start:end]
-    return '\n'.join(f"{i+1}. {line}" for i, line in enumerate(context_lines_list, start=start))
+    # 通过索引定位图像引用（文件名、不含扩展名的文件名或图号）
+    line_num = index.image_line(image_path.name)
+    if line_num is None:
+        return None
+
+    return index.window(line_num, context_lines)
 
 
 def build_analysis_prompt(context_text: str) -> str:
@@ -100,13 +184,173 @@ def build_analysis_prompt(context_text: str) -> str:
 请以结构化的方式（使用 Markdown）返回分析结果。"""
 
 
+def build_light_prompt(context_text: str) -> str:
+    """构建简短的图像描述提示词（用于分诊为 light 的图像）"""
+    return f"""请简要描述以下学术论文图像：
+
+**上下文文字内容**：
+{context_text}
+
+用 2-4 句话说明这是什么类型的图，以及它在论文中想要传达的要点。不需要展开分析。"""
+
+
+def analysis_cache_key(image_path: Path, context_text: str, model: str, image_options: Dict = None,
+                       detail: str = "full") -> Tuple[str, str]:
+    """计算分析缓存键：图像内容、上下文、模型配置（含图像预处理参数和分析深度）和提示词模板任一变化都会得到不同的键
+
+    Returns:
+        (缓存键, 图像内容哈希)
+    """
+    image_hash = parse_cache.hash_file(image_path)
+    key = make_key(
+        image_hash,
+        hash_text(context_text),
+        hash_config({**MODEL_CONFIGS[model], "image_options": image_options or {}, "detail": detail}),
+        hash_text((build_light_prompt if detail == TRIAGE_LIGHT else build_analysis_prompt)('{context}'))
+    )
+    return key, image_hash
+
+
 def read_image_as_base64(image_path: Path) -> str:
-    """读取图像文件并转换为 base64"""
+    """读取图像文件并原样转换为 base64（不做预处理）"""
     with open(image_path, 'rb') as f:
         return base64.b64encode(f.read()).decode('utf-8')
 
 
-def call_vision_model(image_path: Path, context_text: str, api_key: str, model: str = "kimi", timeout: int = 600) -> str:
+class RateLimiter:
+    """自适应令牌桶限速器（线程安全）
+
+    按 rate（次/秒）发放令牌；收到 HTTP 429 时暂停到 Retry-After 指定的时间并将速率减半，
+    之后每次成功请求缓慢恢复速率，直到 max_rate。
+    """
+
+    def __init__(self, rate: float = 0.5, burst: int = 1, min_rate: float = 0.02, recovery: float = 0.05):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.min_rate = min_rate
+        self.recovery = recovery
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到获得一个令牌"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.paused_until - now
+            time.sleep(wait)
+
+    def on_throttle(self, retry_after: float = None):
+        """收到 429 后调用：暂停发放令牌并降低速率"""
+        with self.lock:
+            self.throttled += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+    def on_success(self):
+        """请求成功后调用：逐步恢复速率"""
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery * self.max_rate)
+
+
+def parse_retry_after(value) -> float:
+    """解析 Retry-After 头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class PartialAnalysisError(Exception):
+    """流式响应中途失败，partial_text 保存已经收到的内容"""
+
+    def __init__(self, message: str, partial_text: str):
+        super().__init__(message)
+        self.partial_text = partial_text
+
+
+def read_sse_stream(response, on_delta=None, stats: Dict = None) -> str:
+    """读取 chat completions 的 SSE 流，返回拼接后的完整回答
+
+    Args:
+        response: 以 stream=True 发起的响应
+        on_delta: 可选回调，每收到新内容时以当前完整文本调用
+        stats: 可选，回填首 token 延迟、输出速度和 token 用量
+
+    Raises:
+        PartialAnalysisError: 流读取中途失败时抛出，携带已收到的内容
+    """
+    start = time.monotonic()
+    first_token_at = None
+    parts = []
+    chunks = 0
+    usage = None
+
+    try:
+        for raw_line in response.iter_lines():
+            if not raw_line:
+                continue
+            line = raw_line.decode('utf-8') if isinstance(raw_line, bytes) else raw_line
+            if not line.startswith('data:'):
+                continue
+            data = line[5:].strip()
+            if data == '[DONE]':
+                break
+
+            chunk = json.loads(data)
+            if chunk.get('usage'):
+                usage = chunk['usage']
+            for choice in chunk.get('choices') or []:
+                delta = choice.get('delta') or {}
+                if first_token_at is None and (delta.get('content') or delta.get('reasoning_content')):
+                    first_token_at = time.monotonic()
+                if delta.get('content'):
+                    parts.append(delta['content'])
+                    chunks += 1
+                    if on_delta:
+                        on_delta(''.join(parts))
+    except Exception as e:
+        raise PartialAnalysisError(f"流式响应中断: {e}", ''.join(parts)) from e
+    finally:
+        if stats is not None:
+            elapsed = time.monotonic() - start
+            completion_tokens = (usage or {}).get('completion_tokens', chunks)
+            generation_time = elapsed - (first_token_at - start) if first_token_at else 0
+            stats.update({
+                "ttft": round(first_token_at - start, 3) if first_token_at else None,
+                "duration": round(elapsed, 3),
+                "usage": usage,
+                "tokens_per_s": round(completion_tokens / generation_time, 2) if generation_time > 0 else None
+            })
+
+    return ''.join(parts)
+
+
+def call_vision_model(image_path: Path, context_text: str, api_key: str, model: str = "kimi", timeout: int = 600,
+                      rate_limiter: RateLimiter = None, max_retries: int = 5, image_options: Dict = None,
+                      stats: Dict = None, stream: bool = False, on_delta=None, detail: str = "full",
+                      extra_images: List[Path] = None, prompt: str = None) -> str:
     """调用 NVIDIA NIM 的多模态 API 分析图像
 
     Args:
@@ -115,58 +359,59 @@ def call_vision_model(image_path: Path, context_text: str, api_key: str, model:
         api_key: NVIDIA API key
         model: 模型选择，支持 "kimi" 或 "qwen"，默认 "kimi"
         timeout: 请求超时时间（秒）
+        rate_limiter: 可选，多个线程共享的限速器
+        max_retries: 收到 HTTP 429 时的最大重试次数
+        image_options: 传给 prepare_image 的预处理参数（max_edge / image_format / quality）
+        stats: 可选，调用方传入的字典，用于回填图像上传大小、延迟和 token 用量等统计信息
+        stream: 是否使用流式响应
+        on_delta: 流式模式下的回调，每收到新内容时以当前完整文本调用
+        detail: "full" 完整分析；"light" 使用简短提示词、关闭思考并限制输出长度
+        extra_images: 可选，同一请求中附带的其余图像（批量分析），按顺序排在 image_path 之后
+        prompt: 可选，直接使用该提示词而不是根据 context_text 生成
 
     Returns:
         分析结果
     """
-    prompt = build_analysis_prompt(context_text)
-    image_data = read_image_as_base64(image_path)
-
-    url = "https://integrate.api.nvidia.com/v1/chat/completions"
-
-    # 配置不同模型的参数
-    model_configs = {
-        "kimi": {
-            "model": "moonshotai/kimi-k2.5",
-            "temperature": 0.3,
-            "top_p": 1.00,
-            "chat_template_kwargs": {"thinking": True}
-        },
-        "qwen": {
-            "model": "qwen/qwen3.5-397b-a17b",
-            "temperature": 0.60,
-            "top_p": 0.95,
-            "top_k": 20,
-            "presence_penalty": 0,
-            "repetition_penalty": 1,
-            "chat_template_kwargs": {"enable_thinking": True}
-        }
-    }
-
-    if model not in model_configs:
+    light = detail == TRIAGE_LIGHT
+    if prompt is None:
+        prompt = build_light_prompt(context_text) if light else build_analysis_prompt(context_text)
+    image_parts = []
+    uploads = []
+    for path in [image_path] + list(extra_images or []):
+        image = prepare_image(path, **(image_options or {}))
+        print(f"  - 图像上传大小: {path.name} {image['source_bytes']} -> {image['encoded_bytes']} 字节 "
+              f"({image['mime']}{', 缓存' if image['cached'] else ''})", file=sys.stderr)
+        uploads.append({k: image[k] for k in ('source_bytes', 'encoded_bytes', 'mime', 'width', 'height')})
+        image_parts.append({
+            "type": "image_url",
+            "image_url": {"url": f"data:{image['mime']};base64,{image['base64']}"}
+        })
+    if stats is not None:
+        stats["image"] = uploads[0]
+        stats["images"] = uploads
+
+    url = f"{NVIDIA_API_BASE}/chat/completions"
+
+    if model not in MODEL_CONFIGS:
         raise ValueError(f"不支持的模型: {model}。支持的模型: kimi, qwen")
 
-    config = model_configs[model]
+    config = MODEL_CONFIGS[model]
 
     payload = {
         "model": config["model"],
         "messages": [
             {
                 "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{image_data}"}
-                    }
-                ]
+                "content": [{"type": "text", "text": prompt}] + image_parts
             }
         ],
-        "max_tokens": 16384,
+        "max_tokens": LIGHT_MAX_TOKENS if light else 16384,
         "temperature": config["temperature"],
         "top_p": config["top_p"],
-        "stream": False
+        "stream": stream
     }
+    if stream:
+        payload["stream_options"] = {"include_usage": True}
 
     # 添加模型特定参数
     if "top_k" in config:
@@ -176,18 +421,285 @@ def call_vision_model(image_path: Path, context_text: str, api_key: str, model:
     if "repetition_penalty" in config:
         payload["repetition_penalty"] = config["repetition_penalty"]
     payload["chat_template_kwargs"] = config["chat_template_kwargs"]
+    if light:
+        payload["chat_template_kwargs"] = {k: False for k in config["chat_template_kwargs"]}
 
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
 
-    response = requests.post(url, headers=headers, json=payload, timeout=timeout)
-    response.raise_for_status()
-    return response.json()['choices'][0]['message']['content']
+    # 只序列化一次，便于统计上传字节数（重试时复用）
+    request_body = json.dumps(payload).encode('utf-8')
+    with metrics.span('nim.chat', model=config["model"], image=image_path.name, detail=detail,
+                      images=len(image_parts), bytes_up=len(request_body)) as span:
+        for attempt in range(max_retries + 1):
+            if rate_limiter:
+                rate_limiter.acquire()
+            request_start = time.monotonic()
+            response = http_client.get_session('nim').post(url, headers=headers, data=request_body, timeout=timeout,
+                                                           stream=stream)
+            span.response(response, None if stream else len(response.content))
+            if response.status_code == 429 and attempt < max_retries:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                print(f"  - 触发限流 (429)，{retry_after or '稍后'} 秒后重试: {image_path.name}", file=sys.stderr)
+                span.retry()
+                if rate_limiter:
+                    rate_limiter.on_throttle(retry_after)
+                else:
+                    time.sleep(retry_after if retry_after is not None else 2 ** attempt)
+                continue
+            response.raise_for_status()
+            if rate_limiter:
+                rate_limiter.on_success()
+
+            if stream:
+                call_stats = stats if stats is not None else {}
+                content = read_sse_stream(response, on_delta, call_stats)
+                span.set(usage=call_stats.get('usage'), ttft=call_stats.get('ttft'))
+                print(f"  - 首 token 延迟: {call_stats.get('ttft')} 秒，输出速度: {call_stats.get('tokens_per_s')} tokens/s",
+                      file=sys.stderr)
+                return content
+
+            body = response.json()
+            span.set(usage=body.get('usage'))
+            if stats is not None:
+                stats.update({"duration": round(time.monotonic() - request_start, 3), "usage": body.get('usage')})
+            return body['choices'][0]['message']['content']
+
+
+def call_vision_model_routed(router: Optional[ModelRouter], image_path: Path, context_text: str, api_key: str,
+                             model: str, rate_limiter: RateLimiter = None, stats: Dict = None,
+                             **kwargs) -> Tuple[str, str]:
+    """调用 call_vision_model；提供路由器时由路由器选择模型和 API key，并负责对冲和故障转移
+
+    Args:
+        router: 可选，ModelRouter；为 None 时使用 model 和 api_key 直接调用
+        stats: 可选，回填胜出请求的统计信息；使用路由器时另外记录 routing（后端、请求数、是否对冲）
+        其余参数同 call_vision_model
+
+    Returns:
+        (分析结果, 实际回答的模型)
+    """
+    if router is None:
+        return call_vision_model(image_path, context_text, api_key, model, rate_limiter=rate_limiter,
+                                 stats=stats, **kwargs), model
+
+    # 请求在路由器的线程中执行，需要带上调用方线程的指标标签
+    tags = metrics.current_tags()
+
+    def attempt(backend):
+        # 对冲时两个请求同时进行，各自记录统计，只采用胜出请求的
+        attempt_stats = {}
+        with metrics.tags(**tags, backend=backend.name):
+            try:
+                text = call_vision_model(image_path, context_text, backend.api_key, backend.model,
+                                         rate_limiter=backend.rate_limiter or rate_limiter, stats=attempt_stats,
+                                         **kwargs)
+            except PartialAnalysisError:
+                # 流式请求不对冲，调用方需要已上传图像的统计
+                if stats is not None:
+                    stats.update(attempt_stats)
+                raise
+        return text, attempt_stats
+
+    label = "batch" if kwargs.get("extra_images") else kwargs.get("detail", "full")
+    (text, attempt_stats), backend, info = router.call(attempt, label, hedge=not kwargs.get("stream"))
+    if info["attempts"] > 1:
+        print(f"  - 由 {backend.name} 返回（共发出 {info['attempts']} 个请求"
+              f"{'，已对冲' if info['hedged'] else ''}）: {image_path.name}", file=sys.stderr)
+    if stats is not None:
+        stats.update(attempt_stats)
+        stats["routing"] = {"backend": backend.name, **info}
+    return text, backend.model
+
+
+def prepare_analysis(image_path: Path, markdown_content: str, model: str, current_index: int, total_images: int,
+                     cache: AnalysisCache = None, context_lines: int = 10, image_options: Dict = None,
+                     dedup: Deduplicator = None, triage: bool = False,
+                     context_budget: Optional[int] = DEFAULT_CONTEXT_BUDGET) -> Tuple[Dict, Optional[Dict]]:
+    """调用模型之前的步骤：定位上下文、本地分诊、查找分析缓存和重复图像
+
+    Returns:
+        (结果字典, 待分析信息)。不需要调用模型时（跳过、命中缓存、重复图像）待分析信息为 None；
+        否则待分析信息记录 context、detail、缓存键和去重认领，调用模型后交给 complete_analysis，
+        无论成功与否都要调用 release_pending。
+    """
+    # 1. 定位上下文
+    context = find_image_context(image_path, markdown_content, context_lines, context_budget=context_budget)
+
+    if not context:
+        print(f"  - 跳过: {image_path.name} (未找到上下文)", file=sys.stderr)
+        return {
+            "image_path": str(image_path),
+            "image_name": image_path.name,
+            "context_preview": context[:500] + "..." if context and len(context) > 500 else (context or ""),
+            "context_found": False,
+            "skipped": True,
+            "skip_reason": "未在 markdown 中找到该图像的上下文描述",
+            "progress": {
+                "current": current_index,
+                "total": total_images
+            }
+        }, None
+
+    result = {
+        "image_path": str(image_path),
+        "image_name": image_path.name,
+        "context_preview": context[:500] + "..." if len(context) > 500 else context,
+        "context_found": True,
+        "progress": {
+            "current": current_index,
+            "total": total_images
+        }
+    }
+
+    # 2. 本地分诊
+    detail = "full"
+    if triage:
+        decision = triage_image(image_path, get_figure_index(markdown_content))
+        result["triage"] = decision
+        if decision["decision"] == TRIAGE_SKIP:
+            print(f"  - 分诊跳过: {image_path.name} ({decision['reason']})", file=sys.stderr)
+            result["skipped"] = True
+            result["skip_reason"] = decision["reason"]
+            return result, None
+        if decision["decision"] == TRIAGE_LIGHT:
+            detail = TRIAGE_LIGHT
+
+    # 记录上下文和单独请求时提示词的估算 token 数，用于比较不同的上下文策略；
+    # 提示词哈希（上下文 + 模板）供 --only-changed 判断旧结果是否仍然适用
+    prompt = (build_light_prompt if detail == TRIAGE_LIGHT else build_analysis_prompt)(context)
+    result["context_tokens_est"] = estimate_tokens(context)
+    result["prompt_tokens_est"] = estimate_tokens(prompt)
+    result["prompt_hash"] = hash_text(prompt)
+
+    pending = {"context": context, "detail": detail, "cache": cache, "cache_keys": {}, "image_hash": None,
+               "dedup": dedup, "claimed": None,
+               # 简短描述和完整分析不能互相复用
+               "dedup_model": model if detail == "full" else f"{model}:{detail}"}
+
+    # 3. 查找分析缓存（auto 时任一模型的分析都可以复用）
+    if cache:
+        for candidate in candidate_models(model):
+            pending["cache_keys"][candidate], pending["image_hash"] = analysis_cache_key(
+                image_path, context, candidate, image_options, detail)
+        for candidate, cache_key in pending["cache_keys"].items():
+            cached_analysis = cache.get(cache_key)
+            if cached_analysis is not None:
+                print(f"  - 命中缓存: {image_path.name} ({current_index}/{total_images})", file=sys.stderr)
+                result["analysis"] = cached_analysis
+                result["model"] = candidate
+                result["cached"] = True
+                return result, None
+
+    # 4. 查找重复图像（本次运行或论文库中已分析过的相同/近似图像）
+    if dedup:
+        fingerprint, match = dedup.claim(image_path, pending["dedup_model"])
+        if match:
+            print(f"  - 重复图像（{match['match']}，距离 {match['distance']}）: {image_path.name} -> "
+                  f"{Path(match['image_path']).name}", file=sys.stderr)
+            result["analysis"] = match["analysis"]
+            result["duplicate_of"] = match["image_path"]
+            result["dedup"] = {k: match[k] for k in ('match', 'distance', 'scope')}
+            return result, None
+        pending["claimed"] = fingerprint
+
+    return result, pending
+
+
+def complete_analysis(result: Dict, pending: Dict, analysis: str, model: str, upload: Dict = None,
+                      call_stats: Dict = None, cache_keys: Dict[str, str] = None) -> Dict:
+    """把模型返回的分析写入结果并存入缓存（model 为实际回答的模型）
+
+    cache_keys 默认为单独请求时的缓存键；批量请求的结果只能以批量提示词计算的键（batch_cache_keys）存入。
+    """
+    cache_keys = pending["cache_keys"] if cache_keys is None else cache_keys
+    if pending["cache"] and model in cache_keys:
+        pending["cache"].put(cache_keys[model], analysis, pending["image_hash"], model)
+    call_stats = call_stats or {}
+    result["analysis"] = analysis
+    result["model"] = model
+    if call_stats.get("routing"):
+        result["routing"] = call_stats["routing"]
+    result["upload"] = upload
+    result["timing"] = {k: call_stats.get(k) for k in ('ttft', 'duration', 'tokens_per_s')}
+    result["usage"] = call_stats.get("usage")
+    return result
+
+
+def release_pending(pending: Dict, analysis: Optional[str]) -> None:
+    """释放去重认领（analysis 为 None 表示分析失败，等待中的重复图像会改为自行分析）"""
+    if pending["claimed"] is not None:
+        pending["dedup"].release(pending["claimed"], pending["dedup_model"], analysis)
+        pending["claimed"] = None
+
+
+_verbose_lock = threading.Lock()
+
+
+def print_verbose(image_path: Path, context: str, analysis: str) -> None:
+    """把一个图像的上下文和分析结果整块写到 stderr，多个线程的输出不会交错"""
+    with _verbose_lock:
+        print(f"===== {image_path.name} 上下文 =====\n{context}\n"
+              f"===== {image_path.name} 分析 =====\n{analysis}", file=sys.stderr, flush=True)
+
+
+def run_prepared(image_path: Path, result: Dict, pending: Dict, api_key: str, model: str,
+                 rate_limiter: RateLimiter = None, image_options: Dict = None, stream: bool = False,
+                 on_partial=None, router: ModelRouter = None, verbose: bool = False) -> Dict:
+    """对 prepare_analysis 返回的待分析图像单独调用视觉模型"""
+    analysis = None
+    try:
+        call_stats = {}
+        on_delta = None
+        if stream and on_partial:
+            def on_delta(text):
+                on_partial({**result, "analysis": text, "incomplete": True})
+
+        try:
+            analysis, model = call_vision_model_routed(router, image_path, pending["context"], api_key, model,
+                                                       rate_limiter=rate_limiter, stats=call_stats,
+                                                       image_options=image_options, stream=stream,
+                                                       on_delta=on_delta, detail=pending["detail"])
+        except PartialAnalysisError as e:
+            print(f"  - 流式响应中断，保留已收到的 {len(e.partial_text)} 个字符: {image_path.name}", file=sys.stderr)
+            result.update({
+                "analysis": e.partial_text,
+                "incomplete": True,
+                "error": str(e),
+                "upload": call_stats.get("image"),
+                "timing": {k: call_stats.get(k) for k in ('ttft', 'duration', 'tokens_per_s')}
+            })
+            return result
+        if verbose:
+            print_verbose(image_path, pending["context"], analysis)
+        print(f"  - 完成: {image_path.name} ({result['progress']['current']}/{result['progress']['total']})",
+              file=sys.stderr)
+        return complete_analysis(result, pending, analysis, model, call_stats.get("image"), call_stats)
+    finally:
+        release_pending(pending, analysis)
+
+
+def error_result(image_path: Path, error: Exception, current_index: int, total_images: int) -> Dict:
+    print(f"  - 失败: {error}", file=sys.stderr)
+    return {
+        "image_path": str(image_path),
+        "image_name": image_path.name,
+        "error": str(error),
+        "progress": {
+            "current": current_index,
+            "total": total_images
+        }
+    }
 
 
-def analyze_image(image_path: Path, markdown_content: str, api_key: str, model: str = "kimi", current_index: int = 0, total_images: int = 0) -> Dict:
+def analyze_image(image_path: Path, markdown_content: str, api_key: str, model: str = "kimi", current_index: int = 0, total_images: int = 0,
+                  rate_limiter: RateLimiter = None, cache: AnalysisCache = None, context_lines: int = 10,
+                  image_options: Dict = None, stream: bool = False, on_partial=None,
+                  dedup: Deduplicator = None, triage: bool = False,
+                  context_budget: Optional[int] = DEFAULT_CONTEXT_BUDGET, router: ModelRouter = None,
+                  verbose: bool = False) -> Dict:
     """分析单个图像
 
     Args:
@@ -196,6 +708,17 @@ def analyze_image(image_path: Path, markdown_content: str, api_key: str, model:
         api_key: NVIDIA API key
         current_index: 当前图像索引（从1开始）
         total_images: 总图像数量
+        rate_limiter: 可选，多个线程共享的限速器
+        cache: 可选，分析结果缓存；命中时不调用模型
+        context_lines: 上下文前后行数（context_budget 为 0 时使用）
+        context_budget: 上下文的 token 预算，见 find_image_context
+        router: 可选，ModelRouter；提供时由路由器选择模型和 API key（model 可以为 auto），结果中记录实际回答的模型
+        image_options: 图像预处理参数
+        stream: 是否使用流式响应
+        on_partial: 流式模式下的回调，以带有部分分析内容（incomplete=True）的结果字典调用
+        dedup: 可选，图像去重器；重复图像直接复用已有分析，结果中记录 duplicate_of
+        triage: 调用模型前先在本地分诊，跳过无信息量的图像，简单图像使用简短提示词
+        verbose: 是否把发送的上下文和模型返回的分析写到 stderr
 
     Returns:
         分析结果字典
@@ -203,62 +726,246 @@ def analyze_image(image_path: Path, markdown_content: str, api_key: str, model:
     print(f"正在分析图像: {image_path.name} ({current_index}/{total_images})", file=sys.stderr)
 
     try:
-        # 1. 定位上下文
-        context = find_image_context(image_path, markdown_content)
+        result, pending = prepare_analysis(image_path, markdown_content, model, current_index, total_images,
+                                           cache=cache, context_lines=context_lines, image_options=image_options,
+                                           dedup=dedup, triage=triage, context_budget=context_budget)
+        if pending is None:
+            return result
+        return run_prepared(image_path, result, pending, api_key, model, rate_limiter=rate_limiter,
+                            image_options=image_options, stream=stream, on_partial=on_partial, router=router,
+                            verbose=verbose)
+    except Exception as e:
+        return error_result(image_path, e, current_index, total_images)
 
-        if not context:
-            print(f"  - 跳过: {image_path.name} (未找到上下文)", file=sys.stderr)
-            return {
-                "image_path": str(image_path),
-                "image_name": image_path.name,
-                "context_preview": context[:500] + "..." if context and len(context) > 500 else (context or ""),
-                "context_found": False,
-                "skipped": True,
-                "skip_reason": "未在 markdown 中找到该图像的上下文描述",
-                "progress": {
-                    "current": current_index,
-                    "total": total_images
-                }
-            }
 
-        print(context)
-        # 2. 调用选定的视觉模型分析
-        analysis = call_vision_model(image_path, context, api_key, model)
-        print(analysis)
-        print(f"  - 完成: {image_path.name} ({current_index}/{total_images})", file=sys.stderr)
+def build_batch_prompt(context_text: str, image_names: List[str]) -> str:
+    """构建多图批量分析提示词：分析要求只出现一次，要求按图像分段输出"""
+    listing = '\n'.join(f"- 图像 {k}: {name}" for k, name in enumerate(image_names, 1))
+    markers = '\n'.join(f"{BATCH_MARKER.format(k)}\n（图像 {k} 的分析）" for k in range(1, len(image_names) + 1))
+    return build_analysis_prompt(context_text) + f"""
 
-        return {
-            "image_path": str(image_path),
-            "image_name": image_path.name,
-            "context_preview": context[:500] + "..." if len(context) > 500 else context,
-            "context_found": True,
-            "analysis": analysis,
-            "progress": {
-                "current": current_index,
-                "total": total_images
-            }
-        }
+**本次请求包含 {len(image_names)} 个图像**（同一图注下的子图或同一段上下文中的相邻图像），按顺序为：
+{listing}
 
-    except Exception as e:
-        print(f"  - 失败: {e}", file=sys.stderr)
-        return {
-            "image_path": str(image_path),
-            "image_name": image_path.name,
-            "error": str(e),
-            "progress": {
-                "current": current_index,
-                "total": total_images
-            }
-        }
+请对每个图像分别按上述框架分析，并严格按以下格式输出，每个图像的分析以单独一行的分隔标记开头：
+{markers}"""
+
+
+def batch_cache_keys(image_path: Path, prompt: str, model: str, image_options: Dict = None) -> Dict[str, str]:
+    """批量请求中某个图像的缓存键：{候选模型: 缓存键}
+
+    批量分析的提示词包含所有图像的上下文和文件名，与单独请求的结果不能互相替代，
+    因此以完整的批量提示词代替上下文计算，只有完全相同的批次才会命中。
+    """
+    image_hash = parse_cache.hash_file(image_path)
+    return {candidate: make_key(
+        image_hash,
+        hash_text(prompt),
+        hash_config({**MODEL_CONFIGS[candidate], "image_options": image_options or {}, "detail": "batch"}),
+        hash_text(build_batch_prompt('{context}', ['{image}']))
+    ) for candidate in candidate_models(model)}
+
+
+def split_batch_response(text: str, count: int) -> Dict[int, str]:
+    """按分隔标记拆分批量分析结果
+
+    Returns:
+        {图像在批次中的位置(从0开始): 分析文本}；缺失或为空的图像不在结果中
+    """
+    sections = {}
+    matches = list(BATCH_MARKER_RE.finditer(text))
+    for n, match in enumerate(matches):
+        k = int(match.group(1)) - 1
+        end = matches[n + 1].start() if n + 1 < len(matches) else len(text)
+        body = text[match.end():end].strip()
+        if 0 <= k < count and body and k not in sections:
+            sections[k] = body
+    return sections
+
+
+def analyze_image_batch(image_paths: List[Path], indices: List[int], markdown_content: str, api_key: str,
+                        model: str, total_images: int, rate_limiter: RateLimiter = None,
+                        cache: AnalysisCache = None, context_lines: int = 10, image_options: Dict = None,
+                        dedup: Deduplicator = None, triage: bool = False,
+                        context_budget: Optional[int] = DEFAULT_CONTEXT_BUDGET,
+                        router: ModelRouter = None, verbose: bool = False) -> List[Dict]:
+    """在一个请求中分析多个相关图像（同一图注下的子图等）
+
+    批次内互相重复的图像只分析第一个，其余在批次完成后复用其结果。每个图像先单独完成上下文定位、分诊、
+    缓存和去重检查；仍需完整分析的图像合并为一次请求，要求模型按图像分段输出后拆回各自的结果。
+    请求失败或拆分不出来的图像退回单独分析。
+
+    Args:
+        image_paths: 图像路径
+        indices: 各图像的序号（从1开始）
+        其余参数同 analyze_image
 
+    Returns:
+        与 image_paths 一一对应的结果字典
+    """
+    results = [None] * len(image_paths)
+    # 批次内的重复图像不去认领：同一线程认领了第一个图像后，再认领与之重复的图像会等待自己
+    duplicates = dedup.group(image_paths) if dedup else {}
+    batch = []
+    for j, (image_path, i) in enumerate(zip(image_paths, indices)):
+        if j in duplicates:
+            continue
+        print(f"正在分析图像: {image_path.name} ({i}/{total_images})", file=sys.stderr)
+        try:
+            result, pending = prepare_analysis(image_path, markdown_content, model, i, total_images, cache=cache,
+                                               context_lines=context_lines, image_options=image_options,
+                                               dedup=dedup, triage=triage, context_budget=context_budget)
+        except Exception as e:
+            results[j] = error_result(image_path, e, i, total_images)
+            continue
+        if pending is None:
+            results[j] = result
+        else:
+            batch.append((j, result, pending))
+
+    # 只有完整分析的图像合并请求，light 图像仍单独使用简短提示词
+    single = [item for item in batch if item[2]["detail"] != "full"]
+    batch = [item for item in batch if item[2]["detail"] == "full"]
+    if len(batch) < 2:
+        single, batch = single + batch, []
+
+    if batch:
+        paths = [image_paths[j] for j, _, _ in batch]
+        contexts = []
+        for _, _, pending in batch:
+            if pending["context"] not in contexts:
+                contexts.append(pending["context"])
+        context = '\n...\n'.join(contexts)
+        prompt = build_batch_prompt(context, [p.name for p in paths])
+        call_stats = {}
+        answered = model
+        keys = [batch_cache_keys(p, prompt, model, image_options) if cache else {} for p in paths]
+        sections, cached_model = {}, None
+        for candidate in candidate_models(model) if cache else []:
+            hits = [cache.get(k[candidate]) for k in keys]
+            if all(hit is not None for hit in hits):
+                sections, cached_model = dict(enumerate(hits)), candidate
+                break
+
+        if cached_model is not None:
+            print(f"  - 命中批量缓存: {', '.join(p.name for p in paths)}", file=sys.stderr)
+            answered = cached_model
+        else:
+            print(f"  - 批量分析 {len(paths)} 个图像: {', '.join(p.name for p in paths)}", file=sys.stderr)
+            try:
+                text, answered = call_vision_model_routed(router, paths[0], context, api_key, model,
+                                                          rate_limiter=rate_limiter, stats=call_stats,
+                                                          image_options=image_options, extra_images=paths[1:],
+                                                          prompt=prompt)
+                sections = split_batch_response(text, len(paths))
+            except Exception as e:
+                print(f"  - 批量请求失败，改为逐个分析: {e}", file=sys.stderr)
+
+        completed = [k for k in range(len(batch)) if k in sections]
+        # 逐个请求时每个图像都要发送一遍的提示词，合并后只发送一次
+        tokens_saved = sum(estimate_tokens(build_analysis_prompt(batch[k][2]["context"])) for k in completed) \
+            - estimate_tokens(prompt)
+        for k, (j, result, pending) in enumerate(batch):
+            if k not in sections:
+                single.append((j, result, pending))
+                continue
+            first = k == completed[0]
+            upload = call_stats["images"][k] if call_stats.get("images") else None
+            complete_analysis(result, pending, sections[k], answered, upload, call_stats if first else None,
+                              cache_keys=keys[k])
+            if cached_model is not None:
+                result["cached"] = True
+            release_pending(pending, sections[k])
+            result["batch"] = {"size": len(completed), "position": completed.index(k),
+                               "images": [paths[c].name for c in completed]}
+            if first:
+                result["batch"]["prompt_tokens_saved_est"] = max(0, tokens_saved) if len(completed) > 1 else 0
+            results[j] = result
+        if 0 < len(completed) < len(batch):
+            print(f"  - 批量结果中缺少 {len(batch) - len(completed)} 个图像的分析，改为逐个分析", file=sys.stderr)
+
+    for j, result, pending in single:
+        try:
+            results[j] = run_prepared(image_paths[j], result, pending, api_key, model,
+                                      rate_limiter=rate_limiter, image_options=image_options, router=router,
+                                      verbose=verbose)
+        except Exception as e:
+            results[j] = error_result(image_paths[j], e, indices[j], total_images)
+
+    # 此时本线程的认领都已释放；第一个图像没有得到分析时，重复图像按正常流程单独分析
+    for j, (k, distance) in duplicates.items():
+        leader = results[k]
+        if leader.get("analysis") is None or leader.get("error") or leader.get("incomplete"):
+            results[j] = analyze_image(image_paths[j], markdown_content, api_key, model, indices[j], total_images,
+                                       rate_limiter=rate_limiter, cache=cache, context_lines=context_lines,
+                                       image_options=image_options, dedup=dedup, triage=triage,
+                                       context_budget=context_budget, router=router, verbose=verbose)
+            continue
+        print(f"正在分析图像: {image_paths[j].name} ({indices[j]}/{total_images})", file=sys.stderr)
+        try:
+            # 不传 dedup：上下文、分诊和缓存照常处理，只是不再认领
+            result, pending = prepare_analysis(image_paths[j], markdown_content, model, indices[j], total_images,
+                                               cache=cache, context_lines=context_lines,
+                                               image_options=image_options, triage=triage,
+                                               context_budget=context_budget)
+        except Exception as e:
+            results[j] = error_result(image_paths[j], e, indices[j], total_images)
+            continue
+        if pending is not None:
+            print(f"  - 重复图像（批次内，距离 {distance}）: {image_paths[j].name} -> {image_paths[k].name}",
+                  file=sys.stderr)
+            result["analysis"] = leader["analysis"]
+            result["duplicate_of"] = leader["image_path"]
+            result["dedup"] = {"match": "exact" if distance == 0 else "near", "distance": distance, "scope": "batch"}
+        results[j] = result
+    return results
+
+
+def plan_batches(images: List[Path], indices: List[int], markdown_content: str, max_images: int,
+                 max_bytes: int, image_options: Dict = None) -> List[List[int]]:
+    """把待分析图像分组：同一图注下或同一行引用的图像放在一起
+
+    每组最多 max_images 个图像，上传大小合计不超过 max_bytes（单个超限的图像单独成组）。
 
-def collect_images(images_dir: Path, markdown_content: str = None) -> List[Path]:
+    Returns:
+        分组后的图像序号列表，按组内第一个图像的顺序排列
+    """
+    if max_images <= 1:
+        return [[i] for i in indices]
+    index = get_figure_index(markdown_content)
+    groups = {}
+    for image_path, i in zip(images, indices):
+        entry = index.lookup(image_path.name)
+        if entry is None:
+            key = ('image', i)
+        elif entry.caption_line is not None:
+            key = ('caption', entry.caption_line)
+        else:
+            key = ('line', entry.line)
+        groups.setdefault(key, []).append((i, image_path))
+
+    batches = []
+    for members in groups.values():
+        current, current_bytes = [], 0
+        for i, image_path in members:
+            size = prepare_image(image_path, **(image_options or {}))["encoded_bytes"] if len(members) > 1 else 0
+            if current and (len(current) >= max_images or current_bytes + size > max_bytes):
+                batches.append(current)
+                current, current_bytes = [], 0
+            current.append(i)
+            current_bytes += size
+        batches.append(current)
+    return sorted(batches, key=lambda b: b[0])
+
+
+def collect_images(images_dir: Path, markdown_content: str = None, index: FigureIndex = None) -> List[Path]:
     """收集图像文件，从 backup 文件夹中的 md 文件按顺序找出图像文件名
     只保留在 images 目录下出现的图像
 
     Args:
         images_dir: 图像目录路径
         markdown_content: Markdown 内容（可选），用于按顺序提取图像引用
+        index: 可选，预先建立的 FigureIndex
 
     Returns:
         按顺序排列且实际存在的图像文件列表
@@ -283,26 +990,9 @@ def collect_images(images_dir: Path, markdown_content: str = None) -> List[Path]
     if not markdown_content:
         return sorted(images)
 
-    # 从 markdown 中按顺序提取图像文件名
-    import re
-    md_image_names = []
-
-    # 匹配多种格式的图像引用
-    image_patterns = [
-        r'!\[.*?\]\(([^)]+\.(?:png|jpg|jpeg|gif|bmp|tiff|webp))\)',  # markdown image syntax
-        r'<image:([^>]+)>',  # <image:filename> format
-        r'!\[image\]\(([^)]+)\)',  # ![image](filename) format
-    ]
-
-    # 按内容顺序查找所有匹配
-    for pattern in image_patterns:
-        matches = re.finditer(pattern, markdown_content, re.IGNORECASE)
-        for match in matches:
-            image_path = match.group(1)
-            # 提取文件名（去除路径）
-            filename = Path(image_path).name
-            if filename not in md_image_names:
-                md_image_names.append(filename)
+    # 从 markdown 索引中按出现顺序取图像文件名
+    index = index or get_figure_index(markdown_content)
+    md_image_names = index.ordered_images
 
     # 构建images目录的文件名映射（不区分大小写）
     images_lower_to_path = {img.name.lower(): img for img in images}
@@ -317,42 +1007,223 @@ def collect_images(images_dir: Path, markdown_content: str = None) -> List[Path]
     return ordered_images
 
 
+def find_paper_files(paper_dir: Path) -> Tuple[Optional[Path], Optional[Path]]:
+    """在论文目录中查找 markdown 文件和图像目录
+
+    Returns:
+        (markdown 路径, 图像目录)；找不到的返回 None。图像目录可能是 images/ 或嵌套的 images/images/
+    """
+    markdown_path = paper_dir / 'paper.md'
+    if not markdown_path.exists():
+        # 尝试查找任意 .md 文件
+        md_files = list(paper_dir.glob('*.md'))
+        markdown_path = md_files[0] if md_files else None
+
+    images_dir = paper_dir / 'images'
+    if not images_dir.exists():
+        return markdown_path, None
+    nested_images_dir = images_dir / 'images'
+    if nested_images_dir.exists() and nested_images_dir.is_dir():
+        images_dir = nested_images_dir
+    return markdown_path, images_dir
+
+
+def build_output_data(model: str, result_slots: List[Optional[Dict]], extra: Optional[Dict] = None) -> Dict:
+    """根据按图像顺序排列的结果（未完成的为 None）生成输出 JSON 的内容"""
+    results = [r for r in result_slots if r is not None]
+    upload_bytes = {"source": 0, "encoded": 0}
+    for r in results:
+        upload = r.get("upload")
+        if upload:
+            upload_bytes["source"] += upload["source_bytes"]
+            upload_bytes["encoded"] += upload["encoded_bytes"]
+    output_data = {
+        "model": model,
+        "model_full_name": MODEL_CONFIGS[model]["model"] if model in MODEL_CONFIGS else None,
+        "status": "done" if len(results) == len(result_slots) else "running",
+        "total_images": len(result_slots),
+        "completed_images": len(results),
+        "analyzed_images": sum(1 for r in results if "error" not in r and not r.get("skipped")),
+        "skipped_images": sum(1 for r in results if "error" not in r and r.get("skipped")),
+        "failed_images": sum(1 for r in results if "error" in r),
+        "upload_bytes": upload_bytes,
+        # 重复图像复用已有分析、以及批量合并请求省下的模型调用次数
+        "model_calls_saved": sum(1 for r in results if r.get("duplicate_of")),
+    }
+    batched = [r["batch"] for r in results if r.get("batch")]
+    if batched:
+        # 每个批次只有 position 为 0 的结果记录了 token 估算，其余图像各省下一次调用
+        calls_saved = sum(1 for b in batched if b["position"] > 0)
+        output_data["batching"] = {
+            "requests": sum(1 for b in batched if b["position"] == 0),
+            "images": len(batched),
+            "model_calls_saved": calls_saved,
+            "prompt_tokens_saved_est": sum(b.get("prompt_tokens_saved_est", 0) for b in batched)
+        }
+        output_data["model_calls_saved"] += calls_saved
+    # 实际发送给模型的图像（不含命中缓存和重复图像）的提示词大小；usage 为接口返回的实际 token 数
+    sent = [r for r in results if "prompt_tokens_est" in r and not r.get("cached") and not r.get("duplicate_of")]
+    if sent:
+        output_data["prompt_tokens"] = {
+            "images": len(sent),
+            "context_est": sum(r["context_tokens_est"] for r in sent),
+            "prompt_est": sum(r["prompt_tokens_est"] for r in sent),
+            "usage": sum((r.get("usage") or {}).get("prompt_tokens", 0) for r in results)
+        }
+    answered = [r["model"] for r in results if r.get("model")]
+    if answered:
+        # 实际回答各图像的模型（--model auto 时可能不止一个）
+        output_data["models_used"] = {m: answered.count(m) for m in dict.fromkeys(answered)}
+    triaged = [r["triage"]["decision"] for r in results if r.get("triage")]
+    if triaged:
+        output_data["triage"] = {d: triaged.count(d) for d in ("skip", "light", "full")}
+    if extra:
+        output_data.update(extra)
+    output_data["results"] = results
+    return output_data
+
+
+def load_reusable_results(paper_dir: Path, output_path: Path, markdown_content: str, model: str,
+                          context_lines: int = 10,
+                          context_budget: Optional[int] = DEFAULT_CONTEXT_BUDGET) -> Dict[str, Dict]:
+    """根据 parser.py 记录的图像同步差异，找出可以直接复用的旧分析结果
+
+    读取 paper_dir/manifest.json 中的 image_sync（新增/变化/删除的图像）。旧输出文件中的结果
+    同时满足以下条件才能复用：图像内容未变化、分析成功、由 model 对应的模型完成，
+    并且按当前 paper.md 和上下文参数重新构建的提示词与当时的提示词哈希一致
+    （上下文或提示词模板变化都会重新分析；没有记录提示词哈希的旧结果不复用）。
+
+    Args:
+        paper_dir: 论文目录
+        output_path: 之前的分析结果 JSON
+        markdown_content: 当前的 paper.md 内容
+        model: 本次使用的模型（auto 时任一模型的结果都可以复用）
+        context_lines / context_budget: 本次的上下文参数，见 find_image_context
+
+    Returns:
+        {image_path: 旧分析结果}
+    """
+    try:
+        with open(paper_dir / 'manifest.json', 'r', encoding='utf-8') as f:
+            image_sync = json.load(f).get("image_sync")
+        with open(output_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not image_sync:
+        return {}
+
+    dirty = set(image_sync.get("added", [])) | set(image_sync.get("changed", []))
+    images_root = paper_dir / 'images'
+    models = candidate_models(model)
+    index = get_figure_index(markdown_content)
+    reusable = {}
+    for result in previous.get("results", []):
+        if "analysis" not in result or "error" in result or not result.get("prompt_hash"):
+            continue
+        answered = result.get("model") or previous.get("model")
+        if answered != model and answered not in models:
+            continue
+        try:
+            rel_path = Path(result["image_path"]).relative_to(images_root).as_posix()
+        except ValueError:
+            continue
+        if rel_path in dirty:
+            continue
+        context = find_image_context(Path(result["image_path"]), markdown_content, context_lines, index=index,
+                                     context_budget=context_budget)
+        if not context:
+            continue
+        light = (result.get("triage") or {}).get("decision") == TRIAGE_LIGHT
+        if hash_text((build_light_prompt if light else build_analysis_prompt)(context)) == result["prompt_hash"]:
+            reusable[result["image_path"]] = result
+    return reusable
+
+
 def main():
     parser = argparse.ArgumentParser(description='学术论文图像分析工具')
-    parser.add_argument('--paper-dir', required=True, help='论文目录路径（包含 paper.md 和 images 文件夹）')
-    parser.add_argument('--output', required=True, help='输出 JSON 文件路径')
-    parser.add_argument('--context-lines', type=int, default=10, help='上下文提取行数（默认：10）')
-    parser.add_argument('--model', type=str, default='qwen', choices=['kimi', 'qwen'], help='使用的视觉模型（默认：qwen）')
+    parser.add_argument('--paper-dir', help='论文目录路径（包含 paper.md 和 images 文件夹）')
+    parser.add_argument('--output', help='输出 JSON 文件路径')
+    parser.add_argument('--context-lines', type=int, default=10,
+                        help='--context-budget 为 0 时，图像前后的上下文行数（默认：10）')
+    parser.add_argument('--context-budget', type=int, default=DEFAULT_CONTEXT_BUDGET,
+                        help=f'每个图像上下文的 token 预算，按图注、章节标题和引用该图的段落组装'
+                             f'（默认：{DEFAULT_CONTEXT_BUDGET}；0 表示使用 --context-lines 的固定窗口）')
+    parser.add_argument('--model', type=str, default='qwen', choices=list(MODEL_CONFIGS) + [AUTO_MODEL],
+                        help='使用的视觉模型；auto 表示每个请求发给当前最快的健康模型（默认：qwen）')
+    parser.add_argument('--hedge-percentile', type=float, default=HEDGE_PERCENTILE,
+                        help=f'使用多个模型或 API key 时，请求耗时超过同类请求该分位数仍未返回就向另一个后端'
+                             f'再发一次（默认：{HEDGE_PERCENTILE}；0 表示不对冲）')
+    parser.add_argument('--only-changed', action='store_true',
+                        help='只分析上次解析后新增或变化的图像，其余复用已有输出文件中的结果')
+    parser.add_argument('--concurrency', type=int, default=1, help='并发分析的图像数量（默认：1）')
+    parser.add_argument('--rate-limit', type=float, default=40, help='每分钟最多发起的模型请求数，收到 429 时自动降速（默认：40）')
+    parser.add_argument('--max-edge', type=int, default=2048, help='上传前将图像最长边缩放到该像素数以内（默认：2048）')
+    parser.add_argument('--image-format', default='auto', choices=['auto', 'webp', 'jpeg', 'png', 'original'],
+                        help='上传前重新编码的格式，original 表示原样上传（默认：auto，优先 WebP）')
+    parser.add_argument('--image-quality', type=int, default=85, help='WebP/JPEG 编码质量（默认：85）')
+    parser.add_argument('--image-cache-max-size', type=float, default=DEFAULT_CACHE_MAX_BYTES / (1024 * 1024),
+                        help=f'backup/image_cache 中编码结果的总大小上限（MB，LRU 淘汰，'
+                             f'默认：{DEFAULT_CACHE_MAX_BYTES // (1024 * 1024)}）')
+    parser.add_argument('--stream', action='store_true',
+                        help='使用流式响应：边生成边把部分分析写入输出文件，并记录首 token 延迟和输出速度')
+    parser.add_argument('--restart', action='store_true', help='丢弃进度日志，从头重新分析所有图像')
+    parser.add_argument('--fsync', action='store_true', help='每写入一条进度日志后 fsync，断电也不丢失已完成的结果')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        help='同一图注下的子图等相关图像最多合并多少个到一次请求中，1 表示不合并（默认：1）')
+    parser.add_argument('--batch-max-size', type=float, default=8,
+                        help='合并请求中图像上传大小的上限（MB，默认：8）')
+    parser.add_argument('--no-cache', action='store_true', help='不读取也不写入分析结果缓存')
+    parser.add_argument('--no-triage', action='store_true',
+                        help='关闭本地分诊：不跳过图标/公式/表格截图，所有图像都使用完整分析提示词')
+    parser.add_argument('--no-dedup', action='store_true', help='不做重复图像检测，每个图像都调用模型')
+    parser.add_argument('--dedup-threshold', type=int, default=DEDUP_THRESHOLD,
+                        help=f'近似重复的最大感知哈希汉明距离，0 表示只识别完全相同的图像（默认：{DEDUP_THRESHOLD}）')
+    parser.add_argument('--dedup-scope', default='library', choices=['run', 'library'],
+                        help='去重范围：run 只在本次分析的图像之间，library 还包括整个 backup 论文库（默认：library）')
+    parser.add_argument('--metrics', metavar='FILE', default=None,
+                        help='把每次模型调用的耗时、字节数、状态码、重试次数和 token 用量追加写入 JSONL 文件')
+    parser.add_argument('--metrics-summary', action='store_true', help='结束时在 stderr 输出每个端点的调用汇总表')
+    parser.add_argument('--verbose', action='store_true', help='把每个图像发送的上下文和模型返回的分析写到 stderr')
+    parser.add_argument('--cache-stats', action='store_true', help='打印分析结果缓存统计信息后退出')
+    parser.add_argument('--cache-evict', action='store_true',
+                        help='按 --cache-max-entries/--cache-max-age/--image-cache-max-size 淘汰缓存后退出')
+    parser.add_argument('--cache-max-entries', type=int, default=None, help='分析缓存最多保留的条目数（LRU 淘汰）')
+    parser.add_argument('--cache-max-age', type=float, default=None, help='删除超过该天数未使用的缓存条目')
     args = parser.parse_args()
 
+    cache_max_age = args.cache_max_age * 86400 if args.cache_max_age is not None else None
+    image_cache_max_bytes = int(args.image_cache_max_size * 1024 * 1024)
+    if args.cache_stats or args.cache_evict:
+        cache = AnalysisCache()
+        if args.cache_evict:
+            removed = cache.evict(max_entries=args.cache_max_entries, max_age=cache_max_age)
+            print(f"已淘汰 {removed} 条缓存", file=sys.stderr)
+            removed = evict_image_cache(image_cache_max_bytes, cache_max_age)
+            print(f"已淘汰 {removed} 个图像编码缓存文件", file=sys.stderr)
+        print(json.dumps(cache.stats(), ensure_ascii=False, indent=2))
+        cache.close()
+        return
+
+    if not args.paper_dir or not args.output:
+        parser.error("需要提供 --paper-dir 和 --output")
+
     paper_dir = Path(args.paper_dir)
 
     # 自动解析论文目录
-    # 1. 查找 markdown 文件 (paper.md)
-    markdown_path = paper_dir / 'paper.md'
-    if not markdown_path.exists():
-        # 尝试查找任意 .md 文件
-        md_files = list(paper_dir.glob('*.md'))
-        if not md_files:
-            print(f"错误: 在 {paper_dir} 中未找到 paper.md 文件", file=sys.stderr)
-            sys.exit(1)
-        markdown_path = md_files[0]
+    markdown_path, images_dir = find_paper_files(paper_dir)
+    if markdown_path is None:
+        print(f"错误: 在 {paper_dir} 中未找到 paper.md 文件", file=sys.stderr)
+        sys.exit(1)
 
     # 读取 markdown 内容
     with open(markdown_path, 'r', encoding='utf-8') as f:
         markdown_content = f.read()
 
-    # 2. 查找 images 目录 (可能是 images/ 或 images/images/)
-    images_dir = paper_dir / 'images'
-    if not images_dir.exists():
+    if images_dir is None:
         print(f"错误: 在 {paper_dir} 中未找到 images 目录", file=sys.stderr)
         sys.exit(1)
 
-    # 检查是否是嵌套的 images/images/ 结构
-    nested_images_dir = images_dir / 'images'
-    if nested_images_dir.exists() and nested_images_dir.is_dir():
-        images_dir = nested_images_dir
-
     # 3. 设置输出文件路径
     output_path = Path(args.output)
 
@@ -366,69 +1237,185 @@ def main():
 
     # 读取 API key
     try:
-        api_key = read_nvidia_api_key()
+        api_keys = read_nvidia_api_keys()
     except ValueError as e:
         print(f"警告: {e}", file=sys.stderr)
         print("图像分析功能将跳过，仅返回图像列表", file=sys.stderr)
-        api_key = None
+        api_keys = []
+    api_key = api_keys[0] if api_keys else None
+
+    # 复用内容未变化的图像的旧结果
+    reusable = load_reusable_results(paper_dir, output_path, markdown_content, args.model, args.context_lines,
+                                     args.context_budget) if args.only_changed else {}
+    if args.only_changed:
+        print(f"可复用已有分析结果: {len(reusable)} 个图像", file=sys.stderr)
+
+    # 回放进度日志：模型和图像列表一致时跳过已成功完成的图像
+    journal_path = journal_path_for(output_path)
+    image_keys = [str(p) for p in images]
+    resumed = {}
+    if not args.restart:
+        header, journaled = replay(journal_path)
+        if header is not None:
+            if header.get("model") == args.model and header.get("images") == image_keys:
+                resumed = {i: r for i, r in journaled.items() if "error" not in r and not r.get("incomplete")}
+                print(f"从进度日志续传: 已完成 {len(resumed)} 个图像", file=sys.stderr)
+            else:
+                print("进度日志与本次的模型或图像列表不一致，重新开始", file=sys.stderr)
+                header = None
+    else:
+        header = None
 
-    # 初始化输出文件结构
-    output_data = {
-        "model": args.model,
-        "model_full_name": "moonshotai/kimi-k2.5" if args.model == "kimi" else "qwen/qwen3.5-397b-a17b",
-        "total_images": len(images),
-        "analyzed_images": 0,
-        "skipped_images": 0,
-        "failed_images": 0,
-        "results": []
-    }
+    # 并发时结果按图像顺序放入对应位置，保证输出顺序确定
+    result_slots = [None] * len(images)
+    for i, result in resumed.items():
+        result_slots[i - 1] = result
+    progress_lock = threading.Lock()
 
-    # 创建目录并初始化输出文件
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    def save_progress():
-        """保存当前进度到JSON文件"""
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(output_data, f, ensure_ascii=False, indent=2)
-
-    # 初始保存（空的results）
-    save_progress()
-
-    # 分析所有图像 - 每分析一个就保存一次
-    for i, image_path in enumerate(images, 1):
-        print(f"[{i}/{len(images)}]", file=sys.stderr, end=' ')
-
+    journal = AnalysisJournal(journal_path, fsync=args.fsync, truncate=header is None)
+    if header is None:
+        journal.write_header(args.model, image_keys)
+
+    output_data = {}
+
+    def compact(extra=None):
+        """根据当前结果原子地生成输出 JSON（先写临时文件再 rename）"""
+        output_data.clear()
+        output_data.update(build_output_data(args.model, result_slots, extra))
+        parse_cache.write_json_atomic(output_path, output_data)
+
+    # 初始输出文件（status 为 running，只含续传的结果）
+    compact()
+
+    metrics.configure(args.metrics)
+    rate_limiter = RateLimiter(rate=args.rate_limit / 60, burst=max(1, args.concurrency))
+    router = build_router(args.model, api_keys, args.rate_limit, max(1, args.concurrency), args.hedge_percentile)
+    if router:
+        print(f"模型路由: {', '.join(b.name for b in router.backends)}", file=sys.stderr)
+    http_client.configure_pool_size(max(1, args.concurrency))
+    cache = None if args.no_cache else AnalysisCache()
+    dedup = None
+    if not args.no_dedup:
+        dedup = Deduplicator(DedupIndex() if args.dedup_scope == 'library' else None, threshold=args.dedup_threshold)
+    image_options = {"max_edge": args.max_edge, "image_format": args.image_format, "quality": args.image_quality}
+
+    def process(i, image_path):
+        """分析第 i 个图像（从1开始）"""
+        if str(image_path) in reusable:
+            analysis = dict(reusable[str(image_path)])
+            analysis["reused"] = True
+            analysis["progress"] = {"current": i, "total": len(images)}
+            print(f"[{i}/{len(images)}] 复用: {image_path.name}", file=sys.stderr)
+            return analysis
         if api_key:
-            analysis = analyze_image(image_path, markdown_content, api_key, args.model, i, len(images))
-        else:
-            analysis = {
-                "image_path": str(image_path),
-                "image_name": image_path.name,
-                "error": "NVIDIA_API_KEY 未配置",
-                "progress": {
-                    "current": i,
-                    "total": len(images)
-                }
+            return analyze_image(image_path, markdown_content, api_key, args.model, i, len(images),
+                                 rate_limiter=rate_limiter, cache=cache, context_lines=args.context_lines,
+                                 image_options=image_options, stream=args.stream,
+                                 on_partial=lambda partial: record_partial(i, partial), dedup=dedup,
+                                 triage=not args.no_triage, context_budget=args.context_budget, router=router,
+                                 verbose=args.verbose)
+        return {
+            "image_path": str(image_path),
+            "image_name": image_path.name,
+            "error": "NVIDIA_API_KEY 未配置",
+            "progress": {
+                "current": i,
+                "total": len(images)
             }
+        }
 
-        # 添加到结果列表
-        output_data["results"].append(analysis)
-
-        # 更新统计
-        if "error" not in analysis:
-            if analysis.get("skipped") == True:
-                output_data["skipped_images"] += 1
-            else:
-                output_data["analyzed_images"] += 1
+    # 每个图像各自限制写入频率，并发的流之间互不影响
+    last_partial_save: Dict[int, float] = {}
+
+    def record_partial(i, partial):
+        """流式模式下把部分分析追加到进度日志（限制写入频率，不计入完成数）"""
+        with progress_lock:
+            now = time.monotonic()
+            if now - last_partial_save.get(i, 0.0) < PARTIAL_SAVE_INTERVAL:
+                return
+            last_partial_save[i] = now
+        journal.write_partial(i, partial)
+
+    def record(i, analysis):
+        """记录结果并追加一行进度日志"""
+        with progress_lock:
+            result_slots[i - 1] = analysis
+        journal.write_result(i, analysis)
+
+    # 分析所有图像 - 每完成一个就追加一行日志
+    def worker(unit):
+        # 标签是线程级的，需要在线程池的任务内设置
+        with metrics.tags(paper_id=paper_dir.resolve().name):
+            if len(unit) == 1:
+                record(unit[0], process(unit[0], images[unit[0] - 1]))
+                return
+            for i, analysis in zip(unit, analyze_image_batch(
+                    [images[i - 1] for i in unit], unit, markdown_content, api_key, args.model, len(images),
+                    rate_limiter=rate_limiter, cache=cache, context_lines=args.context_lines,
+                    image_options=image_options, dedup=dedup, triage=not args.no_triage,
+                    context_budget=args.context_budget, router=router, verbose=args.verbose)):
+                record(i, analysis)
+
+    pending = [i for i in range(1, len(images) + 1) if i not in resumed]
+    # 复用旧结果的图像和未配置 API key 时不参与批量分组
+    batchable = [i for i in pending if str(images[i - 1]) not in reusable] if api_key and not args.stream else []
+    units = plan_batches([images[i - 1] for i in batchable], batchable, markdown_content,
+                         args.batch_size, int(args.batch_max_size * 1024 * 1024), image_options)
+    units += [[i] for i in pending if i not in batchable]
+    units.sort(key=lambda unit: unit[0])
+    if any(len(unit) > 1 for unit in units):
+        print(f"批量分析: {sum(len(u) for u in units if len(u) > 1)} 个图像合并为 "
+              f"{sum(1 for u in units if len(u) > 1)} 个请求", file=sys.stderr)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            for future in [executor.submit(worker, unit) for unit in units]:
+                future.result()
+    finally:
+        # 中断时也把已完成的结果压缩到输出文件，日志保留用于续传
+        with progress_lock:
+            compact({"connections": http_client.connection_stats(),
+                     **({"routing": router.stats()} if router else {})})
+        catalog.record_analysis(paper_dir, output_data)
+        search_index.record_analysis(paper_dir, output_data, markdown_content)
+        if output_data["status"] == "done":
+            journal.remove()
         else:
-            output_data["failed_images"] += 1
-
-        # 立即保存进度
-        save_progress()
+            journal.close()
+        if args.metrics_summary:
+            metrics.print_summary()
+        metrics.close()
+
+    if cache:
+        if args.cache_max_entries is not None or cache_max_age is not None:
+            cache.evict(max_entries=args.cache_max_entries, max_age=cache_max_age)
+        cache.close()
+    evict_image_cache(image_cache_max_bytes, cache_max_age)
+    if dedup:
+        dedup.close()
 
     print(f"\n分析完成！结果已保存到: {output_path}", file=sys.stderr)
     print(f"成功分析: {output_data['analyzed_images']}/{output_data['total_images']}", file=sys.stderr)
-    print(f"跳过图像: {output_data['skipped_images']}/{output_data['total_images']} (未找到上下文)", file=sys.stderr)
+    print(f"跳过图像: {output_data['skipped_images']}/{output_data['total_images']} (未找到上下文或分诊跳过)", file=sys.stderr)
     print(f"分析失败: {output_data['failed_images']}/{output_data['total_images']}", file=sys.stderr)
+    print(f"图像上传: 原始 {output_data['upload_bytes']['source']} 字节，"
+          f"实际上传 {output_data['upload_bytes']['encoded']} 字节", file=sys.stderr)
+    print(f"重复图像复用与批量请求: 节省 {output_data['model_calls_saved']} 次模型调用", file=sys.stderr)
+    if "batching" in output_data:
+        print(f"批量请求: {output_data['batching']['images']} 个图像合并为 {output_data['batching']['requests']} 个请求，"
+              f"约节省 {output_data['batching']['prompt_tokens_saved_est']} 个提示词 token", file=sys.stderr)
+    nim_stats = output_data["connections"].get("nim")
+    if nim_stats:
+        print(f"HTTP 连接: 新建 {nim_stats['connections']} 个，请求 {nim_stats['requests']} 次，"
+              f"复用 {nim_stats['reused']} 次", file=sys.stderr)
+    if "routing" in output_data:
+        routing = output_data["routing"]
+        for name, b in routing["backends"].items():
+            print(f"后端 {name}: 请求 {b['requests']} 次，失败 {b['errors']} 次，"
+                  f"耗时 p50 {b['latency_p50']} 秒 / p90 {b['latency_p90']} 秒，熔断 {b['circuit_opened']} 次",
+                  file=sys.stderr)
+        print(f"对冲请求: {routing['hedged']} 次（其中 {routing['hedge_wins']} 次先返回），"
+              f"故障转移: {routing['failovers']} 次", file=sys.stderr)
 
 
 if __name__ == "__main__":
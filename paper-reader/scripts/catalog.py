@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""论文库目录
+
+backup/catalog.sqlite 为每篇论文记录一行：paper_id、来源 URL、arXiv 标识、标题、
+解析时间、图像数量以及图像分析的状态和进度。parser.py 解析完成、analyze_images.py
+和 pipeline.py 写出分析结果时在同一个事务中更新对应的行，查找论文只需索引查询，
+不需要遍历 backup/ 目录。
+
+不在目录中的 URL 写法（镜像、带跟踪参数的链接等）通过 identity.sqlite 的别名找到 paper_id。
+标题查找使用 FTS5 trigram 索引（papers_title，由触发器与 papers 表同步），按子串匹配且不区分大小写，
+不需要扫描整张表；少于 3 个字符的查询无法使用 trigram 索引，退回 LIKE 扫描。
+rebuild 从 backup/ 中的 manifest.json 和 image_analysis.json 重新生成整个目录，
+用于升级前已有的备份或目录文件损坏后恢复。
+
+用法：
+    python3 catalog.py list [--status done] [--since 2026-01-01] [--limit 20]
+    python3 catalog.py find "attention is all you need"
+    python3 catalog.py find https://arxiv.org/abs/1706.03762
+    python3 catalog.py show PAPER_ID
+    python3 catalog.py rebuild
+"""
+
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import parse_cache
+import paper_identity
+from figure_index import HEADING_RE
+
+CATALOG_FILENAME = 'catalog.sqlite'
+ANALYSIS_FILENAME = 'image_analysis.json'
+
+# 图像分析状态：none 尚未分析，partial 中断（可续传），failed 完成但有图像失败，done 全部完成
+ANALYSIS_STATUSES = ('none', 'partial', 'failed', 'done')
+
+# 只在 paper.md 开头查找标题
+TITLE_SCAN_LINES = 40
+
+# trigram 索引能处理的最短查询（字符数）
+TITLE_MIN_MATCH_CHARS = 3
+
+COLUMNS = ('paper_id', 'source_url', 'source_kind', 'arxiv_id', 'arxiv_version', 'title', 'content_hash',
+           'total_size', 'images', 'parsed_at', 'analysis_status', 'analysis_model', 'analyzed_images',
+           'skipped_images', 'failed_images', 'analyzed_at', 'updated_at')
+
+
+def extract_title(markdown_content: str) -> Optional[str]:
+    """paper.md 开头的第一个标题"""
+    for line in markdown_content.split('\n', TITLE_SCAN_LINES)[:TITLE_SCAN_LINES]:
+        match = HEADING_RE.match(line.strip())
+        if match and match.group(2):
+            return match.group(2)
+    return None
+
+
+def analysis_fields(output_data: Dict) -> Dict:
+    """从 image_analysis.json 的内容得到目录中的分析状态字段"""
+    if output_data.get("status") != "done":
+        status = "partial"
+    elif output_data.get("failed_images"):
+        status = "failed"
+    else:
+        status = "done"
+    return {
+        "analysis_status": status,
+        "analysis_model": output_data.get("model"),
+        "analyzed_images": output_data.get("analyzed_images", 0),
+        "skipped_images": output_data.get("skipped_images", 0),
+        "failed_images": output_data.get("failed_images", 0),
+        "analyzed_at": time.time()
+    }
+
+
+def parse_date(text: str) -> float:
+    """YYYY-MM-DD 或 YYYY-MM-DDTHH:MM（本地时间）转换为时间戳"""
+    return datetime.fromisoformat(text).timestamp()
+
+
+class Catalog:
+    """基于 SQLite 的论文目录（线程安全）"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else parse_cache.get_backup_base_dir() / CATALOG_FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS papers (
+                paper_id TEXT PRIMARY KEY,
+                source_url TEXT,
+                source_kind TEXT,
+                arxiv_id TEXT,
+                arxiv_version TEXT,
+                title TEXT COLLATE NOCASE,
+                content_hash TEXT,
+                total_size INTEGER NOT NULL DEFAULT 0,
+                images INTEGER NOT NULL DEFAULT 0,
+                parsed_at REAL,
+                analysis_status TEXT NOT NULL DEFAULT 'none',
+                analysis_model TEXT,
+                analyzed_images INTEGER NOT NULL DEFAULT 0,
+                skipped_images INTEGER NOT NULL DEFAULT 0,
+                failed_images INTEGER NOT NULL DEFAULT 0,
+                analyzed_at REAL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        for column in ('source_url', 'arxiv_id', 'title', 'parsed_at', 'analysis_status', 'content_hash'):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_papers_{column} ON papers({column})")
+        self._create_title_index()
+        self.conn.commit()
+
+    def _create_title_index(self) -> None:
+        """标题的 trigram 全文索引；旧版本的目录首次打开时从 papers 表填充"""
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'papers_title'").fetchone()
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS papers_title "
+            "USING fts5(title, content='papers', content_rowid='rowid', tokenize='trigram')")
+        self.conn.executescript("""
+            CREATE TRIGGER IF NOT EXISTS papers_title_insert AFTER INSERT ON papers BEGIN
+                INSERT INTO papers_title (rowid, title) VALUES (new.rowid, new.title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_title_delete AFTER DELETE ON papers BEGIN
+                INSERT INTO papers_title (papers_title, rowid, title) VALUES ('delete', old.rowid, old.title);
+            END;
+            CREATE TRIGGER IF NOT EXISTS papers_title_update AFTER UPDATE OF title ON papers BEGIN
+                INSERT INTO papers_title (papers_title, rowid, title) VALUES ('delete', old.rowid, old.title);
+                INSERT INTO papers_title (rowid, title) VALUES (new.rowid, new.title);
+            END;
+        """)
+        if not exists:
+            self.conn.execute("INSERT INTO papers_title (papers_title) VALUES ('rebuild')")
+
+    def upsert(self, paper_id: str, **fields) -> None:
+        """插入或更新一篇论文的字段（未给出的字段保持不变）"""
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"未知的目录字段: {', '.join(sorted(unknown))}")
+        fields["updated_at"] = time.time()
+        names = list(fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"INSERT INTO papers (paper_id, {', '.join(names)}) VALUES (?{', ?' * len(names)}) "
+                f"ON CONFLICT(paper_id) DO UPDATE SET {', '.join(f'{n} = excluded.{n}' for n in names)}",
+                [paper_id] + [fields[n] for n in names])
+
+    def record_parse(self, paper_id: str, source_url: str, markdown_content: str, images: int) -> None:
+        """解析完成（或重新解析）后登记论文；重新解析会让之前的分析状态失效"""
+        fields = {
+            "source_url": source_url,
+            "title": extract_title(markdown_content),
+            "images": images,
+            "parsed_at": time.time(),
+            "analysis_status": "none",
+            "analyzed_images": 0,
+            "skipped_images": 0,
+            "failed_images": 0
+        }
+        arxiv = paper_identity.parse_arxiv_id(source_url) if source_url else None
+        if arxiv:
+            fields.update(source_kind="arxiv", arxiv_id=arxiv[0], arxiv_version=arxiv[1])
+        self.upsert(paper_id, **fields)
+
+    def record_source(self, paper_id: str, source: Dict) -> None:
+        """补充 parser.resolve_source 得到的来源类型和 arXiv 版本"""
+        fields = {"source_kind": source.get("kind")}
+        if source.get("arxiv_id"):
+            fields.update(arxiv_id=source["arxiv_id"], arxiv_version=source.get("version"))
+        with self.lock:
+            exists = self.conn.execute("SELECT 1 FROM papers WHERE paper_id = ?", (paper_id,)).fetchone()
+        if exists:
+            self.upsert(paper_id, **fields)
+
+    def record_analysis(self, paper_id: str, output_data: Dict) -> None:
+        """登记图像分析的结果（论文不在目录中时忽略）"""
+        fields = analysis_fields(output_data)
+        fields["updated_at"] = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE papers SET {', '.join(f'{n} = ?' for n in fields)} WHERE paper_id = ?",
+                list(fields.values()) + [paper_id])
+
+    def remove(self, paper_ids: Iterable[str]) -> int:
+        with self.lock, self.conn:
+            return self.conn.executemany(
+                "DELETE FROM papers WHERE paper_id = ?", [(p,) for p in paper_ids]).rowcount
+
+    def get(self, paper_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM papers WHERE paper_id = ?", (paper_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_url(self, source: str) -> Optional[Dict]:
+        """按来源查找：目录中的 source_url、arXiv 标识，以及 identity.sqlite 中登记的所有别名"""
+        source = source.strip()
+        arxiv = paper_identity.parse_arxiv_id(source)
+        if arxiv:
+            rows = self.query(arxiv_id=arxiv[0], limit=None)
+            if arxiv[1]:
+                rows = [r for r in rows if r["arxiv_version"] == arxiv[1]]
+            if rows:
+                # 未指定版本时返回最新的版本
+                return max(rows, key=lambda r: int((r["arxiv_version"] or 'v0')[1:]))
+        rows = self.query(source_url=source, limit=1)
+        if rows:
+            return rows[0]
+        index = paper_identity.get_index()
+        paper_id = index.lookup(source) or index.lookup(paper_identity.identity_of(source))
+        return self.get(paper_id) if paper_id else None
+
+    def query(self, source_url: Optional[str] = None, arxiv_id: Optional[str] = None,
+              title: Optional[str] = None, status: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, limit: Optional[int] = 50) -> List[Dict]:
+        """按条件查询，结果按解析时间从新到旧排列
+
+        Args:
+            source_url: 来源 URL（完全相同）
+            arxiv_id: arXiv 标识（不含版本号）
+            title: 标题中包含的文字（不区分大小写）
+            status: 图像分析状态（见 ANALYSIS_STATUSES）
+            since: 解析时间下限（时间戳）
+            until: 解析时间上限（时间戳）
+            limit: 最多返回的条数，None 表示不限
+
+        Returns:
+            目录行的列表
+        """
+        clauses, params = [], []
+        for column, value in (('source_url', source_url), ('arxiv_id', arxiv_id), ('analysis_status', status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if title and len(title) >= TITLE_MIN_MATCH_CHARS:
+            # trigram 索引中的短语查询即子串匹配
+            clauses.append("rowid IN (SELECT rowid FROM papers_title WHERE papers_title MATCH ?)")
+            params.append('"' + title.replace('"', '""') + '"')
+        elif title:
+            clauses.append("title LIKE ? ESCAPE '\\'")
+            params.append('%' + title.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if since is not None:
+            clauses.append("parsed_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("parsed_at < ?")
+            params.append(until)
+        sql = "SELECT * FROM papers"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY parsed_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(sql, params).fetchall()]
+
+    def stats(self) -> Dict:
+        with self.lock:
+            papers, size, images = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(total_size), 0), COALESCE(SUM(images), 0) FROM papers").fetchone()
+            by_status = dict(self.conn.execute(
+                "SELECT analysis_status, COUNT(*) FROM papers GROUP BY analysis_status").fetchall())
+        return {"path": str(self.path), "papers": papers, "total_size": size, "images": images,
+                "by_analysis_status": by_status}
+
+    def rebuild(self, backup_base_dir: Optional[Path] = None) -> int:
+        """扫描 backup/ 重新生成目录（唯一需要遍历文件系统的操作）
+
+        Returns:
+            登记的论文数
+        """
+        backup_base_dir = Path(backup_base_dir or parse_cache.get_backup_base_dir())
+        rows = []
+        for child in sorted(backup_base_dir.iterdir()) if backup_base_dir.is_dir() else []:
+            row = scan_paper_dir(child)
+            if row:
+                rows.append(row)
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM papers")
+            self.conn.executemany(
+                f"INSERT INTO papers ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [[row.get(c) for c in COLUMNS] for row in rows])
+        return len(rows)
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+def scan_paper_dir(paper_dir: Path) -> Optional[Dict]:
+    """从一个备份目录的文件生成目录行（没有 paper.md 的目录返回 None）"""
+    md_path = paper_dir / 'paper.md'
+    if not paper_dir.is_dir() or not md_path.is_file():
+        return None
+    with open(md_path, 'r', encoding='utf-8', errors='replace') as f:
+        head = ''.join(f.readline() for _ in range(TITLE_SCAN_LINES))
+    manifest = parse_cache.load_manifest(paper_dir) or {}
+    source_url = manifest.get("source_url")
+    files = manifest.get("files")
+    if files is not None:
+        images = sum(1 for e in files if e["path"].startswith('images/'))
+    else:
+        images = sum(1 for p in (paper_dir / 'images').rglob('*') if p.suffix.lower() in parse_cache.IMAGE_EXTENSIONS)
+    row = {
+        "paper_id": paper_dir.name,
+        "source_url": source_url,
+        "source_kind": "file" if (source_url or '').startswith('sha256:') else ("url" if source_url else None),
+        "title": extract_title(head),
+        "content_hash": manifest.get("content_hash"),
+        "total_size": manifest.get("total_size", 0),
+        "images": images,
+        "parsed_at": manifest.get("created_at", md_path.stat().st_mtime),
+        "analysis_status": "none",
+        "analyzed_images": 0,
+        "skipped_images": 0,
+        "failed_images": 0,
+        "updated_at": time.time()
+    }
+    arxiv = paper_identity.parse_arxiv_id(source_url) if source_url else None
+    if arxiv:
+        row.update(source_kind="arxiv", arxiv_id=arxiv[0], arxiv_version=arxiv[1])
+    try:
+        with open(paper_dir / ANALYSIS_FILENAME, 'r', encoding='utf-8') as f:
+            analysis = json.load(f)
+        row.update(analysis_fields(analysis))
+        row["analyzed_at"] = (paper_dir / ANALYSIS_FILENAME).stat().st_mtime
+    except (OSError, ValueError):
+        pass
+    return row
+
+
+_catalogs: Dict[Path, Catalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """当前 backup 目录的共享目录（随 PAPER_READER_BACKUP_DIR 切换）"""
+    path = parse_cache.get_backup_base_dir() / CATALOG_FILENAME
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None:
+            catalog = Catalog(path)
+            _catalogs[path] = catalog
+    return catalog
+
+
+def update(method: str, *args, **kwargs) -> None:
+    """在共享目录上调用 Catalog 的更新方法；目录出错只打印警告，不影响解析和分析本身"""
+    try:
+        getattr(get_catalog(), method)(*args, **kwargs)
+    except sqlite3.Error as e:
+        print(f"更新论文目录失败: {e}", file=sys.stderr)
+
+
+def record_analysis(paper_dir: Path, output_data: Dict) -> None:
+    """analyze_images.py / pipeline.py 写出分析结果后调用；只登记 backup/ 中的论文"""
+    paper_dir = Path(paper_dir).resolve()
+    if paper_dir.parent != parse_cache.get_backup_base_dir().resolve():
+        return
+    try:
+        catalog = get_catalog()
+        if catalog.get(paper_dir.name) is None:
+            # 目录建立之前解析的论文，先从备份文件补登
+            row = scan_paper_dir(paper_dir)
+            if row is None:
+                return
+            catalog.upsert(paper_dir.name, **{k: v for k, v in row.items() if k not in ('paper_id', 'updated_at')})
+        catalog.record_analysis(paper_dir.name, output_data)
+    except sqlite3.Error as e:
+        print(f"更新论文目录失败: {e}", file=sys.stderr)
+
+
+def format_time(ts: Optional[float]) -> str:
+    return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M') if ts else '-'
+
+
+def print_table(rows: List[Dict], file=sys.stdout) -> None:
+    header = ["paper_id", "解析时间", "分析", "图像", "来源", "标题"]
+    table = [header]
+    for row in rows:
+        source = f"arXiv:{row['arxiv_id']}{row['arxiv_version'] or ''}" if row["arxiv_id"] else (row["source_url"] or '-')
+        table.append([row["paper_id"], format_time(row["parsed_at"]), row["analysis_status"],
+                      f"{row['analyzed_images']}/{row['images']}", source[:60], (row["title"] or '-')[:60]])
+    widths = [max(len(str(r[i])) for r in table) for i in range(len(header))]
+    for n, r in enumerate(table):
+        print('  '.join(str(cell).ljust(widths[i]) for i, cell in enumerate(r)).rstrip(), file=file)
+        if n == 0:
+            print('  '.join('-' * w for w in widths), file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='论文库目录：列出、查找和重建 backup/ 中的论文')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    list_parser = sub.add_parser('list', help='按解析时间从新到旧列出论文')
+    list_parser.add_argument('--status', choices=ANALYSIS_STATUSES, help='只列出该图像分析状态的论文')
+    list_parser.add_argument('--since', help='解析时间不早于该日期（YYYY-MM-DD）')
+    list_parser.add_argument('--until', help='解析时间早于该日期（YYYY-MM-DD）')
+    list_parser.add_argument('--title', help='标题中包含的文字')
+    list_parser.add_argument('--limit', type=int, default=50, help='最多列出的条数，0 表示不限（默认：50）')
+
+    find_parser = sub.add_parser('find', help='按 paper_id、URL、arXiv 标识或标题查找论文')
+    find_parser.add_argument('query', help='paper_id、PDF URL、arXiv 标识/链接，或标题中的文字')
+    find_parser.add_argument('--limit', type=int, default=20, help='按标题查找时最多列出的条数（默认：20）')
+
+    show_parser = sub.add_parser('show', help='显示一篇论文的目录信息和别名')
+    show_parser.add_argument('paper_id')
+
+    sub.add_parser('rebuild', help='扫描 backup/ 重新生成目录')
+    sub.add_parser('stats', help='目录统计信息')
+    args = parser.parse_args()
+
+    catalog = get_catalog()
+    try:
+        if args.command == 'rebuild':
+            count = catalog.rebuild()
+            print(f"已从 {parse_cache.get_backup_base_dir()} 重建目录: {count} 篇论文", file=sys.stderr)
+            return
+        if args.command == 'stats':
+            print(json.dumps(catalog.stats(), ensure_ascii=False, indent=2))
+            return
+        if args.command == 'show':
+            row = catalog.get(args.paper_id)
+            if row is None:
+                print(f"错误: 目录中没有论文 {args.paper_id}", file=sys.stderr)
+                sys.exit(1)
+            row["paper_dir"] = str(parse_cache.get_backup_base_dir() / row["paper_id"])
+            row["aliases"] = [a["alias"] for a in paper_identity.get_index().aliases(row["paper_id"])]
+            print(json.dumps(row, ensure_ascii=False, indent=2))
+            return
+
+        if args.command == 'list':
+            try:
+                since = parse_date(args.since) if args.since else None
+                until = parse_date(args.until) if args.until else None
+            except ValueError as e:
+                parser.error(f"日期格式错误: {e}")
+            rows = catalog.query(title=args.title, status=args.status, since=since, until=until,
+                                 limit=args.limit or None)
+        else:
+            row = catalog.get(args.query) or catalog.find_by_url(args.query)
+            rows = [row] if row else catalog.query(title=args.query, limit=args.limit or None)
+            if not rows:
+                print(f"未找到论文: {args.query}", file=sys.stderr)
+                sys.exit(1)
+
+        if args.json:
+            print(json.dumps(rows, ensure_ascii=False, indent=2))
+        else:
+            print_table(rows)
+    finally:
+        catalog.close()
+
+
+if __name__ == "__main__":
+    main()
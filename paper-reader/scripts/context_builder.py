@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""按 token 预算为图像组装上下文
+
+固定的 ±N 行窗口经常带上无关的段落，却漏掉图注之后的内容以及正文其它位置
+"as shown in Figure 3" 之类的讨论。这里先收集候选片段并打分：
+    anchor    图像引用所在行（总是包含）
+    caption   图注段落
+    heading   所属章节标题
+    mention   正文中提到同一图号的段落（同一章节、距离越近得分越高）
+    nearby    图像前后紧邻的段落（找不到图号引用时的主要信息来源）
+按得分从高到低放入，重叠的行只计一次；段落放不下时只保留其中提到该图的句子。
+总 token 数（estimate_tokens 估算）不超过预算，得到满足预算的最小上下文。
+"""
+
+import re
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional
+
+from figure_index import FigureIndex, FIGURE_REF_RE, STEM_FIGURE_RE
+
+# 默认的上下文预算（token）
+DEFAULT_BUDGET = 600
+
+# 向上/向下扩展段落时最多包含的行数（MinerU 输出中一个段落通常只占一行）
+MAX_PARAGRAPH_LINES = 6
+
+# 各类片段的基础得分
+SCORES = {"anchor": 100.0, "caption": 90.0, "heading": 80.0, "mention": 50.0, "nearby": 30.0}
+# 提到该图的段落与图像在同一章节时的加分，以及按行距衰减的加分
+SAME_SECTION_BONUS = 20.0
+DISTANCE_BONUS = 10.0
+DISTANCE_SCALE = 20.0
+
+# 句末标点后断句（"Fig. 3" 中的缩写点不算句末）
+SENTENCE_SPLIT_RE = re.compile(r'(?<![Ff]ig\.)(?<=[.!?。！？；;])\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计文本的 token 数：非 ASCII 字符每字按 1 个，ASCII 字符每 4 个按 1 个"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def _format_line(line: int, text: str) -> str:
+    return f"{line + 1}. {text}"
+
+
+def _line_cost(line: int, text: str) -> int:
+    return estimate_tokens(_format_line(line, text)) + 1
+
+
+def _is_break(index: FigureIndex, line: int) -> bool:
+    """空行和标题行是段落边界"""
+    text = index.lines[line]
+    return not text.strip() or bool(index.headings and text.lstrip().startswith('#'))
+
+
+def paragraph(index: FigureIndex, line: int, max_lines: int = MAX_PARAGRAPH_LINES) -> List[int]:
+    """line 所在段落的行号（向上下扩展到空行或标题，各方向最多 max_lines 行）"""
+    start = line
+    while start > 0 and line - start < max_lines and not _is_break(index, start - 1):
+        start -= 1
+    end = line
+    while end + 1 < len(index.lines) and end - line < max_lines and not _is_break(index, end + 1):
+        end += 1
+    return list(range(start, end + 1))
+
+
+def _neighbor_paragraph(index: FigureIndex, line: int, step: int, skip: set) -> Optional[List[int]]:
+    """line 之前（step=-1）或之后（step=1）最近的正文段落，跳过空行、图像引用和 skip 中的行"""
+    i = line + step
+    while 0 <= i < len(index.lines):
+        text = index.lines[i]
+        if text.lstrip().startswith('#'):
+            return None
+        if text.strip() and i not in skip and not text.lstrip().startswith('!['):
+            return paragraph(index, i)
+        i += step
+    return None
+
+
+def _figure_number(index: FigureIndex, image_name: str) -> Optional[str]:
+    entry = index.lookup(image_name)
+    if entry is not None and entry.figure_number:
+        return entry.figure_number
+    match = STEM_FIGURE_RE.match(PurePosixPath(image_name.lower()).stem)
+    return match.group(1) if match else None
+
+
+def _mention_sentences(text: str, number: str) -> Optional[str]:
+    """段落中提到图号 number 的句子"""
+    sentences = [s for s in SENTENCE_SPLIT_RE.split(text)
+                 if any(m.group(1) == number for m in FIGURE_REF_RE.finditer(s))]
+    return ' '.join(sentences) if sentences else None
+
+
+def build_context(index: FigureIndex, image_name: str, budget: int = DEFAULT_BUDGET) -> Optional[Dict]:
+    """为图像组装不超过 budget 个 token 的上下文
+
+    Args:
+        index: paper.md 的 FigureIndex
+        image_name: 图像文件名
+        budget: token 预算（图像引用所在行即使超出预算也会保留）
+
+    Returns:
+        {"text": 带行号的上下文, "tokens": 估算的 token 数, "line": 图像所在行（从 0 开始）,
+         "snippets": [{"kind", "lines": [起始行, 结束行]（从 1 开始）, "partial"}]}；
+        在 markdown 中找不到图像时返回 None
+    """
+    anchor = index.image_line(image_name)
+    if anchor is None:
+        return None
+    entry = index.lookup(image_name)
+    number = _figure_number(index, image_name)
+    anchor_section = index.line_sections[anchor]
+
+    candidates = [("anchor", SCORES["anchor"], [anchor], None)]
+    caption_line = entry.caption_line if entry is not None else None
+    if caption_line is None and number is not None and entry is None:
+        # 按图号定位到的是图注本身
+        caption_line = index.captions.get(number)
+    caption_lines = paragraph(index, caption_line) if caption_line is not None else []
+    if caption_lines:
+        candidates.append(("caption", SCORES["caption"], caption_lines, None))
+    if anchor_section >= 0:
+        candidates.append(("heading", SCORES["heading"], [index.headings[anchor_section][0]], None))
+
+    taken = set(caption_lines) | {anchor}
+    if number is not None:
+        seen = set()
+        for line in index.figure_mentions.get(number, []):
+            if line in taken or line in seen:
+                continue
+            lines = paragraph(index, line)
+            seen.update(lines)
+            score = SCORES["mention"] + DISTANCE_BONUS / (1 + abs(line - anchor) / DISTANCE_SCALE)
+            if index.line_sections[line] == anchor_section:
+                score += SAME_SECTION_BONUS
+            candidates.append(("mention", score, lines, line))
+    for step in (-1, 1):
+        start = min(taken) if step < 0 else max(taken)
+        lines = _neighbor_paragraph(index, start, step, taken)
+        if lines:
+            candidates.append(("nearby", SCORES["nearby"] - (0 if step < 0 else 1), lines, None))
+
+    selected: Dict[int, str] = {}
+    partial = set()
+    snippets = []
+    used = 0
+    for kind, _, lines, mention_line in sorted(candidates, key=lambda c: -c[1]):
+        new = [i for i in lines if i not in selected or i in partial]
+        if not new:
+            continue
+        cost = sum(_line_cost(i, index.lines[i]) - (_line_cost(i, selected[i]) if i in partial else 0)
+                   for i in new)
+        if used + cost <= budget or kind == "anchor":
+            for i in new:
+                selected[i] = index.lines[i]
+                partial.discard(i)
+            used += cost
+            snippets.append({"kind": kind, "lines": [lines[0] + 1, lines[-1] + 1], "partial": False})
+            continue
+        # 整段放不下时只保留提到该图的句子
+        if mention_line is None or mention_line in selected:
+            continue
+        excerpt = _mention_sentences(index.lines[mention_line], number)
+        if excerpt is None:
+            continue
+        excerpt = '… ' + excerpt + ' …'
+        cost = _line_cost(mention_line, excerpt)
+        if used + cost <= budget:
+            selected[mention_line] = excerpt
+            partial.add(mention_line)
+            used += cost
+            snippets.append({"kind": kind, "lines": [mention_line + 1, mention_line + 1], "partial": True})
+
+    parts = []
+    previous = None
+    for i in sorted(selected):
+        # 中间只隔着空行的片段直接相连，否则用 ... 表示省略
+        if previous is not None and any(index.lines[k].strip() for k in range(previous + 1, i)):
+            parts.append('...')
+        parts.append(_format_line(i, selected[i]))
+        previous = i
+    text = '\n'.join(parts)
+    return {"text": text, "tokens": estimate_tokens(text), "line": anchor,
+            "snippets": sorted(snippets, key=lambda s: s["lines"][0])}
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""论文图像索引
+
+对 paper.md 只扫描一遍，建立图像文件名、"Figure N"/"Fig. N" 图注与行号区间、
+所属章节标题之间的映射。find_image_context 和 collect_images 都通过该索引查询，
+不再对每个图像重新遍历整篇 markdown。
+"""
+
+import re
+from functools import lru_cache
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional
+
+# markdown 图像语法 ![alt](path "title") 以及 MinerU 的 <image:filename>
+IMAGE_REF_RE = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)>?[^)]*\)|<image:([^>]+)>', re.IGNORECASE)
+# 正文或图注中的 "Figure 3" / "Fig. 3" / "Fig 3a"
+FIGURE_REF_RE = re.compile(r'\b(?:figure|fig\.?)\s*(\d+)', re.IGNORECASE)
+# 以 "Figure 3:" / "Fig. 3." 开头的行视为图注
+CAPTION_RE = re.compile(r'^\s*(?:\*\*)?(?:figure|fig\.?)\s*(\d+)', re.IGNORECASE)
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+# 从图像文件名中识别图号，例如 fig3.png / figure_3.jpg / 3.png
+STEM_FIGURE_RE = re.compile(r'^(?:fig(?:ure)?[\s_.-]*)?(\d+)[a-z]?$', re.IGNORECASE)
+
+# 图注距离一组连续图像中最后一个图像引用的最大行数（允许中间有空行）；
+# 同一组中更早的子图与图注的距离不受限制，整组共享该图注
+CAPTION_LOOKAHEAD = 3
+
+
+class ImageEntry:
+    """单个图像在 markdown 中的位置信息"""
+
+    __slots__ = ('name', 'line', 'caption_line', 'figure_number', 'section')
+
+    def __init__(self, name: str, line: int, section: Optional[str]):
+        self.name = name
+        self.line = line
+        self.caption_line = None
+        self.figure_number = None
+        self.section = section
+
+    @property
+    def span(self) -> tuple:
+        """图像引用到图注结束的行号区间（闭区间）"""
+        return (self.line, self.caption_line if self.caption_line is not None else self.line)
+
+
+class FigureIndex:
+    """paper.md 的图像/图注/章节索引"""
+
+    def __init__(self, markdown_content: str):
+        self.lines = markdown_content.split('\n')
+        self.images: Dict[str, ImageEntry] = {}          # 小写文件名 -> 第一次出现的图像
+        self.stems: Dict[str, ImageEntry] = {}           # 小写文件名（不含扩展名）-> 图像
+        self.ordered_images: List[str] = []              # 按出现顺序的图像文件名
+        self.captions: Dict[str, int] = {}               # 图号 -> 图注所在行
+        self.figure_mentions: Dict[str, List[int]] = {}  # 图号 -> 提到该图的所有行
+        self.headings: List[tuple] = []                  # (行号, 级别, 标题)
+        self.line_sections: List[int] = []               # 每行所属章节在 headings 中的下标，-1 表示无
+        self._build()
+
+    def _build(self):
+        current_section = -1
+        pending = []  # 等待匹配图注的图像
+
+        for i, line in enumerate(self.lines):
+            heading = HEADING_RE.match(line)
+            if heading:
+                self.headings.append((i, len(heading.group(1)), heading.group(2)))
+                current_section = len(self.headings) - 1
+                pending = []
+            self.line_sections.append(current_section)
+
+            section_title = self.headings[current_section][2] if current_section >= 0 else None
+            for match in IMAGE_REF_RE.finditer(line):
+                ref = match.group(1) or match.group(2)
+                name = PurePosixPath(ref.strip()).name
+                key = name.lower()
+                if key in self.images:
+                    continue
+                entry = ImageEntry(name, i, section_title)
+                self.images[key] = entry
+                self.stems.setdefault(PurePosixPath(key).stem, entry)
+                self.ordered_images.append(name)
+                pending.append(entry)
+
+            caption = CAPTION_RE.match(line)
+            if caption:
+                number = caption.group(1)
+                self.captions.setdefault(number, i)
+                # pending 是中间没有正文的一组连续图像（多面板子图），按最后一个图像计算距离
+                if pending and i - pending[-1].line <= CAPTION_LOOKAHEAD:
+                    for entry in pending:
+                        entry.caption_line = i
+                        entry.figure_number = number
+                pending = []
+            elif pending and line.strip() and not IMAGE_REF_RE.search(line):
+                # 图像与图注之间出现正文，说明前面的图像没有紧随的图注
+                pending = []
+
+            for match in FIGURE_REF_RE.finditer(line):
+                self.figure_mentions.setdefault(match.group(1), []).append(i)
+
+    def lookup(self, image_name: str) -> Optional[ImageEntry]:
+        """按文件名（不区分大小写）查找图像，其次按不含扩展名的文件名"""
+        key = image_name.lower()
+        entry = self.images.get(key)
+        if entry is None:
+            entry = self.stems.get(PurePosixPath(key).stem)
+        return entry
+
+    def image_line(self, image_name: str) -> Optional[int]:
+        """返回图像在 markdown 中的定位行
+
+        依次尝试：图像引用的文件名、不含扩展名的文件名、从文件名中识别出的图号对应的图注或正文引用。
+        """
+        entry = self.lookup(image_name)
+        if entry is not None:
+            return entry.line
+
+        stem_match = STEM_FIGURE_RE.match(PurePosixPath(image_name.lower()).stem)
+        if stem_match:
+            number = stem_match.group(1)
+            if number in self.captions:
+                return self.captions[number]
+            mentions = self.figure_mentions.get(number)
+            if mentions:
+                return mentions[0]
+        return None
+
+    def section_for_line(self, line: int) -> Optional[str]:
+        """返回某一行所属的章节标题"""
+        if not 0 <= line < len(self.line_sections):
+            return None
+        idx = self.line_sections[line]
+        return self.headings[idx][2] if idx >= 0 else None
+
+    def window(self, line: int, context_lines: int) -> str:
+        """返回以 line 为中心、前后各 context_lines 行的带行号文本"""
+        start = max(0, line - context_lines)
+        end = min(len(self.lines), line + context_lines + 1)
+        return '\n'.join(f"{i+1}. {text}" for i, text in enumerate(self.lines[start:end], start=start))
+
+
+@lru_cache(maxsize=8)
+def get_figure_index(markdown_content: str) -> FigureIndex:
+    """同一份 markdown 只建一次索引"""
+    return FigureIndex(markdown_content)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""共享 HTTP 会话层
+
+parser.py 和 analyze_images.py 的所有请求都通过这里的 Session 发出：
+每类端点一个带连接池的 keep-alive 会话，统一配置重试/退避策略，
+并提供连接复用计数，便于确认轮询和图像分析没有反复握手。
+"""
+
+import threading
+from typing import Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = 10
+
+# 各端点的重试策略
+#   mineru:   提交任务和轮询状态。GET 在连接错误、5xx 和 429 时重试；POST 只在连接失败时重试，避免重复提交
+#   download: 下载解析结果 ZIP，可安全重试
+#   upload:   上传本地 PDF 到预签名地址，只在连接失败时重试
+#   nim:      视觉模型调用。429 由 analyze_images.RateLimiter 处理，读超时代价太高不重试
+RETRY_POLICIES = {
+    "mineru": dict(total=5, connect=3, read=2, status=3, backoff_factor=0.5,
+                   status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset({'GET'})),
+    "download": dict(total=5, connect=3, read=3, status=3, backoff_factor=1.0,
+                     status_forcelist=(500, 502, 503, 504), allowed_methods=frozenset({'GET', 'HEAD'})),
+    "upload": dict(total=3, connect=3, read=0, status=0, backoff_factor=1.0),
+    "nim": dict(total=2, connect=2, read=0, status=0, backoff_factor=0.5),
+}
+
+_sessions: Dict[str, requests.Session] = {}
+_pool_size = DEFAULT_POOL_SIZE
+_lock = threading.Lock()
+
+
+def _build_session(endpoint: str, pool_size: int) -> requests.Session:
+    retry = Retry(raise_on_status=False, respect_retry_after_header=True, **RETRY_POLICIES[endpoint])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(endpoint: str) -> requests.Session:
+    """返回指定端点共享的会话（线程安全，首次调用时创建）
+
+    Args:
+        endpoint: RETRY_POLICIES 中的端点名称
+    """
+    if endpoint not in RETRY_POLICIES:
+        raise ValueError(f"未知的端点: {endpoint}")
+    session = _sessions.get(endpoint)
+    if session is None:
+        with _lock:
+            session = _sessions.get(endpoint)
+            if session is None:
+                session = _build_session(endpoint, _pool_size)
+                _sessions[endpoint] = session
+    return session
+
+
+def configure_pool_size(pool_size: int) -> None:
+    """设置每个主机的连接池大小，通常与并发数一致
+
+    已经创建的会话会被关闭并在下次使用时按新大小重建。
+    """
+    global _pool_size
+    pool_size = max(1, pool_size)
+    with _lock:
+        if pool_size == _pool_size:
+            return
+        _pool_size = pool_size
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def connection_stats() -> Dict[str, Dict[str, int]]:
+    """返回每个端点新建的连接数、发出的请求数和连接复用次数"""
+    stats = {}
+    with _lock:
+        for endpoint, session in _sessions.items():
+            connections = 0
+            requests_sent = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    connections += pool.num_connections
+                    requests_sent += pool.num_requests
+            stats[endpoint] = {
+                "connections": connections,
+                "requests": requests_sent,
+                "reused": max(0, requests_sent - connections)
+            }
+    return stats
+
+
+def close_all() -> None:
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""图像去重
+
+在调用视觉模型之前识别重复图像：内容完全相同（sha256）或感知哈希（dHash）的汉明距离
+不超过阈值的近似重复（同一 logo、重复裁剪的子图、v1/v2 版本中相同的图）。
+重复图像直接复用已有的分析结果，不再调用模型。
+
+去重在两个范围内进行：
+    本次运行   正在分析或已分析的图像（并发时重复图像会等待首个图像的分析完成；
+               自己还持有未释放认领的线程不等待，直接自行分析，避免互相等待形成死锁）
+    整个论文库 backup/image_index.sqlite 记录所有分析成功的图像指纹和分析结果；论文被缓存淘汰或合并删除时
+               parser.py 调用 update('remove', paper_ids) 删除其图像，不会复用已经不存在的图像的分析
+
+感知哈希依赖 Pillow（pip install pillow）；未安装时只做完全相同的去重。
+dHash 按 8 段 8 位做 LSH 分桶，汉明距离不超过 7 的近似重复一定落在同一个桶中。
+"""
+
+import sys
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import parse_cache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+INDEX_FILENAME = 'image_index.sqlite'
+
+DEFAULT_THRESHOLD = 5
+HASH_BITS = 64
+BANDS = 8
+BAND_BITS = HASH_BITS // BANDS
+
+
+def dhash(image_path: Path) -> Optional[int]:
+    """计算 64 位差异哈希；Pillow 不可用或无法解码时返回 None
+
+    纯色等几乎没有结构的图像哈希为全 0/全 1，容易误判为重复，也返回 None。
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(image_path) as img:
+            gray = img.convert('L').resize((9, 8), Image.LANCZOS)
+            pixels = list(gray.getdata())
+    except (OSError, ValueError):
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    if value in (0, (1 << HASH_BITS) - 1):
+        return None
+    return value
+
+
+def paper_id_of(image_path) -> Optional[str]:
+    """图像所属论文的 paper_id（backup/{paper_id}/ 下的图像）；不在 backup 目录中时返回 None"""
+    try:
+        parts = Path(image_path).resolve().relative_to(parse_cache.get_backup_base_dir().resolve()).parts
+    except ValueError:
+        return None
+    return parts[0] if len(parts) > 1 else None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def bands(value: int) -> List[int]:
+    """把哈希切分为 BANDS 段，用作 LSH 分桶键"""
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+class Fingerprint:
+    """图像指纹：内容哈希 + 感知哈希"""
+
+    __slots__ = ('image_path', 'image_hash', 'dhash')
+
+    def __init__(self, image_path: Path):
+        self.image_path = str(image_path)
+        self.image_hash = hashlib.sha256(Path(image_path).read_bytes()).hexdigest()
+        self.dhash = dhash(image_path)
+
+    def distance(self, image_hash: str, other_dhash: Optional[int]) -> Optional[int]:
+        """与另一图像的距离：内容相同为 0，否则为 dHash 汉明距离；无法比较时返回 None"""
+        if image_hash == self.image_hash:
+            return 0
+        if self.dhash is None or other_dhash is None:
+            return None
+        return hamming(self.dhash, other_dhash)
+
+
+class DedupIndex:
+    """论文库范围的图像指纹索引（SQLite，线程安全）"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else parse_cache.get_backup_base_dir() / INDEX_FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS figures (
+                id INTEGER PRIMARY KEY,
+                image_hash TEXT NOT NULL,
+                dhash TEXT,
+                model TEXT NOT NULL,
+                image_path TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                paper_id TEXT,
+                UNIQUE (image_hash, model)
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(figures)")]
+        if 'paper_id' not in columns:
+            # 旧版本的索引没有 paper_id 列：按图像路径补上
+            self.conn.execute("ALTER TABLE figures ADD COLUMN paper_id TEXT")
+            rows = self.conn.execute("SELECT id, image_path FROM figures").fetchall()
+            self.conn.executemany("UPDATE figures SET paper_id = ? WHERE id = ?",
+                                  [(paper_id_of(path), figure_id) for figure_id, path in rows])
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_figures_paper ON figures(paper_id)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS figure_bands (
+                band INTEGER NOT NULL,
+                value INTEGER NOT NULL,
+                figure_id INTEGER NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_figure_bands ON figure_bands(band, value)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_figure_bands_figure ON figure_bands(figure_id)")
+        self.conn.commit()
+
+    def find(self, fingerprint: Fingerprint, model: str, threshold: int) -> Optional[Dict]:
+        """查找同一模型下距离最近且不超过阈值的已分析图像"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT image_path, analysis FROM figures WHERE image_hash = ? AND model = ?",
+                (fingerprint.image_hash, model)).fetchone()
+            if row:
+                return {"image_path": row[0], "analysis": row[1], "distance": 0, "match": "exact"}
+            if fingerprint.dhash is None or threshold <= 0:
+                return None
+
+            conditions = ' OR '.join(['(b.band = ? AND b.value = ?)'] * BANDS)
+            params = [v for i, value in enumerate(bands(fingerprint.dhash)) for v in (i, value)]
+            candidates = self.conn.execute(
+                f"SELECT DISTINCT f.image_hash, f.dhash, f.image_path, f.analysis FROM figure_bands b "
+                f"JOIN figures f ON f.id = b.figure_id WHERE f.model = ? AND ({conditions})",
+                [model] + params).fetchall()
+
+        best = None
+        for image_hash, other_dhash, image_path, analysis in candidates:
+            distance = fingerprint.distance(image_hash, int(other_dhash, 16) if other_dhash else None)
+            if distance is not None and distance <= threshold and (best is None or distance < best["distance"]):
+                best = {"image_path": image_path, "analysis": analysis, "distance": distance,
+                        "match": "exact" if image_hash == fingerprint.image_hash else "near"}
+        return best
+
+    def add(self, fingerprint: Fingerprint, model: str, analysis: str) -> None:
+        dhash_hex = format(fingerprint.dhash, '016x') if fingerprint.dhash is not None else None
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO figures (image_hash, dhash, model, image_path, analysis, created_at, paper_id) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint.image_hash, dhash_hex, model, fingerprint.image_path, analysis, time.time(),
+                 paper_id_of(fingerprint.image_path)))
+            if cursor.rowcount and fingerprint.dhash is not None:
+                self.conn.executemany(
+                    "INSERT INTO figure_bands (band, value, figure_id) VALUES (?, ?, ?)",
+                    [(i, value, cursor.lastrowid) for i, value in enumerate(bands(fingerprint.dhash))])
+            self.conn.commit()
+
+    def remove(self, paper_ids: Iterable[str]) -> int:
+        """删除这些论文的图像（论文目录被淘汰或合并删除时调用）
+
+        Returns:
+            删除的图像数
+        """
+        params = [(p,) for p in paper_ids]
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM figure_bands WHERE figure_id IN (SELECT id FROM figures WHERE paper_id = ?)", params)
+            return self.conn.executemany("DELETE FROM figures WHERE paper_id = ?", params).rowcount
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+_indexes: Dict[Path, DedupIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index() -> DedupIndex:
+    """当前 backup 目录的共享索引（随 PAPER_READER_BACKUP_DIR 切换）"""
+    path = parse_cache.get_backup_base_dir() / INDEX_FILENAME
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = DedupIndex(path)
+            _indexes[path] = index
+    return index
+
+
+def update(method: str, *args, **kwargs) -> None:
+    """在共享索引上调用 DedupIndex 的更新方法；索引出错只打印警告，不影响解析本身"""
+    try:
+        getattr(get_index(), method)(*args, **kwargs)
+    except sqlite3.Error as e:
+        print(f"更新图像去重索引失败: {e}", file=sys.stderr)
+
+
+class _InFlight:
+    """本次运行中已认领的图像"""
+
+    __slots__ = ('fingerprint', 'model', 'done', 'analysis', 'owner')
+
+    def __init__(self, fingerprint: Fingerprint, model: str):
+        self.fingerprint = fingerprint
+        self.model = model
+        self.done = threading.Event()
+        self.analysis = None
+        self.owner = threading.get_ident()
+
+
+class Deduplicator:
+    """本次运行和论文库两个范围内的去重
+
+    用法：
+        fingerprint, match = dedup.claim(image_path, model)
+        if match: 复用 match["analysis"]
+        else: 调用模型，完成后 dedup.release(fingerprint, model, analysis)（失败时 analysis 为 None）
+
+    Args:
+        index: 论文库索引；为 None 时只在本次运行范围内去重
+        threshold: 近似重复的最大 dHash 汉明距离，0 表示只识别内容完全相同的图像
+    """
+
+    def __init__(self, index: Optional[DedupIndex] = None, threshold: int = DEFAULT_THRESHOLD):
+        self.index = index
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.entries: List[_InFlight] = []
+
+    def match(self, fingerprint: Fingerprint, other: Fingerprint) -> Optional[int]:
+        """两个指纹按本去重器的阈值判定为重复时返回距离，否则返回 None"""
+        if self.threshold <= 0 and other.image_hash != fingerprint.image_hash:
+            return None
+        distance = fingerprint.distance(other.image_hash, other.dhash)
+        if distance is None or distance > self.threshold:
+            return None
+        return distance
+
+    def group(self, image_paths: List[Path]) -> Dict[int, Tuple[int, int]]:
+        """找出一组图像之间的重复
+
+        Returns:
+            {重复图像的位置: (与之重复的第一个图像的位置, 距离)}；无法读取的图像不参与比较
+        """
+        leaders: List[Tuple[int, Fingerprint]] = []
+        duplicates = {}
+        for j, image_path in enumerate(image_paths):
+            try:
+                fingerprint = Fingerprint(image_path)
+            except OSError:
+                continue
+            for k, other in leaders:
+                distance = self.match(fingerprint, other)
+                if distance is not None:
+                    duplicates[j] = (k, distance)
+                    break
+            else:
+                leaders.append((j, fingerprint))
+        return duplicates
+
+    def _match_entry(self, fingerprint: Fingerprint, model: str) -> Tuple[Optional[_InFlight], Optional[int]]:
+        best, best_distance = None, None
+        for entry in self.entries:
+            if entry.model != model:
+                continue
+            distance = self.match(fingerprint, entry.fingerprint)
+            if distance is None:
+                continue
+            if best is None or distance < best_distance:
+                best, best_distance = entry, distance
+        return best, best_distance
+
+    def _holds_claim(self) -> bool:
+        """当前线程是否还有未释放的认领（调用时需持有 self.lock）"""
+        me = threading.get_ident()
+        return any(e.owner == me and not e.done.is_set() for e in self.entries)
+
+    def claim(self, image_path: Path, model: str) -> Tuple[Fingerprint, Optional[Dict]]:
+        """查找重复图像
+
+        Returns:
+            (指纹, 匹配结果)。匹配结果包含 image_path、analysis、distance、match（exact/near）、scope（run/library）；
+            没有匹配时返回 None，此时调用方负责分析该图像并调用 release。
+            若本次运行中有近似重复的图像正在由其它线程分析，会等待其完成；当前线程自己还持有未释放的认领时
+            （包括重复的正是自己认领的图像）不等待，直接认领并由调用方分析，否则两个线程可能互相等待。
+        """
+        fingerprint = Fingerprint(image_path)
+        while True:
+            with self.lock:
+                entry, distance = self._match_entry(fingerprint, model)
+                if entry is None:
+                    match = self.index.find(fingerprint, model, self.threshold) if self.index else None
+                    if match:
+                        match["scope"] = "library"
+                        return fingerprint, match
+                    self.entries.append(_InFlight(fingerprint, model))
+                    return fingerprint, None
+                if entry.done.is_set():
+                    exact = entry.fingerprint.image_hash == fingerprint.image_hash
+                    return fingerprint, {"image_path": entry.fingerprint.image_path, "analysis": entry.analysis,
+                                         "distance": distance, "match": "exact" if exact else "near", "scope": "run"}
+                if self._holds_claim():
+                    self.entries.append(_InFlight(fingerprint, model))
+                    return fingerprint, None
+            # 重复的图像正在分析，等待结果；若分析失败，该条目会被移除，循环后由本线程接手
+            entry.done.wait()
+
+    def release(self, fingerprint: Fingerprint, model: str, analysis: Optional[str]) -> None:
+        """记录认领图像的分析结果（analysis 为 None 表示失败）"""
+        with self.lock:
+            entry = next((e for e in self.entries if e.fingerprint is fingerprint and e.model == model), None)
+            if entry is None:
+                return
+            if analysis is None:
+                self.entries.remove(entry)
+            else:
+                entry.analysis = analysis
+        if analysis is not None and self.index:
+            self.index.add(fingerprint, model, analysis)
+        entry.done.set()
+
+    def close(self) -> None:
+        if self.index:
+            self.index.close()
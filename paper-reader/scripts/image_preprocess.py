@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""图像上传前的预处理
+
+识别图像的真实格式，按最长边缩放并重新编码（WebP/JPEG），再转成 base64。
+编码结果按源文件哈希缓存到 backup/image_cache/，同一图像重复分析时不再重新编码；
+缓存按最近使用时间（文件 mtime，命中时更新）做 LRU 淘汰，总大小不超过 DEFAULT_CACHE_MAX_BYTES。
+
+缩放和重新编码依赖 Pillow（pip install pillow）；未安装时按真实格式原样上传。
+"""
+
+import os
+import sys
+import time
+import base64
+import threading
+import struct
+import hashlib
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import parse_cache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+CACHE_DIRNAME = 'image_cache'
+# 编码缓存的默认总大小上限
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+DEFAULT_MAX_EDGE = 2048
+DEFAULT_QUALITY = 85
+DEFAULT_FORMAT = 'auto'
+
+MIME_TYPES = {
+    'png': 'image/png',
+    'jpeg': 'image/jpeg',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'bmp': 'image/bmp',
+    'tiff': 'image/tiff',
+}
+
+
+def get_cache_dir() -> Path:
+    return parse_cache.get_backup_base_dir() / CACHE_DIRNAME
+
+
+def sniff_image_info(data: bytes) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+    """只解析文件头，返回 (格式, 宽, 高)；无法识别的部分返回 None"""
+    if data.startswith(b'\x89PNG\r\n\x1a\n') and len(data) >= 24:
+        width, height = struct.unpack('>II', data[16:24])
+        return 'png', width, height
+
+    if data.startswith(b'\xff\xd8'):
+        pos = 2
+        while pos + 9 < len(data):
+            if data[pos] != 0xFF:
+                pos += 1
+                continue
+            marker = data[pos + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                pos += 2
+                continue
+            length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+            # SOF0-SOF15（不含 DHT/JPG/DAC）中记录了图像尺寸
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+                return 'jpeg', width, height
+            pos += 2 + length
+        return 'jpeg', None, None
+
+    if data[:6] in (b'GIF87a', b'GIF89a') and len(data) >= 10:
+        width, height = struct.unpack('<HH', data[6:10])
+        return 'gif', width, height
+
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP' and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b'VP8 ':
+            width, height = struct.unpack('<HH', data[26:30])
+            return 'webp', width & 0x3FFF, height & 0x3FFF
+        if chunk == b'VP8L':
+            bits = struct.unpack('<I', data[21:25])[0]
+            return 'webp', (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b'VP8X':
+            width = int.from_bytes(data[24:27], 'little') + 1
+            height = int.from_bytes(data[27:30], 'little') + 1
+            return 'webp', width, height
+        return 'webp', None, None
+
+    if data.startswith(b'BM') and len(data) >= 26:
+        width, height = struct.unpack('<ii', data[18:26])
+        return 'bmp', width, abs(height)
+
+    if data[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff', None, None
+
+    return None, None, None
+
+
+def _choose_format(image_format: str) -> str:
+    """auto 时优先 WebP（Pillow 需支持 WebP 编码），否则使用 JPEG"""
+    if image_format != 'auto':
+        return image_format
+    try:
+        from PIL import features
+        if features.check('webp'):
+            return 'webp'
+    except ImportError:
+        pass
+    return 'jpeg'
+
+
+def _encode(data: bytes, max_edge: int, image_format: str, quality: int) -> Tuple[bytes, str]:
+    """缩放并重新编码，返回 (编码后的字节, 格式)"""
+    with Image.open(BytesIO(data)) as img:
+        img.load()
+        if max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if image_format == 'jpeg':
+            if img.mode in ('RGBA', 'LA', 'P'):
+                # JPEG 不支持透明通道，铺在白色背景上
+                rgba = img.convert('RGBA')
+                background = Image.new('RGB', rgba.size, (255, 255, 255))
+                background.paste(rgba, mask=rgba.split()[-1])
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.mode or img.mode == 'P' else 'RGB')
+
+        out = BytesIO()
+        save_kwargs = {'quality': quality}
+        if image_format == 'jpeg':
+            save_kwargs['optimize'] = True
+        elif image_format == 'png':
+            save_kwargs = {'optimize': True}
+        img.save(out, format=image_format.upper(), **save_kwargs)
+        return out.getvalue(), image_format
+
+
+def prepare_image(image_path: Path, max_edge: int = DEFAULT_MAX_EDGE, image_format: str = DEFAULT_FORMAT,
+                  quality: int = DEFAULT_QUALITY, cache_dir: Optional[Path] = None) -> Dict:
+    """读取图像并生成上传用的 data URL 内容
+
+    Args:
+        image_path: 图像文件路径
+        max_edge: 最长边像素上限
+        image_format: 重新编码的格式：auto / webp / jpeg / png / original（不重新编码）
+        quality: WebP/JPEG 编码质量
+        cache_dir: 编码结果缓存目录，默认 backup/image_cache
+
+    Returns:
+        dict: mime、base64、source_bytes、encoded_bytes、width/height（源图）、cached
+    """
+    data = Path(image_path).read_bytes()
+    source_format, width, height = sniff_image_info(data)
+    info = {
+        "source_format": source_format,
+        "width": width,
+        "height": height,
+        "source_bytes": len(data),
+        "cached": False
+    }
+
+    if Image is None or image_format == 'original':
+        info.update({
+            "mime": MIME_TYPES.get(source_format, 'image/png'),
+            "base64": base64.b64encode(data).decode('utf-8'),
+            "encoded_bytes": len(data)
+        })
+        return info
+
+    target_format = _choose_format(image_format)
+    source_hash = hashlib.sha256(data).hexdigest()
+    cache_dir = Path(cache_dir) if cache_dir else get_cache_dir()
+    cache_path = cache_dir / source_hash[:2] / f"{source_hash}_{max_edge}_{quality}.{target_format}"
+
+    if cache_path.is_file():
+        encoded = cache_path.read_bytes()
+        info["cached"] = True
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+    else:
+        try:
+            encoded, target_format = _encode(data, max_edge, target_format, quality)
+        except (OSError, ValueError) as e:
+            print(f"  - 图像重新编码失败，按原格式上传: {Path(image_path).name} ({e})", file=sys.stderr)
+            encoded, target_format = data, source_format
+
+        # 没有缩放且重新编码后反而更大时，直接使用原图
+        fits = width is not None and height is not None and max(width, height) <= max_edge
+        if len(encoded) >= len(data) and fits and source_format in MIME_TYPES:
+            encoded, target_format = data, source_format
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(encoded)
+        tmp_path.replace(cache_path)
+
+    # 缓存文件可能是回退保存的原图，以实际内容为准确定 MIME
+    target_format = sniff_image_info(encoded)[0] or target_format
+
+    info.update({
+        "mime": MIME_TYPES.get(target_format, 'image/png'),
+        "base64": base64.b64encode(encoded).decode('utf-8'),
+        "encoded_bytes": len(encoded)
+    })
+    return info
+
+
+def evict_cache(max_bytes: Optional[int] = DEFAULT_CACHE_MAX_BYTES, max_age: Optional[float] = None,
+                cache_dir: Optional[Path] = None) -> int:
+    """淘汰编码缓存
+
+    Args:
+        max_bytes: 允许的总大小（字节），超出部分从最久未使用的开始删除；为 None 时不按大小淘汰
+        max_age: 超过该时长（秒）未使用的文件会被删除
+        cache_dir: 编码结果缓存目录，默认 backup/image_cache
+
+    Returns:
+        删除的文件数
+    """
+    cache_dir = Path(cache_dir) if cache_dir else get_cache_dir()
+    if not cache_dir.is_dir():
+        return 0
+
+    entries: List[Tuple[float, int, Path]] = []
+    for path in cache_dir.glob('*/*'):
+        if path.name.startswith('.'):
+            continue
+        try:
+            st = path.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+
+    entries.sort(key=lambda e: e[0])
+    now = time.time()
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        expired = max_age is not None and now - mtime > max_age
+        over_budget = max_bytes is not None and total > max_bytes
+        if not (expired or over_budget):
+            continue
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""图像分析前的本地分诊
+
+只用 CPU 做廉价检查，决定每个图像是否值得调用视觉模型：
+    skip   不调用模型：图标/小装饰图、几乎空白的图、markdown 中已有对应 LaTeX 的公式截图、
+           markdown 中已有对应表格的表格截图
+    light  使用简短提示词并关闭思考：尺寸较小或内容简单的图
+    full   完整分析
+
+依据图像尺寸（只解析文件头）、灰度熵、色彩统计（需要 Pillow，未安装时跳过这些检查），
+以及图像所在位置附近的 markdown 是否已经包含表格或 LaTeX 公式。
+"""
+
+import math
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+from figure_index import FigureIndex
+from image_preprocess import sniff_image_info
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+SKIP = 'skip'
+LIGHT = 'light'
+FULL = 'full'
+
+# 短边小于该像素数或面积小于 ICON_MAX_AREA 视为图标
+ICON_MIN_EDGE = 32
+ICON_MAX_AREA = 64 * 64
+# 灰度熵（比特）低于该值视为几乎空白
+BLANK_MAX_ENTROPY = 0.05
+# 长边小于该像素数的图使用简短提示词
+LIGHT_MAX_EDGE = 320
+# 内容简单（熵低于该值的黑白图）的图使用简短提示词
+LIGHT_MAX_ENTROPY = 2.0
+# 宽高比不小于该值且高度不超过 EQUATION_MAX_HEIGHT 的图形状像公式
+EQUATION_MIN_ASPECT = 3.0
+EQUATION_MAX_HEIGHT = 200
+# 检查图像引用前后多少行的 markdown
+NEARBY_LINES = 3
+
+TABLE_LINE_RE = re.compile(r'^\s*\|.*\|\s*$|<table\b', re.IGNORECASE)
+LATEX_RE = re.compile(r'\$\$|\\begin\{(?:equation|align|gather|multline)|\\\[')
+TABLE_CAPTION_RE = re.compile(r'^\s*(?:\*\*)?(?:table|tab\.)\s*\d+', re.IGNORECASE)
+
+
+def image_statistics(image_path: Path) -> Optional[Dict]:
+    """在 128x128 缩略图上计算灰度熵、色彩丰富度和白色像素占比；Pillow 不可用时返回 None"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(image_path) as img:
+            img.draft('RGB', (256, 256))
+            rgb = img.convert('RGB')
+            rgb.thumbnail((128, 128))
+    except (OSError, ValueError):
+        return None
+
+    histogram = rgb.convert('L').histogram()
+    total = sum(histogram)
+    entropy = max(0.0, -sum((c / total) * math.log2(c / total) for c in histogram if c))
+
+    pixels = list(rgb.getdata())
+    # Hasler-Süsstrunk 色彩丰富度
+    rg = [r - g for r, g, _ in pixels]
+    yb = [(r + g) / 2 - b for r, g, b in pixels]
+    mean_rg, mean_yb = sum(rg) / total, sum(yb) / total
+    std_rg = math.sqrt(sum((v - mean_rg) ** 2 for v in rg) / total)
+    std_yb = math.sqrt(sum((v - mean_yb) ** 2 for v in yb) / total)
+    colorfulness = math.sqrt(std_rg ** 2 + std_yb ** 2) + 0.3 * math.sqrt(mean_rg ** 2 + mean_yb ** 2)
+    white_ratio = sum(1 for r, g, b in pixels if min(r, g, b) >= 235) / total
+
+    return {
+        "entropy": round(entropy, 3),
+        "colorfulness": round(colorfulness, 2),
+        "white_ratio": round(white_ratio, 3)
+    }
+
+
+def nearby_markdown(index: FigureIndex, image_name: str) -> Dict:
+    """检查图像引用附近的 markdown 是否已有表格、LaTeX 公式或表格标题"""
+    line = index.image_line(image_name)
+    if line is None:
+        return {"table_nearby": False, "latex_nearby": False, "table_caption": False}
+    start = max(0, line - NEARBY_LINES)
+    end = min(len(index.lines), line + NEARBY_LINES + 1)
+    nearby = [index.lines[i] for i in range(start, end) if i != line]
+    return {
+        "table_nearby": any(TABLE_LINE_RE.search(text) for text in nearby),
+        "latex_nearby": any(LATEX_RE.search(text) for text in nearby),
+        "table_caption": any(TABLE_CAPTION_RE.match(text) for text in nearby)
+    }
+
+
+def triage_image(image_path: Path, index: FigureIndex) -> Dict:
+    """对单个图像分诊
+
+    Args:
+        image_path: 图像文件路径
+        index: paper.md 的 FigureIndex
+
+    Returns:
+        dict: decision（skip/light/full）、reason 和用于判断的 features
+    """
+    with open(image_path, 'rb') as f:
+        header = f.read(64 * 1024)
+    _, width, height = sniff_image_info(header)
+    stats = image_statistics(image_path)
+    if stats is not None and (width is None or height is None):
+        with Image.open(image_path) as img:
+            width, height = img.size
+
+    features = {"width": width, "height": height, **(stats or {}), **nearby_markdown(index, image_path.name)}
+
+    def decide(decision, reason):
+        return {"decision": decision, "reason": reason, "features": features}
+
+    entropy = stats["entropy"] if stats else None
+    # 色彩少、以白底为主的图（公式、表格截图通常如此）
+    text_like = stats is not None and stats["colorfulness"] < 10 and stats["white_ratio"] > 0.5
+
+    if width is not None and height is not None:
+        if min(width, height) < ICON_MIN_EDGE or width * height < ICON_MAX_AREA:
+            return decide(SKIP, "图标或装饰性小图")
+    if entropy is not None and entropy < BLANK_MAX_ENTROPY:
+        return decide(SKIP, "几乎空白的图像")
+    if width is not None and height is not None and features["latex_nearby"]:
+        if width / max(height, 1) >= EQUATION_MIN_ASPECT and height <= EQUATION_MAX_HEIGHT:
+            return decide(SKIP, "公式截图，markdown 中已有对应的 LaTeX")
+    if features["table_nearby"] and features["table_caption"] and (text_like or stats is None):
+        return decide(SKIP, "表格截图，markdown 中已有对应的表格")
+
+    if width is not None and height is not None and max(width, height) < LIGHT_MAX_EDGE:
+        return decide(LIGHT, "尺寸较小")
+    if text_like and entropy is not None and entropy < LIGHT_MAX_ENTROPY:
+        return decide(LIGHT, "内容简单的黑白图")
+    return decide(FULL, "完整分析")
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""外部 API 调用的耗时与 token 统计
+
+每次调用 MinerU 或 NVIDIA NIM 都记录一个 span：端点、耗时、上传/下载字节数、HTTP 状态码、
+重试次数和模型返回的 token 用量。span 总是在内存中按论文汇总（用于打印汇总表），
+调用 configure(path) 后还会逐条追加写入 JSONL 文件。
+
+论文 ID 等标签通过 tags() 设置在当前线程上，线程池中的任务需要在任务内部重新设置。
+"""
+
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_local = threading.local()
+_lock = threading.Lock()
+_sink = None
+_summary: Dict[tuple, Dict] = {}
+
+# 汇总表中用于区分论文的标签，按顺序取第一个存在的
+GROUP_TAGS = ('paper_id', 'pdf_url')
+
+
+def configure(path: Optional[str]) -> None:
+    """设置 span 的 JSONL 输出文件（追加写入），None 表示只在内存中汇总"""
+    global _sink
+    with _lock:
+        if _sink is not None:
+            _sink.close()
+        _sink = open(path, 'a', encoding='utf-8') if path else None
+
+
+def close() -> None:
+    configure(None)
+
+
+def current_tags() -> Dict:
+    return dict(getattr(_local, 'tags', {}))
+
+
+@contextmanager
+def tags(**values):
+    """在当前线程上附加标签（例如 paper_id），退出时恢复"""
+    previous = getattr(_local, 'tags', {})
+    _local.tags = {**previous, **{k: v for k, v in values.items() if v is not None}}
+    try:
+        yield
+    finally:
+        _local.tags = previous
+
+
+def normalize_usage(usage: Optional[Dict]) -> Optional[Dict]:
+    """从 chat completions 的 usage 中取出提示词、输出和思考 token 数"""
+    if not usage:
+        return None
+    details = usage.get('completion_tokens_details') or {}
+    return {
+        "prompt_tokens": usage.get('prompt_tokens'),
+        "completion_tokens": usage.get('completion_tokens'),
+        "reasoning_tokens": details.get('reasoning_tokens', usage.get('reasoning_tokens')),
+        "total_tokens": usage.get('total_tokens')
+    }
+
+
+class Span:
+    """一次外部调用的记录，用作上下文管理器
+
+    with metrics.span('nim.chat', bytes_up=n) as s:
+        response = session.post(...)
+        s.response(response)
+        s.set(usage=...)
+    """
+
+    def __init__(self, endpoint: str, **fields):
+        self.record = {"endpoint": endpoint, "status": None, "retries": 0, "bytes_up": 0, "bytes_down": 0}
+        self.record.update(fields)
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def set(self, **fields) -> None:
+        self.record.update(fields)
+
+    def retry(self) -> None:
+        """记录一次应用层重试（例如收到 429 后重新发送）"""
+        self.record["retries"] += 1
+
+    def response(self, response, body_bytes: Optional[int] = None) -> None:
+        """记录 HTTP 状态码、连接层重试次数和下载字节数（未给出时取 Content-Length）"""
+        self.record["status"] = response.status_code
+        retries = getattr(getattr(response, 'raw', None), 'retries', None)
+        if retries is not None and getattr(retries, 'history', None):
+            self.record["retries"] += len(retries.history)
+        if body_bytes is None:
+            try:
+                body_bytes = int(response.headers.get('Content-Length', 0))
+            except (TypeError, ValueError):
+                body_bytes = 0
+        self.record["bytes_down"] += body_bytes
+
+    def __exit__(self, exc_type, exc, tb):
+        self.record["latency"] = round(time.monotonic() - self.start, 4)
+        if exc is not None:
+            self.record["error"] = f"{exc_type.__name__}: {exc}"
+            status = getattr(getattr(exc, 'response', None), 'status_code', None)
+            if status is not None:
+                self.record["status"] = status
+        if "usage" in self.record:
+            self.record["usage"] = normalize_usage(self.record["usage"])
+        emit(self.record)
+        return False
+
+
+def span(endpoint: str, **fields) -> Span:
+    return Span(endpoint, **fields)
+
+
+def emit(record: Dict) -> None:
+    """写入一条 span 并计入汇总"""
+    record = {"ts": round(time.time(), 3), **current_tags(), **record}
+    group = next((record[t] for t in GROUP_TAGS if record.get(t)), '-')
+    usage = record.get("usage") or {}
+    with _lock:
+        entry = _summary.setdefault((group, record["endpoint"]), {
+            "calls": 0, "errors": 0, "retries": 0, "latency": 0.0, "max_latency": 0.0,
+            "bytes_up": 0, "bytes_down": 0, "prompt_tokens": 0, "completion_tokens": 0, "reasoning_tokens": 0
+        })
+        entry["calls"] += 1
+        entry["errors"] += 1 if record.get("error") or (record.get("status") or 0) >= 400 else 0
+        entry["retries"] += record.get("retries") or 0
+        entry["latency"] += record["latency"]
+        entry["max_latency"] = max(entry["max_latency"], record["latency"])
+        entry["bytes_up"] += record.get("bytes_up") or 0
+        entry["bytes_down"] += record.get("bytes_down") or 0
+        for key in ("prompt_tokens", "completion_tokens", "reasoning_tokens"):
+            entry[key] += usage.get(key) or 0
+        if _sink is not None:
+            _sink.write(json.dumps(record, ensure_ascii=False) + '\n')
+            _sink.flush()
+
+
+def reset() -> None:
+    """清空内存中的汇总（不影响已写入 JSONL 的记录）"""
+    with _lock:
+        _summary.clear()
+
+
+def summary() -> List[Dict]:
+    """按 (论文, 端点) 汇总的统计"""
+    with _lock:
+        return [{"paper": group, "endpoint": endpoint, **dict(entry)}
+                for (group, endpoint), entry in sorted(_summary.items())]
+
+
+def print_summary(file=sys.stderr) -> None:
+    """打印每篇论文、每个端点的调用汇总表"""
+    rows = summary()
+    if not rows:
+        return
+    header = ["论文", "端点", "调用", "失败", "重试", "总耗时(s)", "平均(s)", "最长(s)",
+              "上传(KB)", "下载(KB)", "提示词", "输出", "思考"]
+    table = [header]
+    for row in rows:
+        table.append([
+            str(row["paper"])[:40], row["endpoint"], row["calls"], row["errors"], row["retries"],
+            f"{row['latency']:.2f}", f"{row['latency'] / row['calls']:.2f}", f"{row['max_latency']:.2f}",
+            f"{row['bytes_up'] / 1024:.1f}", f"{row['bytes_down'] / 1024:.1f}",
+            row["prompt_tokens"], row["completion_tokens"], row["reasoning_tokens"]
+        ])
+    table = [[str(cell) for cell in r] for r in table]
+    widths = [max(len(r[i]) for r in table) for i in range(len(header))]
+    for n, r in enumerate(table):
+        print('  '.join(cell.ljust(widths[i]) for i, cell in enumerate(r)), file=file)
+        if n == 0:
+            print('  '.join('-' * w for w in widths), file=file)
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""在多个模型和 API key 之间分配图像分析请求
+
+每个（模型, API key）组合是一个后端。路由器为每个后端记录最近的请求耗时和成败：
+    - 选择后端：在健康的后端中选预计耗时（最近成功请求耗时的中位数 × 在途请求数）最小的，
+      错误率越高预计耗时越长；还没有样本的后端按所有后端的中位数估计
+    - 熔断：连续失败 FAILURE_THRESHOLD 次或最近的错误率达到 ERROR_RATE_THRESHOLD 时，
+      在 COOLDOWN 秒内不再选择该后端；之后放行请求试探，再失败立即重新熔断
+    - 对冲：请求耗时超过同类请求最近耗时的 hedge_percentile 分位数仍未返回时，
+      向另一个后端再发一次同样的请求，先成功返回的结果生效（落后的请求在后台跑完，只计入统计）
+    - 故障转移：请求失败时换一个还没试过的后端重试，直到所有后端都试过
+
+只有后端本身的故障（连接错误、超时、5xx 和 429，见 is_backend_error）计入错误率和熔断并触发故障转移；
+其它异常（例如本地图像无法解码、4xx 请求错误）换一个后端也不会成功，直接抛给调用方。
+请求在守护线程中执行，超时挂起的请求不会阻止进程退出。
+"""
+
+import math
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from statistics import median
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+# 每个后端保留的最近请求数
+WINDOW = 50
+# 开始按分位数对冲、按错误率熔断所需的最少样本数
+MIN_SAMPLES = 5
+# 默认在同类请求耗时的 90 分位数处对冲
+HEDGE_PERCENTILE = 90
+# 连续失败多少次后熔断
+FAILURE_THRESHOLD = 3
+# 最近请求的错误率达到该值时熔断
+ERROR_RATE_THRESHOLD = 0.5
+# 熔断持续时间（秒）
+COOLDOWN = 60.0
+
+
+def is_backend_error(error: BaseException) -> bool:
+    """异常（或引起它的异常）是否是后端的故障：连接错误、超时、流中断、HTTP 5xx 或 429"""
+    while error is not None:
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              requests.exceptions.ChunkedEncodingError)):
+            return True
+        if isinstance(error, requests.exceptions.HTTPError):
+            status = error.response.status_code if error.response is not None else None
+            return status is None or status >= 500 or status == 429
+        error = error.__cause__
+    return False
+
+
+def percentile(values: List[float], p: float) -> float:
+    """最近秩法的 p 分位数"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+class Backend:
+    """一个（模型, API key）组合及其最近的请求统计"""
+
+    def __init__(self, name: str, model: str, api_key: str, rate_limiter=None):
+        self.name = name
+        self.model = model
+        self.api_key = api_key
+        self.rate_limiter = rate_limiter
+        # {请求类别: 最近成功请求的耗时}；完整分析、简短描述和批量请求的耗时相差很大，分开统计
+        self.latencies: Dict[str, deque] = {}
+        self.outcomes = deque(maxlen=WINDOW)
+        self.inflight = 0
+        self.failures = 0
+        self.open_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.opened = 0
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def samples(self, label: Optional[str] = None) -> List[float]:
+        if label is not None:
+            return list(self.latencies.get(label, ()))
+        return [x for window in self.latencies.values() for x in window]
+
+
+class ModelRouter:
+    """按延迟和错误率在多个后端之间分配请求（线程安全）"""
+
+    def __init__(self, backends: Iterable[Backend], hedge_percentile: float = HEDGE_PERCENTILE,
+                 failure_threshold: int = FAILURE_THRESHOLD, cooldown: float = COOLDOWN,
+                 is_backend_error: Callable[[BaseException], bool] = is_backend_error):
+        """
+        Args:
+            backends: 可用的后端
+            hedge_percentile: 对冲阈值（同类请求耗时的分位数），0 表示不对冲
+            failure_threshold: 连续失败多少次后熔断
+            cooldown: 熔断持续时间（秒）
+            is_backend_error: 判断异常是否属于后端故障；其它异常不计入统计，直接抛给调用方
+        """
+        self.backends = list(backends)
+        if not self.backends:
+            raise ValueError("至少需要一个后端")
+        self.hedge_percentile = hedge_percentile
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.is_backend_error = is_backend_error
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_keys(cls, models: List[str], api_keys: List[str], make_rate_limiter: Callable = None,
+                  **kwargs) -> 'ModelRouter':
+        """为每个模型和每个 API key 的组合建立后端
+
+        Args:
+            models: 模型名（analyze_images.MODEL_CONFIGS 的键）
+            api_keys: API key；限流按 key 计算，同一个 key 的所有模型共享一个限速器
+            make_rate_limiter: 可选，无参数的工厂函数，为每个 key 创建限速器
+            其余参数见 ModelRouter
+        """
+        limiters = [make_rate_limiter() if make_rate_limiter else None for _ in api_keys]
+        backends = [Backend(f"{model}/key{k + 1}", model, key, limiters[k])
+                    for model in models for k, key in enumerate(api_keys)]
+        return cls(backends, **kwargs)
+
+    # ---- 选择后端 ----
+
+    def _expected_latency(self, backend: Backend, label: str, fallback: float) -> float:
+        samples = backend.samples(label) or backend.samples()
+        latency = median(samples) if samples else fallback
+        return latency * (1 + backend.inflight) / max(0.1, 1 - backend.error_rate())
+
+    def _choose(self, label: str, exclude: Iterable[Backend] = ()) -> Optional[Backend]:
+        """调用时需持有 self.lock"""
+        candidates = [b for b in self.backends if b not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [b for b in candidates if b.open_until <= now]
+        if not healthy:
+            # 全部熔断时试探最先恢复的后端
+            healthy = [min(candidates, key=lambda b: b.open_until)]
+        known = [x for b in self.backends for x in b.samples(label)]
+        fallback = median(known) if known else 1.0
+        backend = min(healthy, key=lambda b: self._expected_latency(b, label, fallback))
+        backend.inflight += 1
+        backend.requests += 1
+        return backend
+
+    def hedge_delay(self, label: str) -> Optional[float]:
+        """同类请求开始对冲前等待的秒数；样本不足或不对冲时返回 None"""
+        if not self.hedge_percentile:
+            return None
+        with self.lock:
+            samples = [x for b in self.backends for x in b.samples(label)]
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return percentile(samples, self.hedge_percentile)
+
+    def record(self, backend: Backend, label: str, latency: float, ok: bool) -> None:
+        """记录一次请求的结果，必要时熔断"""
+        with self.lock:
+            backend.inflight -= 1
+            backend.outcomes.append(ok)
+            if ok:
+                backend.failures = 0
+                backend.latencies.setdefault(label, deque(maxlen=WINDOW)).append(latency)
+                return
+            backend.errors += 1
+            backend.failures += 1
+            if backend.failures >= self.failure_threshold or \
+                    (len(backend.outcomes) >= MIN_SAMPLES and backend.error_rate() >= ERROR_RATE_THRESHOLD):
+                backend.open_until = time.monotonic() + self.cooldown
+                backend.opened += 1
+
+    def release(self, backend: Backend) -> None:
+        """请求因与后端无关的原因失败：只结束在途计数，不计入统计"""
+        with self.lock:
+            backend.inflight -= 1
+
+    # ---- 发起请求 ----
+
+    def _launch(self, fn: Callable, label: str, exclude: List[Backend], futures: Dict) -> bool:
+        with self.lock:
+            backend = self._choose(label, exclude)
+        if backend is None:
+            return False
+        future = Future()
+
+        def run():
+            start = time.monotonic()
+            try:
+                value = fn(backend)
+            except BaseException as e:
+                if self.is_backend_error(e):
+                    self.record(backend, label, time.monotonic() - start, False)
+                else:
+                    self.release(backend)
+                future.set_exception(e)
+            else:
+                self.record(backend, label, time.monotonic() - start, True)
+                future.set_result(value)
+
+        exclude.append(backend)
+        futures[future] = backend
+        threading.Thread(target=run, name=f"router-{backend.name}", daemon=True).start()
+        return True
+
+    def call(self, fn: Callable[[Backend], object], label: str = "default",
+             hedge: bool = True) -> Tuple[object, Backend, Dict]:
+        """把请求发给当前最合适的后端
+
+        Args:
+            fn: 以 Backend 为参数发起请求的函数，返回请求结果；对冲时可能在两个线程中同时执行
+            label: 请求类别，耗时统计和对冲阈值按类别分开计算
+            hedge: 是否允许对冲（流式请求等不能重复发送的请求应设为 False）
+
+        Returns:
+            (结果, 返回结果的后端, {"attempts": 发出的请求数, "hedged": 是否对冲过})
+
+        Raises:
+            所有后端都失败时抛出最后一个异常；不属于后端故障的异常立即抛出，不再尝试其它后端
+        """
+        futures: Dict[Future, Backend] = {}
+        tried: List[Backend] = []
+        self._launch(fn, label, tried, futures)
+        started = time.monotonic()
+        delay = self.hedge_delay(label) if hedge else None
+        hedged = False
+        last_error = None
+        while futures:
+            timeout = None if delay is None or hedged else max(0.0, delay - (time.monotonic() - started))
+            done, _ = wait(list(futures), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = True
+                if self._launch(fn, label, tried, futures):
+                    with self.lock:
+                        self.hedged += 1
+                continue
+            for future in done:
+                backend = futures.pop(future)
+                if future.exception() is not None:
+                    last_error = future.exception()
+                    if not self.is_backend_error(last_error):
+                        raise last_error
+                    continue
+                with self.lock:
+                    if hedged and backend is not tried[0]:
+                        self.hedge_wins += 1
+                return future.result(), backend, {"attempts": len(tried), "hedged": hedged}
+            if not futures and self._launch(fn, label, tried, futures):
+                with self.lock:
+                    self.failovers += 1
+        raise last_error
+
+    def stats(self) -> Dict:
+        """各后端的请求数、错误率、耗时分位数和熔断状态"""
+        now = time.monotonic()
+        with self.lock:
+            backends = {}
+            for b in self.backends:
+                samples = b.samples()
+                backends[b.name] = {
+                    "model": b.model,
+                    "requests": b.requests,
+                    "errors": b.errors,
+                    "error_rate": round(b.error_rate(), 3),
+                    "latency_p50": round(median(samples), 3) if samples else None,
+                    "latency_p90": round(percentile(samples, 90), 3) if samples else None,
+                    "circuit": "open" if b.open_until > now else "closed",
+                    "circuit_opened": b.opened
+                }
+            return {"backends": backends, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                    "failovers": self.failovers}
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""论文身份与别名索引
+
+同一篇论文可能以不同的 URL 出现（http/https、带跟踪参数、arXiv 的 abs/pdf 链接、不同镜像），
+而不同的论文也可能有相同的文件名（paper.pdf）。这里为每篇论文确定一个稳定的身份：
+    arXiv      arxiv:{id}{版本}，例如 arxiv:2602.12852v2（v1 与 v2 是不同的条目）
+    本地文件   sha256:{文件内容哈希}
+    其它 URL   url:{规范化后的 URL}（小写协议和主机、去掉默认端口、片段和跟踪参数、排序查询参数）
+paper_id 为身份的 sha256 前 16 位十六进制字符。
+
+backup/identity.sqlite 记录 别名 -> paper_id，别名包括原始输入、身份和解析结果的内容哈希，
+查询为主键查找（O(1)）。不同 URL 解析出内容完全相同的 paper.md 时，后者登记为前者的别名。
+旧版本按文件名 MD5 生成的备份目录在首次遇到时登记为别名，继续使用，无需重新解析。
+
+同一数据库还记录未指定版本的 arXiv 标识最近一次查到的最新版本：ARXIV_VERSION_TTL 内直接使用，
+不再访问 arXiv API；查询失败时沿用最近一次的结果，同一输入始终得到同一个 paper_id。
+"""
+
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import parse_cache
+
+INDEX_FILENAME = 'identity.sqlite'
+
+# paper_id 长度（十六进制字符数）
+PAPER_ID_LENGTH = 16
+
+# 查到的 arXiv 最新版本在多长时间内直接使用（秒）
+ARXIV_VERSION_TTL = 24 * 3600
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# 不影响所指文档的查询参数
+TRACKING_PARAMS = re.compile(r'^(?:utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref|ref_src)$', re.IGNORECASE)
+
+# arXiv 标识：新式 2602.12852、旧式 hep-th/9901001，可带版本号和 arXiv: 前缀
+ARXIV_ID_RE = re.compile(r'^(?:arxiv:)?(\d{4}\.\d{4,5}|[a-z][a-z.-]*/\d{7})(v\d+)?$', re.IGNORECASE)
+ARXIV_URL_RE = re.compile(r'^https?://(?:www\.|export\.)?arxiv\.org/(?:abs|pdf)/(.+?)(?:\.pdf)?/?$', re.IGNORECASE)
+
+
+def parse_arxiv_id(text: str):
+    """识别 arXiv 标识或 arxiv.org 的 abs/pdf 链接
+
+    Returns:
+        (arxiv_id, version)，version 形如 "v2"，未指定时为 None；不是 arXiv 标识时返回 None
+    """
+    text = text.strip()
+    url_match = ARXIV_URL_RE.match(text)
+    if url_match:
+        text = url_match.group(1)
+    match = ARXIV_ID_RE.match(text)
+    if not match:
+        return None
+    arxiv_id = match.group(1)
+    if '/' in arxiv_id:
+        # 旧式标识中的学科分类（math.GT/0309136 的 .GT）不属于标识本身
+        archive, number = arxiv_id.split('/')
+        arxiv_id = f"{archive.split('.')[0].lower()}/{number}"
+    return arxiv_id, (match.group(2).lower() if match.group(2) else None)
+
+
+def canonical_url(url: str) -> str:
+    """规范化 URL：小写协议和主机，去掉默认端口、用户信息、片段和跟踪参数，查询参数排序"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    port = parts.port
+    netloc = host if port is None or port == DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                             if not TRACKING_PARAMS.match(k)))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+def identity_of(key: str) -> str:
+    """论文来源的身份字符串（见模块说明）"""
+    key = key.strip()
+    if key.startswith('sha256:'):
+        return key.lower()
+    arxiv = parse_arxiv_id(key)
+    if arxiv:
+        return f"arxiv:{arxiv[0]}{arxiv[1] or ''}"
+    # http 与 https 指向同一文档，身份中不区分
+    return 'url:' + re.sub(r'^https?://', '//', canonical_url(key))
+
+
+def paper_id_for(identity: str) -> str:
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:PAPER_ID_LENGTH]
+
+
+def legacy_paper_id(pdf_url: str) -> str:
+    """旧版本的论文 ID：URL 最后一段去掉扩展名后的 MD5（不同主机的同名文件会冲突）"""
+    url_path = pdf_url.rstrip('/')
+    filename = url_path.split('/')[-1]
+    name_without_ext = filename.rsplit('.', 1)[0] if '.' in filename else url_path
+    return hashlib.md5(name_without_ext.encode('utf-8')).hexdigest()
+
+
+class IdentityIndex:
+    """别名 -> paper_id 的持久索引（SQLite，线程安全）"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else parse_cache.get_backup_base_dir() / INDEX_FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS aliases (
+                alias TEXT PRIMARY KEY,
+                paper_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_aliases_paper ON aliases(paper_id)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS arxiv_versions (
+                arxiv_id TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                checked_at REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def lookup(self, alias: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute("SELECT paper_id FROM aliases WHERE alias = ?", (alias,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, paper_id: str, aliases: Dict[str, str], replace: bool = False) -> None:
+        """登记别名
+
+        Args:
+            paper_id: 论文 ID
+            aliases: {别名: 类型}，类型为 input/identity/content/legacy
+            replace: 已存在的别名改为指向 paper_id（默认保留原有映射）
+        """
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                f"{verb} INTO aliases (alias, paper_id, kind, created_at) VALUES (?, ?, ?, ?)",
+                [(alias, paper_id, kind, now) for alias, kind in aliases.items()])
+            self.conn.commit()
+
+    def arxiv_version(self, arxiv_id: str) -> Optional[Tuple[str, float]]:
+        """最近一次查到的 arXiv 最新版本：(版本, 查询时间)，没有记录时返回 None"""
+        with self.lock:
+            row = self.conn.execute("SELECT version, checked_at FROM arxiv_versions WHERE arxiv_id = ?",
+                                    (arxiv_id,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set_arxiv_version(self, arxiv_id: str, version: str) -> None:
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO arxiv_versions (arxiv_id, version, checked_at) VALUES (?, ?, ?)",
+                              (arxiv_id, version, time.time()))
+            self.conn.commit()
+
+    def aliases(self, paper_id: str) -> List[Dict]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT alias, kind, created_at FROM aliases WHERE paper_id = ? ORDER BY created_at",
+                (paper_id,)).fetchall()
+        return [{"alias": a, "kind": k, "created_at": c} for a, k, c in rows]
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+_indexes: Dict[Path, IdentityIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index() -> IdentityIndex:
+    """当前 backup 目录的共享索引（随 PAPER_READER_BACKUP_DIR 切换）"""
+    path = parse_cache.get_backup_base_dir() / INDEX_FILENAME
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = IdentityIndex(path)
+            _indexes[path] = index
+    return index
+
+
+def _legacy_match(pdf_url: str) -> Optional[str]:
+    """旧版本为该 URL 建立的备份目录（manifest 中的来源 URL 一致时才认为是同一篇论文）"""
+    if pdf_url.startswith('sha256:'):
+        return None
+    legacy_id = legacy_paper_id(pdf_url)
+    manifest = parse_cache.load_manifest(parse_cache.get_backup_base_dir() / legacy_id)
+    if manifest and manifest.get("source_url") == pdf_url:
+        return legacy_id
+    return None
+
+
+def resolve_paper_id(pdf_url: str, index: Optional[IdentityIndex] = None) -> str:
+    """返回来源对应的 paper_id，首次遇到时登记别名
+
+    依次查找：原始输入、身份的别名 -> 旧版本的备份目录 -> 由身份生成新的 paper_id。
+    已登记过的输入只做一次主键查询，不写数据库（get_paper_id 在每次提交、打点时都会调用）。
+    """
+    index = index or get_index()
+    pdf_url = pdf_url.strip()
+    paper_id = index.lookup(pdf_url)
+    if paper_id is not None:
+        return paper_id
+    identity = identity_of(pdf_url)
+    paper_id = index.lookup(identity)
+    if paper_id is not None:
+        index.add(paper_id, {pdf_url: "input"})
+        return paper_id
+    paper_id = _legacy_match(pdf_url)
+    kind = "legacy" if paper_id else "identity"
+    paper_id = paper_id or paper_id_for(identity)
+    # 输入本身就是身份时保留身份的类型
+    index.add(paper_id, {pdf_url: "input", identity: kind})
+    return paper_id
+
+
+def register_content(paper_id: str, content_hash: str, index: Optional[IdentityIndex] = None) -> str:
+    """登记解析结果的内容哈希
+
+    Returns:
+        内容相同的已有论文的 paper_id（其备份目录仍然存在时），否则返回 paper_id 本身
+    """
+    index = index or get_index()
+    alias = f"content:{content_hash}"
+    existing = index.lookup(alias)
+    if existing and existing != paper_id and (parse_cache.get_backup_base_dir() / existing / 'paper.md').exists():
+        return existing
+    index.add(paper_id, {alias: "content"}, replace=True)
+    return paper_id
+
+
+def merge_into(paper_id: str, target_id: str, index: Optional[IdentityIndex] = None) -> None:
+    """把 paper_id 的所有别名改为指向 target_id（两者内容相同）"""
+    index = index or get_index()
+    aliases = {a["alias"]: a["kind"] for a in index.aliases(paper_id)}
+    if aliases:
+        index.add(target_id, aliases, replace=True)
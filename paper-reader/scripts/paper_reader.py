@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""按需读取 paper.md 的章节和行
+
+用 mmap 打开 paper.md，只扫描一遍标题建立章节目录（标题、级别、行号、字节偏移），
+之后按章节或行号区间读取时只解码需要的那一段，不需要把整篇论文读入内存。
+parser.py --summary 输出的章节目录也来自这里。
+
+用法：
+    python3 paper_reader.py backup/PAPER_ID --outline
+    python3 paper_reader.py backup/PAPER_ID --section 3
+    python3 paper_reader.py backup/PAPER_ID --section "related work"
+    python3 paper_reader.py backup/PAPER_ID --lines 120:180
+"""
+
+import re
+import sys
+import json
+import mmap
+import argparse
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+# 与 figure_index.HEADING_RE 相同的标题规则，作用于字节（不跨行）
+HEADING_RE = re.compile(rb'^(#{1,6})[ \t]+(.*?)[ \t]*#*[ \t]*\r?$', re.MULTILINE)
+
+
+class PaperReader:
+    """paper.md 的只读视图，用作上下文管理器
+
+    with PaperReader(paper_dir) as reader:
+        for section in reader.outline():
+            ...
+        text = reader.section('Method')
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """
+        Args:
+            path: 论文目录（包含 paper.md）或 markdown 文件路径
+        """
+        path = Path(path)
+        self.path = path / 'paper.md' if path.is_dir() else path
+        self._file = open(self.path, 'rb')
+        self.size = self.path.stat().st_size
+        # 空文件不能 mmap
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+        self._outline = None
+        self._line_starts = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def _line_index(self) -> List[int]:
+        """每一行起始位置的字节偏移（第一次按行读取时建立）"""
+        if self._line_starts is None:
+            starts = [0]
+            find = self._data.find
+            pos = find(b'\n')
+            while pos != -1:
+                starts.append(pos + 1)
+                pos = find(b'\n', pos + 1)
+            if starts[-1] == self.size and len(starts) > 1:
+                # 文件以换行结尾时最后一个“行首”不是新的一行
+                starts.pop()
+            self._line_starts = starts
+        return self._line_starts
+
+    @property
+    def line_count(self) -> int:
+        return len(self._line_index()) if self.size else 0
+
+    def line_of(self, offset: int) -> int:
+        """字节偏移所在的行号（从 1 开始）"""
+        return bisect_right(self._line_index(), offset)
+
+    def outline(self) -> List[Dict]:
+        """章节目录：每个标题到下一个标题（或文件末尾）为一节
+
+        Returns:
+            [{"index", "level", "title", "line", "end_line", "offset", "bytes"}]，
+            行号从 1 开始（闭区间），offset/bytes 为该节在 paper.md 中的字节区间；
+            第一个标题之前的内容（如果有）作为 index 为 0、title 为 None 的前言
+        """
+        if self._outline is not None:
+            return self._outline
+        matches = list(HEADING_RE.finditer(self._data))
+        starts = [m.start() for m in matches]
+        sections = []
+        if not starts or starts[0] > 0:
+            sections.append((0, None, None))
+        sections += [(m.start(), len(m.group(1)), m.group(2).decode('utf-8', errors='replace')) for m in matches]
+
+        self._outline = []
+        for i, (offset, level, title) in enumerate(sections):
+            end = sections[i + 1][0] if i + 1 < len(sections) else self.size
+            if title is None and end == offset:
+                continue
+            self._outline.append({
+                "index": len(self._outline),
+                "level": level,
+                "title": title,
+                "line": self.line_of(offset),
+                "end_line": self.line_of(max(offset, end - 1)),
+                "offset": offset,
+                "bytes": end - offset
+            })
+        return self._outline
+
+    def find_section(self, key: Union[int, str]) -> Optional[Dict]:
+        """按序号或标题查找章节
+
+        Args:
+            key: outline 中的 index，或标题（先完全匹配，再按包含匹配，不区分大小写）
+
+        Returns:
+            章节目录项，找不到时返回 None
+        """
+        outline = self.outline()
+        if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+            index = int(key)
+            return outline[index] if 0 <= index < len(outline) else None
+        needle = key.strip().lower()
+        titled = [s for s in outline if s["title"]]
+        for s in titled:
+            if s["title"].lower() == needle:
+                return s
+        for s in titled:
+            if needle in s["title"].lower():
+                return s
+        return None
+
+    def read(self, offset: int, length: int) -> str:
+        """读取字节区间并解码（区间边界落在多字节字符中间时替换为 U+FFFD）"""
+        return self._data[offset:offset + length].decode('utf-8', errors='replace')
+
+    def section(self, key: Union[int, str], include_subsections: bool = False) -> Optional[str]:
+        """读取一个章节的文本（包含标题行）
+
+        Args:
+            key: 见 find_section
+            include_subsections: 同时包含该节下级别更低的子章节
+
+        Returns:
+            章节文本，找不到时返回 None
+        """
+        entry = self.find_section(key)
+        if entry is None:
+            return None
+        end = entry["offset"] + entry["bytes"]
+        if include_subsections and entry["level"]:
+            for s in self.outline()[entry["index"] + 1:]:
+                if s["level"] and s["level"] <= entry["level"]:
+                    break
+                end = s["offset"] + s["bytes"]
+        return self.read(entry["offset"], end - entry["offset"])
+
+    def lines(self, start: int, end: Optional[int] = None) -> str:
+        """读取行号区间 [start, end]（从 1 开始的闭区间，end 省略时读到文件末尾）"""
+        starts = self._line_index()
+        start = max(1, start)
+        end = len(starts) if end is None else min(end, len(starts))
+        if not self.size or start > end:
+            return ''
+        begin = starts[start - 1]
+        stop = starts[end] if end < len(starts) else self.size
+        return self.read(begin, stop - begin).rstrip('\n')
+
+
+def summarize(paper_dir: Union[str, Path]) -> Dict:
+    """论文目录的紧凑摘要：文件路径和大小、章节目录、图像数量（不包含正文）"""
+    paper_dir = Path(paper_dir)
+    images_dir = paper_dir / 'images'
+    images = [p for p in images_dir.rglob('*') if p.is_file()] if images_dir.is_dir() else []
+    with PaperReader(paper_dir) as reader:
+        outline = reader.outline()
+        return {
+            "markdown_file": str(reader.path),
+            "markdown_bytes": reader.size,
+            "markdown_lines": reader.line_count,
+            "title": next((s["title"] for s in outline if s["title"]), None),
+            "images_dir": str(images_dir),
+            "image_count": len(images),
+            "images_bytes": sum(p.stat().st_size for p in images),
+            "sections": [{k: s[k] for k in ("index", "level", "title", "line", "offset", "bytes")} for s in outline]
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='按章节或行号读取 paper.md，不加载整篇论文')
+    parser.add_argument('paper', help='论文目录（包含 paper.md）或 markdown 文件路径')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--outline', action='store_true', help='以 JSON 输出章节目录（行号、字节偏移和大小）')
+    group.add_argument('--section', help='输出一个章节：outline 中的序号或标题（不区分大小写，可只写一部分）')
+    group.add_argument('--lines', metavar='START:END', help='输出行号区间（从 1 开始，闭区间，END 可省略）')
+    parser.add_argument('--with-subsections', action='store_true', help='--section 时同时输出其下的子章节')
+    args = parser.parse_args()
+
+    try:
+        reader = PaperReader(args.paper)
+    except OSError as e:
+        print(f"错误: 无法打开 {args.paper}: {e}", file=sys.stderr)
+        sys.exit(1)
+    with reader:
+        if args.outline:
+            print(json.dumps(reader.outline(), ensure_ascii=False, indent=2))
+        elif args.section is not None:
+            text = reader.section(args.section, include_subsections=args.with_subsections)
+            if text is None:
+                print(f"错误: 未找到章节 {args.section}", file=sys.stderr)
+                sys.exit(1)
+            print(text)
+        else:
+            start, _, end = args.lines.partition(':')
+            try:
+                print(reader.lines(int(start or 1), int(end) if end else None))
+            except ValueError:
+                parser.error("--lines 的格式为 START:END")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""论文解析缓存
+
+为 backup/{paper_id}/ 目录维护 manifest.json，记录来源 URL、内容哈希、
+MinerU model_version 以及文件清单（大小 + sha256）。manifest 校验通过时
+parser.py 直接返回缓存结果，不再调用 MinerU API。
+
+同时提供基于 TTL 和总大小上限的淘汰：TTL 从解析完成（manifest 的 created_at）开始计算，
+查找和淘汰使用同一规则，过期的条目不再命中、也会被淘汰；超出总大小上限时按 last_accessed
+从最久未访问的开始淘汰（LRU）。
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'}
+
+
+def get_backup_base_dir() -> Path:
+    """返回 skill 根目录下的 backup 目录；设置了环境变量 PAPER_READER_BACKUP_DIR 时使用该目录"""
+    override = os.environ.get('PAPER_READER_BACKUP_DIR')
+    if override:
+        return Path(override)
+    return Path(__file__).parent.parent / 'backup'
+
+
+def hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+    """流式计算文件 sha256"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_json_atomic(path: Path, data) -> None:
+    """先写临时文件再 rename，避免中途被杀时留下损坏的 JSON"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _list_backup_files(backup_dir: Path) -> List[Path]:
+    """列出需要记录到 manifest 中的文件：paper.md 和 images/ 下的所有图像"""
+    files = []
+    md_file = backup_dir / 'paper.md'
+    if md_file.is_file():
+        files.append(md_file)
+    images_dir = backup_dir / 'images'
+    if images_dir.is_dir():
+        files.extend(sorted(
+            p for p in images_dir.rglob('*')
+            if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS
+        ))
+    return files
+
+
+def directory_size(path: Path) -> int:
+    """目录下所有文件的总字节数（包括解析之后写入的分析结果、进度日志等）"""
+    total = 0
+    for child in path.rglob('*'):
+        try:
+            if child.is_file() and not child.is_symlink():
+                total += child.stat().st_size
+        except OSError:
+            continue
+    return total
+
+
+def build_manifest(backup_dir: Path, source_url: str, model_version: str,
+                   content_hash: Optional[str] = None, known_hashes: Optional[Dict[str, str]] = None) -> Dict:
+    """根据备份目录当前内容生成 manifest
+
+    Args:
+        backup_dir: 论文备份目录
+        source_url: 原始 PDF URL
+        model_version: 解析使用的 MinerU model_version
+        content_hash: 内容哈希，默认使用 paper.md 的 sha256
+        known_hashes: 已知的 {相对路径: sha256}，命中时不再重新计算
+
+    Returns:
+        manifest 字典
+    """
+    known_hashes = known_hashes or {}
+    entries = []
+    for path in _list_backup_files(backup_dir):
+        rel_path = path.relative_to(backup_dir).as_posix()
+        entries.append({
+            "path": rel_path,
+            "size": path.stat().st_size,
+            "sha256": known_hashes.get(rel_path) or hash_file(path)
+        })
+
+    if content_hash is None:
+        md_entry = next((e for e in entries if e["path"] == 'paper.md'), None)
+        content_hash = md_entry["sha256"] if md_entry else None
+
+    now = time.time()
+    return {
+        "version": MANIFEST_VERSION,
+        "paper_id": backup_dir.name,
+        "source_url": source_url,
+        "content_hash": content_hash,
+        "model_version": model_version,
+        "created_at": now,
+        "last_accessed": now,
+        "total_size": directory_size(backup_dir),
+        "files": entries
+    }
+
+
+def write_manifest(backup_dir: Path, manifest: Dict) -> None:
+    write_json_atomic(backup_dir / MANIFEST_NAME, manifest)
+
+
+def load_manifest(backup_dir: Path) -> Optional[Dict]:
+    """读取 manifest，不存在或损坏时返回 None"""
+    manifest_path = backup_dir / MANIFEST_NAME
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def is_expired(manifest: Dict, ttl: Optional[float], now: Optional[float] = None) -> bool:
+    """条目是否超过有效期：从解析完成（created_at）起超过 ttl 秒；ttl 为 None 时不过期"""
+    if ttl is None:
+        return False
+    return (now if now is not None else time.time()) - manifest.get("created_at", 0) > ttl
+
+
+def validate_manifest(backup_dir: Path, manifest: Dict, model_version: Optional[str] = None,
+                      ttl: Optional[float] = None, verify_hashes: bool = False) -> bool:
+    """校验 manifest 是否仍然有效
+
+    Args:
+        backup_dir: 论文备份目录
+        manifest: 已读取的 manifest
+        model_version: 期望的 MinerU model_version，为 None 时不检查
+        ttl: 有效期（秒，从解析完成时算起，见 is_expired），为 None 时不过期
+        verify_hashes: 是否重新计算每个文件的 sha256（默认只比较大小）
+
+    Returns:
+        bool: manifest 是否有效
+    """
+    if model_version is not None and manifest.get("model_version") != model_version:
+        return False
+    if is_expired(manifest, ttl):
+        return False
+
+    files = manifest.get("files") or []
+    if not any(e.get("path") == 'paper.md' for e in files):
+        return False
+
+    for entry in files:
+        path = backup_dir / entry["path"]
+        try:
+            if path.stat().st_size != entry["size"]:
+                return False
+        except OSError:
+            return False
+        if verify_hashes and hash_file(path) != entry["sha256"]:
+            return False
+    return True
+
+
+def touch_manifest(backup_dir: Path, manifest: Dict) -> None:
+    """更新 last_accessed，供 LRU 淘汰使用"""
+    manifest["last_accessed"] = time.time()
+    try:
+        write_manifest(backup_dir, manifest)
+    except OSError as e:
+        print(f"更新 manifest 访问时间失败: {e}", file=sys.stderr)
+
+
+def lookup(backup_dir: Path, model_version: Optional[str] = None, ttl: Optional[float] = None,
+           verify_hashes: bool = False) -> Optional[Dict]:
+    """查找缓存，命中时返回与 download_and_extract_zip 相同结构的结果
+
+    Args:
+        backup_dir: 论文备份目录
+        model_version: 期望的 MinerU model_version
+        ttl: 有效期（秒）
+        verify_hashes: 是否校验文件哈希
+
+    Returns:
+        命中时返回结果字典，否则返回 None
+    """
+    manifest = load_manifest(backup_dir)
+    if manifest is None:
+        return None
+    if not validate_manifest(backup_dir, manifest, model_version, ttl, verify_hashes):
+        return None
+
+    touch_manifest(backup_dir, manifest)
+
+    backup_md_file = backup_dir / 'paper.md'
+    backup_images_dir = backup_dir / 'images'
+    with open(backup_md_file, 'r', encoding='utf-8') as f:
+        markdown_content = f.read()
+
+    image_paths = [
+        str(Path(e["path"]).relative_to('images'))
+        for e in manifest["files"]
+        if e["path"].startswith('images/')
+    ]
+
+    print(f"命中解析缓存: {backup_dir} (ID: {backup_dir.name})", file=sys.stderr)
+    return {
+        "paper_id": backup_dir.name,
+        "backup_markdown": str(backup_md_file),
+        "backup_images_dir": str(backup_images_dir),
+        "backup_dir": str(backup_dir),
+        "image_files": [str(backup_images_dir / p) for p in image_paths],
+        "markdown_content": markdown_content,
+        "image_paths": image_paths,
+        "cached": True
+    }
+
+
+def evict(backup_base_dir: Optional[Path] = None, max_bytes: Optional[int] = None,
+          ttl: Optional[float] = None, keep: tuple = ()) -> List[str]:
+    """按 TTL 和总大小上限对 backup/ 下的论文做 LRU 淘汰
+
+    只处理带 manifest 的目录；没有 manifest 的旧备份不会被删除。
+    目录大小在淘汰时重新统计，解析后写入的分析结果等文件也计入大小上限。
+
+    Args:
+        backup_base_dir: backup 根目录，默认为 skill 根目录下的 backup
+        max_bytes: 允许的总大小（字节），为 None 时不按大小淘汰
+        ttl: 有效期（秒），与 lookup 相同按解析完成时间（created_at）计算，过期的条目会被删除
+        keep: 不允许删除的 paper_id（例如刚刚解析完成的论文）
+
+    Returns:
+        被删除的 paper_id 列表
+    """
+    backup_base_dir = backup_base_dir or get_backup_base_dir()
+    if not backup_base_dir.is_dir():
+        return []
+
+    entries = []
+    for child in backup_base_dir.iterdir():
+        if not child.is_dir():
+            continue
+        manifest = load_manifest(child)
+        if manifest is None:
+            continue
+        entries.append((manifest.get("last_accessed", 0), directory_size(child), child, manifest))
+
+    # 超出大小上限时从最久未访问的开始淘汰
+    entries.sort(key=lambda e: e[0])
+    now = time.time()
+    total = sum(size for _, size, _, _ in entries)
+    evicted = []
+
+    for _, size, path, manifest in entries:
+        if path.name in keep:
+            continue
+        expired = is_expired(manifest, ttl, now)
+        over_budget = max_bytes is not None and total > max_bytes
+        if not (expired or over_budget):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        evicted.append(path.name)
+        print(f"已淘汰缓存: {path.name} ({size} 字节)", file=sys.stderr)
+
+    return evicted
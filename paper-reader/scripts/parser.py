@@ -5,33 +5,51 @@
 """
 
 import os
+import re
 import sys
 import json
 import requests
 import zipfile
 import time
+import random
 import tempfile
+import shutil
 import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import parse_cache
+import catalog
+import search_index
+import image_dedup
+import paper_reader
+import http_client
+import metrics
+import paper_identity
+from paper_identity import parse_arxiv_id
+
+# MinerU 解析模型版本，同时写入缓存 manifest 用于校验
+MODEL_VERSION = "vlm"
+
+# MinerU API 地址，可用环境变量 MINERU_API_BASE 指向本地替身服务（见 benchmarks/）
+MINERU_API_BASE = os.environ.get('MINERU_API_BASE', 'https://mineru.net/api/v4').rstrip('/')
+
 
 def get_paper_id(pdf_url):
-    """从 PDF URL 生成唯一的论文 ID（使用 MD5 哈希）
+    """返回论文来源对应的稳定 ID（16 位十六进制）
+
+    由规范化后的身份（arXiv 标识+版本、内容哈希或规范化 URL）生成，并通过 backup/identity.sqlite
+    的别名索引解析，同一篇论文的不同写法得到同一个 ID；旧版本的备份目录继续沿用原来的 ID。
+    详见 paper_identity.py。
 
     Args:
-        pdf_url: PDF 文件 URL
+        pdf_url: PDF URL、"sha256:{哈希}" 或 resolve_source 返回的 key
 
     Returns:
-        str: 唯一的论文 ID（8位十六进制）
+        str: 论文 ID
     """
-    # 从 URL 提取文件名（不含扩展名），如果无法提取则使用完整 URL
-    url_path = pdf_url.rstrip('/')
-    filename = url_path.split('/')[-1]
-    name_without_ext = filename.rsplit('.', 1)[0] if '.' in filename else url_path
-
-    # 使用文件名或 URL 生成 MD5 哈希
-    hash_obj = hashlib.md5(name_without_ext.encode('utf-8'))
-    return hash_obj.hexdigest()[:64]
+    return paper_identity.resolve_paper_id(pdf_url)
 
 
 def read_api_key():
@@ -46,22 +64,155 @@ def read_api_key():
     raise ValueError("MINERU_API_KEY not found in .env file")
 
 
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
+ARXIV_ENTRY_ID_RE = re.compile(r'<id>\s*https?://arxiv\.org/abs/([^<\s]+?)\s*</id>')
+
+
+def latest_arxiv_version(arxiv_id):
+    """通过 arXiv API 查询最新版本号（如 "v3"），查询失败时返回 None"""
+    try:
+        response = http_client.get_session('download').get(ARXIV_API_URL, params={"id_list": arxiv_id}, timeout=15)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"查询 arXiv 最新版本失败: {e}", file=sys.stderr)
+        return None
+    for entry_id in ARXIV_ENTRY_ID_RE.findall(response.text):
+        parsed = parse_arxiv_id(entry_id)
+        if parsed and parsed[0] == arxiv_id and parsed[1]:
+            return parsed[1]
+    return None
+
+
+def resolve_arxiv_version(arxiv_id, ttl=paper_identity.ARXIV_VERSION_TTL):
+    """未指定版本的 arXiv 标识对应的版本
+
+    先查 backup/identity.sqlite 中记录的最新版本，ttl 秒内查过的直接使用；否则查询 arXiv API 并记录结果。
+    查询失败时沿用最近一次查到的版本，使同一输入的缓存键和论文 ID 保持不变；从未查到过时返回 None。
+    """
+    index = paper_identity.get_index()
+    known = index.arxiv_version(arxiv_id)
+    if known and time.time() - known[1] <= ttl:
+        return known[0]
+    version = latest_arxiv_version(arxiv_id)
+    if version:
+        index.set_arxiv_version(arxiv_id, version)
+        return version
+    return known[0] if known else None
+
+
+def resolve_source(source, resolve_version=True):
+    """把命令行传入的论文来源规范化
+
+    支持三种输入：
+        本地 PDF 路径    按内容 sha256 标识，同一文件从不同路径传入命中同一缓存
+        arXiv 标识/链接  2602.12852、arXiv:2602.12852v2、arxiv.org/abs/... 统一为 https://arxiv.org/pdf/{id}{版本}
+        其它 URL         原样使用
+
+    Args:
+        source: PDF URL、本地路径或 arXiv 标识
+        resolve_version: arXiv 标识未指定版本时解析为最新版本（见 resolve_arxiv_version），使缓存与具体版本对应
+
+    Returns:
+        dict: kind（url/arxiv/file）、key（缓存和论文 ID 使用的标识）、url（提交给 MinerU 的 URL，本地文件为 None）、
+              path（本地文件路径）以及 arXiv 的 arxiv_id / version
+    """
+    source = source.strip()
+    local_path = Path(source[len('file://'):] if source.startswith('file://') else source).expanduser()
+    if not re.match(r'^https?://', source, re.IGNORECASE) and local_path.is_file():
+        digest = parse_cache.hash_file(local_path)
+        return {"kind": "file", "key": f"sha256:{digest}", "url": None, "path": local_path.resolve(),
+                "sha256": digest, "size": local_path.stat().st_size}
+
+    arxiv = parse_arxiv_id(source)
+    if arxiv:
+        arxiv_id, version = arxiv
+        if version is None and resolve_version:
+            version = resolve_arxiv_version(arxiv_id)
+        url = f"https://arxiv.org/pdf/{arxiv_id}{version or ''}"
+        return {"kind": "arxiv", "key": url, "url": url, "path": None, "arxiv_id": arxiv_id, "version": version}
+
+    if not re.match(r'^https?://', source, re.IGNORECASE):
+        raise FileNotFoundError(f"本地文件不存在，也不是 URL 或 arXiv 标识: {source}")
+    return {"kind": "url", "key": source, "url": source, "path": None}
+
+
+def submit_source(source, api_key):
+    """按来源类型提交解析任务：URL 直接提交，本地文件走上传流程"""
+    if source["kind"] == "file":
+        return upload_file(source["path"], api_key, data_id=source["sha256"][:32])
+    return submit_task(source["url"], api_key)
+
+
+def upload_file(path, api_key, data_id=None):
+    """通过 MinerU 的文件上传流程提交本地 PDF，返回 "batch:{batch_id}" 形式的任务 ID
+
+    先申请预签名上传地址，再把文件流式 PUT 上去（不整体读入内存）；上传完成后 MinerU 自动开始解析，
+    状态通过 extract-results/batch/{batch_id} 查询。
+
+    Args:
+        path: 本地 PDF 路径
+        api_key: API 密钥
+        data_id: 可选，随任务记录的业务 ID
+    """
+    path = Path(path)
+    url = f"{MINERU_API_BASE}/file-urls/batch"
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+    file_entry = {"name": path.name}
+    if data_id:
+        file_entry["data_id"] = data_id
+    data = {
+        "files": [file_entry],
+        "model_version": MODEL_VERSION
+    }
+
+    try:
+        print(f"正在申请上传地址: {path}", file=sys.stderr)
+        with metrics.span('mineru.upload_url', bytes_up=len(json.dumps(data))) as span:
+            response = http_client.get_session('mineru').post(url, headers=headers, json=data, timeout=300)
+            span.response(response, len(response.content))
+            response.raise_for_status()
+        result = response.json()
+        batch = result.get('data') or {}
+        if not batch.get('batch_id') or not batch.get('file_urls'):
+            print("API Response structure:", json.dumps(result, indent=2), file=sys.stderr)
+            raise ValueError(f"申请上传地址失败: {result.get('msg') or 'batch_id/file_urls not found in API response'}")
+
+        size = path.stat().st_size
+        print(f"正在上传 {path.name} ({size} 字节)", file=sys.stderr)
+        with open(path, 'rb') as f, metrics.span('mineru.upload', bytes_up=size) as span:
+            # 传入文件对象，requests 按块读取发送；预签名地址不接受额外的 Content-Type
+            response = http_client.get_session('upload').put(batch['file_urls'][0], data=f, timeout=600)
+            span.response(response, len(response.content))
+            response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"上传文件失败: {e}", file=sys.stderr)
+        raise
+
+    return f"batch:{batch['batch_id']}"
+
+
 def submit_task(pdf_url, api_key):
     """提交 PDF 解析任务到 MinerU API，返回 task_id"""
-    url = "https://mineru.net/api/v4/extract/task"
+    url = f"{MINERU_API_BASE}/extract/task"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
     data = {
         "url": pdf_url,
-        "model_version": "vlm"
+        "model_version": MODEL_VERSION
     }
 
     try:
         print(f"正在提交解析任务: {pdf_url}", file=sys.stderr)
-        response = requests.post(url, headers=headers, json=data, timeout=300)
-        response.raise_for_status()
+        with metrics.tags(paper_id=get_paper_id(pdf_url)), \
+                metrics.span('mineru.submit', bytes_up=len(json.dumps(data))) as span:
+            response = http_client.get_session('mineru').post(url, headers=headers, json=data, timeout=300)
+            span.response(response, len(response.content))
+            response.raise_for_status()
 
         result = response.json()
         print(f"任务提交响应: {json.dumps(result, indent=2)}", file=sys.stderr)
@@ -80,15 +231,20 @@ def submit_task(pdf_url, api_key):
 
 
 def check_task_status(task_id, api_key):
-    """检查任务状态，返回状态信息"""
-    url = f"https://mineru.net/api/v4/extract/task/{task_id}"
+    """检查任务状态，返回状态信息（"batch:" 开头的任务 ID 查询上传文件的批量结果）"""
+    if task_id.startswith('batch:'):
+        url = f"{MINERU_API_BASE}/extract-results/batch/{task_id[len('batch:'):]}"
+    else:
+        url = f"{MINERU_API_BASE}/extract/task/{task_id}"
     headers = {
         "Authorization": f"Bearer {api_key}"
     }
 
     try:
-        response = requests.get(url, headers=headers, timeout=300)
-        response.raise_for_status()
+        with metrics.span('mineru.status', task_id=task_id) as span:
+            response = http_client.get_session('mineru').get(url, headers=headers, timeout=300)
+            span.response(response, len(response.content))
+            response.raise_for_status()
         result = response.json()
         return result
     except requests.exceptions.RequestException as e:
@@ -96,40 +252,305 @@ def check_task_status(task_id, api_key):
         raise
 
 
-def wait_for_completion(task_id, api_key, check_interval=30):
-    """等待任务完成，返回任务结果"""
-    print(f"开始轮询任务状态，task_id: {task_id}", file=sys.stderr)
+def extract_status_info(result):
+    """从 check_task_status 的响应中取出任务状态字典
 
-    while True:
-        try:
-            result = check_task_status(task_id, api_key)
+    上传文件的批量结果中，状态位于 extract_result 列表里（每次只上传一个文件，取第一项）。
+    """
+    if 'data' in result:
+        result = result['data']
+    if isinstance(result.get('extract_result'), list):
+        if not result['extract_result']:
+            # 文件尚未登记到批次中，按等待处理
+            return {"state": "waiting-file"}
+        return result['extract_result'][0]
+    return result
 
-            if 'data' in result:
-                status_info = result['data']
-            else:
-                status_info = result
 
-            status = status_info.get('state', '')
-            print(f"任务状态: {status}", file=sys.stderr)
+class PollSchedule:
+    """单个任务的自适应轮询节奏
+
+    前几次间隔很短，之后按指数退避并加入随机抖动；若 MinerU 返回了
+    extract_progress（已解析页数/总页数）或显式的 ETA 字段，则按预计剩余时间安排下一次查询。
+    """
+
+    def __init__(self, initial=2.0, factor=1.6, max_interval=30.0, jitter=0.2):
+        self.interval = initial
+        self.initial = initial
+        self.factor = factor
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.started = time.monotonic()
+
+    def estimate_remaining(self, status_info):
+        """根据状态信息估计剩余秒数，无法估计时返回 None"""
+        for key in ('eta', 'estimated_time', 'remaining_time'):
+            value = status_info.get(key)
+            if isinstance(value, (int, float)) and value >= 0:
+                return float(value)
+
+        progress = status_info.get('extract_progress') or {}
+        done = progress.get('extracted_pages')
+        total = progress.get('total_pages')
+        if not (isinstance(done, (int, float)) and isinstance(total, (int, float))) or done <= 0 or total <= done:
+            return None
+        elapsed = time.monotonic() - self.started
+        return elapsed / done * (total - done)
+
+    def next_delay(self, status_info=None):
+        """返回距离下一次查询的秒数"""
+        eta = self.estimate_remaining(status_info) if status_info else None
+        if eta is not None:
+            # 预计剩余时间的一半处再查一次，避免过早或过晚
+            delay = min(self.max_interval, max(self.initial, eta / 2))
+        else:
+            delay = self.interval
+            self.interval = min(self.max_interval, self.interval * self.factor)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
 
+
+def wait_for_many(task_ids, api_key, deadline=3600, max_errors=5, check_interval=None, yield_ticks=False,
+                  task_tags=None):
+    """在单个调度循环中轮询多个任务，每轮只查询到期的任务
+
+    Args:
+        task_ids: 任务 ID 列表
+        api_key: API 密钥
+        deadline: 总体超时（秒），超时后未完成的任务以 TimeoutError 结束
+        max_errors: 单个任务连续查询失败的最大次数
+        check_interval: 指定时使用固定轮询间隔，否则使用自适应退避
+        yield_ticks: 每轮结束时额外产出 (None, None, None)，便于调用方处理其它事件
+        task_tags: 可选，{task_id: 标签字典}，查询该任务时附加到 metrics span 上（例如 paper_id）
+
+    Yields:
+        tuple: (task_id, status_info, error)，成功时 error 为 None；
+               status_info['poll_stats'] 记录查询次数、失败次数和耗时
+    """
+    start = time.monotonic()
+    tasks = {}
+    for task_id in task_ids:
+        if check_interval is not None:
+            schedule = PollSchedule(initial=check_interval, factor=1.0, max_interval=check_interval, jitter=0.0)
+        else:
+            schedule = PollSchedule()
+        tasks[task_id] = {"schedule": schedule, "due": start, "polls": 0, "errors": 0}
+
+    print(f"开始轮询 {len(tasks)} 个任务", file=sys.stderr)
+
+    def poll_stats(task):
+        return {
+            "polls": task["polls"],
+            "errors": task["errors"],
+            "wall_time": round(time.monotonic() - start, 3)
+        }
+
+    while tasks:
+        now = time.monotonic()
+        if now - start > deadline:
+            for task_id, task in list(tasks.items()):
+                del tasks[task_id]
+                yield task_id, {"poll_stats": poll_stats(task)}, TimeoutError(f"任务在 {deadline} 秒内未完成")
+            break
+
+        for task_id, task in list(tasks.items()):
+            if task["due"] > now:
+                continue
+
+            task["polls"] += 1
+            try:
+                with metrics.tags(**(task_tags or {}).get(task_id, {})):
+                    status_info = extract_status_info(check_task_status(task_id, api_key))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                task["errors"] += 1
+                if task["errors"] >= max_errors:
+                    del tasks[task_id]
+                    yield task_id, {"poll_stats": poll_stats(task)}, e
+                    continue
+                task["due"] = time.monotonic() + task["schedule"].next_delay()
+                print(f"轮询 {task_id} 时出错: {e}，稍后重试 ({task['errors']}/{max_errors})", file=sys.stderr)
+                continue
+
+            task["errors"] = 0
+            status = status_info.get('state', '')
             if status == 'done':
-                print("任务已完成", file=sys.stderr)
-                return status_info
+                del tasks[task_id]
+                status_info['poll_stats'] = poll_stats(task)
+                print(f"任务已完成: {task_id} (查询 {task['polls']} 次)", file=sys.stderr)
+                yield task_id, status_info, None
             elif status == 'failed':
-                error_msg = status_info.get('error', 'Unknown error')
-                raise ValueError(f"任务失败: {error_msg}")
+                del tasks[task_id]
+                error_msg = status_info.get('err_msg') or status_info.get('error', 'Unknown error')
+                status_info['poll_stats'] = poll_stats(task)
+                yield task_id, status_info, ValueError(f"任务失败: {error_msg}")
+            else:
+                task["due"] = time.monotonic() + task["schedule"].next_delay(status_info)
+
+        if yield_ticks:
+            yield None, None, None
+
+        if tasks:
+            next_due = min(task["due"] for task in tasks.values())
+            remaining = deadline - (time.monotonic() - start)
+            time.sleep(max(0.0, min(next_due - time.monotonic(), remaining + 0.01)))
+
+
+def wait_for_completion(task_id, api_key, check_interval=None, deadline=3600):
+    """等待任务完成，返回任务结果（包含 poll_stats）
+
+    Args:
+        task_id: 任务 ID
+        api_key: API 密钥
+        check_interval: 指定时使用固定轮询间隔，否则使用自适应退避
+        deadline: 总体超时（秒）
+    """
+    print(f"开始轮询任务状态，task_id: {task_id}", file=sys.stderr)
+    for _, status_info, error in wait_for_many([task_id], api_key, deadline=deadline, check_interval=check_interval):
+        if error:
+            raise error
+        return status_info
+
+
+# ZIP 小于该大小时完全在内存中处理，超过后才落盘一次
+ZIP_SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+# Linux FICLONE ioctl，用于在支持的文件系统（btrfs/xfs）上做 reflink
+FICLONE = 0x40049409
 
-            # 继续轮询
-            print(f"等待 {check_interval} 秒后重新检查...", file=sys.stderr)
-            time.sleep(check_interval)
 
-        except requests.exceptions.RequestException as e:
-            print(f"轮询时出错: {e}，将在 {check_interval} 秒后重试", file=sys.stderr)
-            time.sleep(check_interval)
+def _safe_member_path(name):
+    """返回 ZIP 成员的相对路径，拒绝绝对路径和包含 .. 的路径"""
+    member_path = Path(name)
+    if member_path.is_absolute() or '..' in member_path.parts:
+        return None
+    return member_path
+
+
+def _stream_member(zip_ref, info, dest_path, chunk_size=1 << 20, hasher=None):
+    """将单个 ZIP 成员直接流式写入目标位置（先写同目录临时文件再 rename），返回写入字节数
+
+    hasher 不为 None 时同时用写入的内容更新它。
+    """
+    dest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest_path.with_name(f".{dest_path.name}.{os.getpid()}.tmp")
+    written = 0
+    try:
+        with zip_ref.open(info) as src, open(tmp_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(chunk_size), b''):
+                dst.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                written += len(chunk)
+        os.replace(tmp_path, dest_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return written
+
+
+def _member_sha256(zip_ref, info, chunk_size=1 << 20):
+    """流式计算单个 ZIP 成员的 sha256，不写入磁盘"""
+    h = hashlib.sha256()
+    with zip_ref.open(info) as src:
+        for chunk in iter(lambda: src.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sync_image_members(zip_ref, members, images_dir, known_hashes=None, chunk_size=1 << 20):
+    """按内容哈希将 ZIP 中的图像增量同步到 images_dir
+
+    内容未变的文件保持不动（mtime 不变），有变化的通过 rename 原子替换，
+    ZIP 中已不存在的文件会被删除。大小相同的现有文件先只计算成员哈希进行比较，
+    只有新增或有变化的成员才会写入临时文件。
+
+    Args:
+        zip_ref: 已打开的 ZipFile
+        members: [(ZipInfo, 相对路径)] 列表
+        images_dir: 目标图像目录
+        known_hashes: 已知的 {相对路径: sha256}（来自旧 manifest），避免重新计算现有文件哈希
+        chunk_size: 流式读取块大小
+
+    Returns:
+        tuple: (diff, hashes, written_bytes)
+            diff: {"added": [...], "changed": [...], "removed": [...], "unchanged": [...]}
+            hashes: 同步后每个图像的 {相对路径: sha256}
+            written_bytes: 实际写入磁盘的字节数
+    """
+    known_hashes = known_hashes or {}
+    diff = {"added": [], "changed": [], "removed": [], "unchanged": []}
+    hashes = {}
+    written_bytes = 0
+
+    for info, member_path in members:
+        rel_path = member_path.as_posix()
+        dest_path = images_dir / member_path
+
+        if dest_path.is_file():
+            if dest_path.stat().st_size == info.file_size:
+                digest = _member_sha256(zip_ref, info, chunk_size)
+                old_digest = known_hashes.get(rel_path) or parse_cache.hash_file(dest_path)
+                if old_digest == digest:
+                    hashes[rel_path] = digest
+                    diff["unchanged"].append(rel_path)
+                    continue
+            diff["changed"].append(rel_path)
+        else:
+            diff["added"].append(rel_path)
+
+        h = hashlib.sha256()
+        written_bytes += _stream_member(zip_ref, info, dest_path, chunk_size, h)
+        hashes[rel_path] = h.hexdigest()
+
+    # 删除 ZIP 中已不存在的文件
+    for path in sorted(images_dir.rglob('*'), reverse=True):
+        if path.is_file():
+            rel_path = path.relative_to(images_dir).as_posix()
+            if rel_path not in hashes:
+                path.unlink()
+                diff["removed"].append(rel_path)
+        elif path.is_dir() and not any(path.iterdir()):
+            path.rmdir()
+
+    return diff, hashes, written_bytes
+
+
+def link_or_copy(src, dst):
+    """优先硬链接，其次 reflink，最后才复制文件
+
+    Returns:
+        str: 实际使用的方式（hardlink / reflink / copy）
+    """
+    src, dst = Path(src), Path(dst)
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if dst.exists() or dst.is_symlink():
+        dst.unlink()
+
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except OSError:
+        pass
+
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return 'reflink'
+    except (ImportError, OSError):
+        if dst.exists():
+            dst.unlink()
+
+    shutil.copy2(src, dst)
+    return 'copy'
 
 
 def download_and_extract_zip(full_zip_url, api_key, pdf_url=None, output_dir=None, save_content=True):
-    """下载 ZIP 文件并提取 Markdown 内容和图像路径
+    """下载 ZIP 文件并将 Markdown 和图像直接写入备份目录
+
+    ZIP 先缓存在内存中（过大时才落盘），然后读取中央目录，只把 .md 和图像成员
+    流式写入最终的备份位置，不再整体解压到临时目录。指定 output_dir 时通过
+    硬链接/reflink 导出，无法链接时才复制。
 
     Args:
         full_zip_url: ZIP 文件下载 URL
@@ -139,15 +560,14 @@ def download_and_extract_zip(full_zip_url, api_key, pdf_url=None, output_dir=Non
         save_content: 是否保存内容到文件
 
     Returns:
-        tuple: (markdown_content, image_paths) 其中 image_paths 是图像文件路径列表
+        dict: 论文路径信息、markdown 内容以及 io_stats（下载/写入字节数、链接/复制文件数）
     """
     headers = {
         "Authorization": f"Bearer {api_key}"
     }
 
     # 获取skill根目录，创建备份文件夹
-    skill_root = Path(__file__).parent.parent
-    backup_base_dir = skill_root / 'backup'
+    backup_base_dir = parse_cache.get_backup_base_dir()
     backup_base_dir.mkdir(parents=True, exist_ok=True)
 
     # 为每篇论文创建独立的备份文件夹
@@ -162,204 +582,519 @@ def download_and_extract_zip(full_zip_url, api_key, pdf_url=None, output_dir=Non
     backup_dir.mkdir(parents=True, exist_ok=True)
     print(f"论文备份目录: {backup_dir} (ID: {paper_id})", file=sys.stderr)
 
-    import shutil
-
-    with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp_zip:
-        tmp_zip_path = tmp_zip.name
+    io_stats = {"downloaded_bytes": 0, "written_bytes": 0}
 
-    try:
+    with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE) as zip_buffer:
         print(f"正在下载解析结果: {full_zip_url}", file=sys.stderr)
-        response = requests.get(full_zip_url, headers=headers, stream=True)
-        response.raise_for_status()
+        with metrics.tags(paper_id=paper_id), metrics.span('mineru.download') as span:
+            response = http_client.get_session('download').get(full_zip_url, headers=headers, stream=True,
+                                                                timeout=300)
+            span.response(response, 0)
+            response.raise_for_status()
+
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                zip_buffer.write(chunk)
+                io_stats["downloaded_bytes"] += len(chunk)
+            span.set(bytes_down=io_stats["downloaded_bytes"])
+        zip_buffer.seek(0)
+
+        print("正在读取 ZIP 中央目录...", file=sys.stderr)
+        with zipfile.ZipFile(zip_buffer, 'r') as zip_ref:
+            md_member = None
+            image_members = []
+            for info in zip_ref.infolist():
+                if info.is_dir():
+                    continue
+                member_path = _safe_member_path(info.filename)
+                if member_path is None:
+                    print(f"跳过不安全的 ZIP 成员: {info.filename}", file=sys.stderr)
+                    continue
+                suffix = member_path.suffix.lower()
+                if suffix == '.md' and md_member is None:
+                    md_member = info
+                elif suffix in parse_cache.IMAGE_EXTENSIONS:
+                    image_members.append((info, member_path))
+
+            if md_member is None:
+                raise ValueError("ZIP 文件中未找到 Markdown 文件")
+
+            print(f"找到 Markdown 文件: {md_member.filename}", file=sys.stderr)
+            print(f"找到 {len(image_members)} 个图像文件", file=sys.stderr)
+
+            # 创建论文专用的 images 目录
+            backup_images_dir = backup_dir / 'images'
+            backup_images_dir.mkdir(parents=True, exist_ok=True)
+
+            # 图像成员按内容哈希增量同步到备份目录（保持 ZIP 内的相对路径）
+            old_manifest = parse_cache.load_manifest(backup_dir) or {}
+            known_hashes = {
+                e["path"][len('images/'):]: e["sha256"]
+                for e in old_manifest.get("files", [])
+                if e["path"].startswith('images/')
+            }
+            image_diff, image_hashes, written = sync_image_members(
+                zip_ref, image_members, backup_images_dir, known_hashes)
+            io_stats["written_bytes"] += written
+            image_paths = [str(member_path) for _, member_path in image_members]
+
+            # markdown 成员写入 paper.md，同时保留内容供直接返回
+            backup_md_file = backup_dir / 'paper.md'
+            io_stats["written_bytes"] += _stream_member(zip_ref, md_member, backup_md_file)
+            with open(backup_md_file, 'r', encoding='utf-8') as f:
+                markdown_content = f.read()
+
+    catalog.update('record_parse', paper_id, pdf_url or full_zip_url, markdown_content, len(image_paths))
+    search_index.update('index_markdown', paper_id, markdown_content)
+    print(f"已备份论文 {paper_id} 到: {backup_dir}", file=sys.stderr)
+    print(f"- Markdown: {backup_md_file}", file=sys.stderr)
+    print(f"- 图像: {backup_images_dir} ({len(image_paths)} 个文件)", file=sys.stderr)
+    print(f"- 下载 {io_stats['downloaded_bytes']} 字节，写入 {io_stats['written_bytes']} 字节", file=sys.stderr)
+    print(f"- 图像同步: 新增 {len(image_diff['added'])}，变化 {len(image_diff['changed'])}，"
+          f"删除 {len(image_diff['removed'])}，未变 {len(image_diff['unchanged'])}", file=sys.stderr)
+
+    result = {
+        "paper_id": paper_id,
+        "backup_markdown": str(backup_md_file),
+        "backup_images_dir": str(backup_images_dir),
+        "backup_dir": str(backup_dir),  # 添加论文备份目录路径
+        "image_files": [str(backup_images_dir / p) for p in image_paths],
+        "markdown_content": markdown_content,
+        "image_paths": image_paths,
+        "image_hashes": image_hashes,
+        "image_diff": image_diff,
+        "io_stats": io_stats
+    }
 
-        # 写入临时文件
-        with open(tmp_zip_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-
-        # 解压 ZIP 文件
-        print("正在解压 ZIP 文件...", file=sys.stderr)
-        with zipfile.ZipFile(tmp_zip_path, 'r') as zip_ref:
-            # 提取到临时目录
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                zip_ref.extractall(tmp_dir)
-
-                # 查找 Markdown 文件
-                md_files = list(Path(tmp_dir).rglob('*.md'))
-                if not md_files:
-                    raise ValueError("ZIP 文件中未找到 Markdown 文件")
-
-                # 通常是主要的 markdown 文件
-                md_file = md_files[0]
-                print(f"找到 Markdown 文件: {md_file}", file=sys.stderr)
-
-                # 查找所有图像文件
-                image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'}
-                image_files = [
-                    img for img in Path(tmp_dir).rglob('*')
-                    if img.is_file() and img.suffix.lower() in image_extensions
-                ]
-
-                print(f"找到 {len(image_files)} 个图像文件", file=sys.stderr)
-
-                # 创建论文专用的 images 目录
-                backup_images_dir = backup_dir / 'images'
-                backup_images_dir.mkdir(parents=True, exist_ok=True)
-
-                # 清空该论文的备份图像目录
-                if backup_images_dir.exists():
-                    for item in backup_images_dir.iterdir():
-                        if item.is_file():
-                            item.unlink()
-                        elif item.is_dir():
-                            shutil.rmtree(item)
-
-                # 复制图像文件到备份目录
-                for img_file in image_files:
-                    relative_path = img_file.relative_to(tmp_dir)
-                    dest_path = backup_images_dir / relative_path
-                    dest_path.parent.mkdir(parents=True, exist_ok=True)
-                    shutil.copy2(img_file, dest_path)
-
-                # 复制md文件到备份文件夹
-                backup_md_file = backup_dir / 'paper.md'
-                shutil.copy2(md_file, backup_md_file)
-
-                print(f"已备份论文 {paper_id} 到: {backup_dir}", file=sys.stderr)
-                print(f"- Markdown: {backup_md_file}", file=sys.stderr)
-                print(f"- 图像: {backup_images_dir} ({len(image_files)} 个文件)", file=sys.stderr)
-
-                # 从备份文件夹读取 markdown 内容
-                with open(backup_md_file, 'r', encoding='utf-8') as f:
-                    markdown_content = f.read()
-
-                # 获取图像相对于备份目录的路径列表
-                image_paths = [
-                    str(img.relative_to(backup_images_dir))
-                    for img in backup_images_dir.rglob('*')
-                    if img.is_file() and img.suffix.lower() in image_extensions
-                ]
-
-                # 如果指定了输出目录，保存内容
-                if output_dir and save_content:
-                    output_path = Path(output_dir)
-                    output_path.mkdir(parents=True, exist_ok=True)
-
-                    # 从备份目录复制到输出目录
-                    md_output_path = output_path / 'paper.md'
-                    shutil.copy2(backup_md_file, md_output_path)
-
-                    # 复制图像目录
-                    images_dir = output_path / 'images'
-                    shutil.rmtree(images_dir) if images_dir.exists() else None
-                    shutil.copytree(backup_images_dir, images_dir)
-
-                    saved_image_paths = [
-                        str(images_dir / rel_path)
-                        for rel_path in image_paths
-                    ]
-
-                    print(f"已将内容保存到: {output_path}", file=sys.stderr)
-                    print(f"- Markdown: {md_output_path}", file=sys.stderr)
-                    print(f"- 图像: {images_dir} ({len(saved_image_paths)} 个文件)", file=sys.stderr)
-
-                    # 返回保存的路径信息
-                    return {
-                        "paper_id": paper_id,
-                        "markdown_file": str(md_output_path),
-                        "images_dir": str(images_dir),
-                        "image_files": saved_image_paths,
-                        "backup_markdown": str(backup_md_file),
-                        "backup_images_dir": str(backup_images_dir),
-                        "backup_dir": str(backup_dir),  # 添加论文备份目录路径
-                        "markdown_content": markdown_content  # 同时保留内容供直接使用
-                    }
-
-                # 返回备份路径信息和内容
-                return {
-                    "paper_id": paper_id,
-                    "backup_markdown": str(backup_md_file),
-                    "backup_images_dir": str(backup_images_dir),
-                    "backup_dir": str(backup_dir),  # 添加论文备份目录路径
-                    "image_files": [str(backup_images_dir / p) for p in image_paths],
-                    "markdown_content": markdown_content,
-                    "image_paths": image_paths
-                }
+    # 如果指定了输出目录，保存内容
+    if output_dir and save_content:
+        return export_to_output_dir(result, output_dir)
 
-    finally:
-        # 清理临时文件
-        if os.path.exists(tmp_zip_path):
-            os.unlink(tmp_zip_path)
+    # 返回备份路径信息和内容
+    return result
+
+
+def export_to_output_dir(result, output_dir):
+    """将备份目录中的 paper.md 和 images/ 导出到指定输出目录
 
+    同一文件系统上使用硬链接（或 reflink），不额外占用磁盘写入。
 
-def parse_pdf(pdf_url, api_key, output_dir=None):
+    Args:
+        result: download_and_extract_zip 或缓存命中返回的结果字典
+        output_dir: 输出目录
+
+    Returns:
+        dict: 包含输出目录文件路径信息的结果字典
+    """
+    backup_md_file = Path(result['backup_markdown'])
+    backup_images_dir = Path(result['backup_images_dir'])
+    image_paths = result['image_paths']
+
+    output_path = Path(output_dir)
+    output_path.mkdir(parents=True, exist_ok=True)
+    io_stats = dict(result.get('io_stats') or {})
+    link_counts = {}
+
+    def export_file(src, dst):
+        mode = link_or_copy(src, dst)
+        link_counts[mode] = link_counts.get(mode, 0) + 1
+        if mode == 'copy':
+            io_stats['written_bytes'] = io_stats.get('written_bytes', 0) + Path(dst).stat().st_size
+
+    # 从备份目录导出到输出目录
+    md_output_path = output_path / 'paper.md'
+    export_file(backup_md_file, md_output_path)
+
+    # 导出图像目录
+    images_dir = output_path / 'images'
+    shutil.rmtree(images_dir) if images_dir.exists() else None
+    images_dir.mkdir(parents=True)
+    for rel_path in image_paths:
+        export_file(backup_images_dir / rel_path, images_dir / rel_path)
+
+    saved_image_paths = [
+        str(images_dir / rel_path)
+        for rel_path in image_paths
+    ]
+    io_stats['exported_files'] = link_counts
+
+    print(f"已将内容保存到: {output_path}", file=sys.stderr)
+    print(f"- Markdown: {md_output_path}", file=sys.stderr)
+    print(f"- 图像: {images_dir} ({len(saved_image_paths)} 个文件)", file=sys.stderr)
+    print(f"- 导出方式: {link_counts}", file=sys.stderr)
+
+    # 返回保存的路径信息
+    exported = {
+        "paper_id": result['paper_id'],
+        "markdown_file": str(md_output_path),
+        "images_dir": str(images_dir),
+        "image_files": saved_image_paths,
+        "backup_markdown": result['backup_markdown'],
+        "backup_images_dir": result['backup_images_dir'],
+        "backup_dir": result['backup_dir'],  # 添加论文备份目录路径
+        "markdown_content": result['markdown_content'],  # 同时保留内容供直接使用
+        "io_stats": io_stats
+    }
+    for key in ('image_hashes', 'image_diff', 'cached'):
+        if key in result:
+            exported[key] = result[key]
+    return exported
+
+
+def parse_pdf(pdf_url, api_key, output_dir=None, refresh=False, cache_ttl=None, cache_max_bytes=None,
+              poll_deadline=3600, source=None):
     """调用 MinerU API 解析 PDF（支持异步任务）
 
+    若 backup/{paper_id}/manifest.json 校验通过，直接返回缓存结果，不发起任何网络请求。
+
     Args:
-        pdf_url: PDF 文件 URL
+        pdf_url: PDF 文件 URL、本地 PDF 路径或 arXiv 标识（见 resolve_source）
         api_key: API 密钥
         output_dir: 可选，保存文件的目录
+        refresh: 忽略缓存，强制重新解析
+        cache_ttl: 缓存有效期（秒），为 None 时不过期
+        cache_max_bytes: backup/ 总大小上限（字节），超出后按 LRU 淘汰
+        poll_deadline: 等待 MinerU 任务完成的总体超时（秒）
+        source: 可选，调用方已经用 resolve_source 得到的结果；提供时不再重复计算本地文件哈希、查询 arXiv 版本
 
     Returns:
-        如果指定了 output_dir，返回字典包含文件路径信息
-        否则返回 tuple: (markdown_content, image_paths)
+        dict: 论文路径信息和 markdown 内容；指定 output_dir 时包含输出目录中的文件路径，
+              重新解析时包含 poll_stats（查询次数和耗时）
     """
-    # 1. 提交任务
-    task_id = submit_task(pdf_url, api_key)
+    source = source or resolve_source(pdf_url)
+    key = source["key"]
+
+    # 0. 查找缓存
+    if not refresh:
+        cached = lookup_cached(key, output_dir, cache_ttl)
+        if cached:
+            cached["source"] = describe_source(source)
+            catalog.update('record_source', cached['paper_id'], source)
+            return cached
+
+    with metrics.tags(paper_id=get_paper_id(key)):
+        # 1. 提交任务（本地文件先上传）
+        task_id = submit_source(source, api_key)
+
+        # 2. 等待任务完成（自适应轮询）
+        task_result = wait_for_completion(task_id, api_key, deadline=poll_deadline)
+
+        # 3. 下载并提取结果，写入 manifest
+        result = finish_task(key, task_result, api_key, output_dir)
+    result["source"] = describe_source(source)
+    catalog.update('record_source', result['paper_id'], source)
+
+    # 4. 按需淘汰旧缓存
+    if cache_ttl is not None or cache_max_bytes is not None:
+        evicted = parse_cache.evict(max_bytes=cache_max_bytes, ttl=cache_ttl, keep=(result['paper_id'],))
+        catalog.update('remove', evicted)
+        search_index.update('remove', evicted)
+        image_dedup.update('remove', evicted)
+
+    return result
 
-    # 2. 等待任务完成（每30秒检查一次）
-    task_result = wait_for_completion(task_id, api_key, check_interval=30)
 
-    # 3. 下载并提取结果
+def describe_source(source):
+    """resolve_source 结果中可以写入 JSON 输出的字段"""
+    return {k: (str(v) if isinstance(v, Path) else v) for k, v in source.items() if v is not None}
+
+
+def lookup_cached(pdf_url, output_dir=None, cache_ttl=None):
+    """查找 pdf_url 对应的解析缓存，命中时返回结果（必要时复制到 output_dir），否则返回 None"""
+    backup_dir = parse_cache.get_backup_base_dir() / get_paper_id(pdf_url)
+    cached = parse_cache.lookup(backup_dir, model_version=MODEL_VERSION, ttl=cache_ttl)
+    if cached and output_dir:
+        return export_to_output_dir(cached, output_dir)
+    return cached
+
+
+def finish_task(pdf_url, task_result, api_key, output_dir=None):
+    """下载已完成任务的 ZIP，提取到备份目录并写入 manifest"""
     full_zip_url = task_result.get('full_zip_url')
     if not full_zip_url:
         raise ValueError("任务结果中未找到 full_zip_url")
 
     result = download_and_extract_zip(full_zip_url, api_key, pdf_url, output_dir)
-
+    if 'poll_stats' in task_result:
+        result['poll_stats'] = task_result['poll_stats']
+
+    backup_dir = Path(result['backup_dir'])
+    known_hashes = {f"images/{p}": h for p, h in result.get('image_hashes', {}).items()}
+    manifest = parse_cache.build_manifest(backup_dir, pdf_url, MODEL_VERSION, known_hashes=known_hashes)
+    # 记录最近一次图像同步的差异，供 analyze_images.py --only-changed 使用
+    manifest["image_sync"] = result.get('image_diff')
+    parse_cache.write_manifest(backup_dir, manifest)
+    catalog.update('upsert', backup_dir.name, content_hash=manifest.get("content_hash"),
+                   total_size=manifest["total_size"])
+
+    # 其它来源（镜像、不同 URL）已经解析出完全相同的内容时，合并为同一条目
+    if manifest.get("content_hash"):
+        canonical_id = paper_identity.register_content(backup_dir.name, manifest["content_hash"])
+        if canonical_id != backup_dir.name:
+            existing = parse_cache.lookup(backup_dir.parent / canonical_id, model_version=MODEL_VERSION)
+            if existing:
+                print(f"解析内容与已有论文 {canonical_id} 相同，合并为同一条目", file=sys.stderr)
+                paper_identity.merge_into(backup_dir.name, canonical_id)
+                shutil.rmtree(backup_dir, ignore_errors=True)
+                catalog.update('remove', [backup_dir.name])
+                search_index.update('remove', [backup_dir.name])
+                image_dedup.update('remove', [backup_dir.name])
+                if output_dir:
+                    existing = export_to_output_dir(existing, output_dir)
+                for key in ('poll_stats', 'io_stats'):
+                    if key in result:
+                        existing[key] = result[key]
+                existing["merged_from"] = backup_dir.name
+                return existing
     return result
 
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python parser.py <PDF_URL> [OUTPUT_DIR]", file=sys.stderr)
-        print("Example: python parser.py https://arxiv.org/pdf/2602.12852v1 /tmp/paper_output", file=sys.stderr)
-        sys.exit(1)
+def parse_many(pdf_urls, api_key, output_dir=None, refresh=False, max_workers=4, check_interval=None,
+               cache_ttl=None, cache_max_bytes=None, poll_deadline=3600):
+    """批量解析多个 PDF URL
+
+    先一次性提交所有任务，再由单个调度循环轮询全部未完成的任务；
+    已完成的任务交给线程池并发下载和解压。单个任务失败不会中断整个批次。
+
+    Args:
+        pdf_urls: PDF URL、本地 PDF 路径或 arXiv 标识的列表
+        api_key: API 密钥
+        output_dir: 可选，每篇论文保存到 output_dir/{paper_id}
+        refresh: 忽略缓存，强制重新解析
+        max_workers: 并发下载/解压的最大线程数
+        check_interval: 固定轮询间隔（秒），默认使用自适应退避
+        cache_ttl: 缓存有效期（秒）
+        cache_max_bytes: backup/ 总大小上限（字节）
+        poll_deadline: 等待全部任务完成的总体超时（秒）
+
+    Yields:
+        dict: 每个输入产出一条结果，包含 pdf_url、status（ok/error/duplicate）以及 result 或 error；
+              与前面的输入是同一篇论文时 status 为 duplicate，带 duplicate_of（首次出现的输入）和 paper_id
+    """
+    def paper_output_dir(key):
+        return str(Path(output_dir) / get_paper_id(key)) if output_dir else None
+
+    # 规范化输入；同一篇论文只处理一次，避免并发写入同一个备份目录
+    sources = {}
+    seen_ids = {}
+    for pdf_url in pdf_urls:
+        try:
+            source = resolve_source(pdf_url)
+        except Exception as e:
+            yield {"pdf_url": pdf_url, "status": "error", "error": str(e)}
+            continue
+        paper_id = get_paper_id(source["key"])
+        if paper_id in seen_ids:
+            yield {"pdf_url": pdf_url, "status": "duplicate", "duplicate_of": seen_ids[paper_id],
+                   "paper_id": paper_id}
+            continue
+        seen_ids[paper_id] = pdf_url
+        sources[pdf_url] = source
+
+    # 1. 命中缓存的直接返回，其余一次性提交
+    pending = {}
+    for pdf_url, source in sources.items():
+        key = source["key"]
+        try:
+            if not refresh:
+                cached = lookup_cached(key, paper_output_dir(key), cache_ttl)
+                if cached:
+                    cached["source"] = describe_source(source)
+                    yield {"pdf_url": pdf_url, "status": "ok", "result": cached}
+                    continue
+            with metrics.tags(paper_id=get_paper_id(key)):
+                pending[submit_source(source, api_key)] = pdf_url
+        except Exception as e:
+            yield {"pdf_url": pdf_url, "status": "error", "error": str(e)}
+
+    def finish(pdf_url, status_info):
+        source = sources[pdf_url]
+        with metrics.tags(paper_id=get_paper_id(source["key"])):
+            result = finish_task(source["key"], status_info, api_key, paper_output_dir(source["key"]))
+        result["source"] = describe_source(source)
+        return result
+
+    # 2. 单个调度循环轮询所有任务，完成的交给线程池下载
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        downloads = {}
+
+        def drain(block=False):
+            for future in list(downloads):
+                if not block and not future.done():
+                    continue
+                pdf_url = downloads.pop(future)
+                try:
+                    yield {"pdf_url": pdf_url, "status": "ok", "result": future.result()}
+                except Exception as e:
+                    yield {"pdf_url": pdf_url, "status": "error", "error": str(e)}
+
+        task_tags = {task_id: {"paper_id": get_paper_id(sources[pdf_url]["key"])}
+                     for task_id, pdf_url in pending.items()}
+        for task_id, status_info, error in wait_for_many(list(pending), api_key, deadline=poll_deadline,
+                                                         check_interval=check_interval, yield_ticks=True,
+                                                         task_tags=task_tags):
+            if task_id is not None:
+                pdf_url = pending.pop(task_id)
+                if error:
+                    yield {"pdf_url": pdf_url, "status": "error", "error": str(error),
+                           "poll_stats": status_info.get('poll_stats')}
+                else:
+                    future = executor.submit(finish, pdf_url, status_info)
+                    downloads[future] = pdf_url
+            yield from drain()
+
+        yield from drain(block=True)
+
+    if cache_ttl is not None or cache_max_bytes is not None:
+        evicted = parse_cache.evict(max_bytes=cache_max_bytes, ttl=cache_ttl, keep=tuple(seen_ids))
+        catalog.update('remove', evicted)
+        search_index.update('remove', evicted)
+        image_dedup.update('remove', evicted)
+
+
+def format_output(result, include_markdown=True):
+    """将 parse_pdf 的结果整理为命令行输出的 JSON 结构"""
+    if 'markdown_file' in result:
+        # 已保存到指定输出目录的情况
+        output = {
+            "paper_id": result['paper_id'],
+            "markdown_file": result['markdown_file'],
+            "images_dir": result['images_dir'],
+            "image_files": result['image_files'],
+            "markdown": result['markdown_content'],
+            "paper_dir": result['backup_dir']  # 使用备份目录作为论文目录
+        }
+    else:
+        # 仅保存到 backup 目录的情况
+        output = {
+            "paper_id": result['paper_id'],
+            "markdown": result['markdown_content'],
+            "images": result.get('image_files', []),
+            "paper_dir": result['backup_dir']  # 使用备份目录作为论文目录
+        }
+
+    if 'source' in result:
+        output['source'] = result['source']
+    if 'poll_stats' in result:
+        output['poll_stats'] = result['poll_stats']
+    if 'io_stats' in result:
+        output['io_stats'] = result['io_stats']
+    if 'image_diff' in result:
+        output['image_diff'] = {k: v for k, v in result['image_diff'].items() if k != 'unchanged'}
+    if not include_markdown:
+        del output['markdown']
+    return output
+
+
+def format_summary(result):
+    """--summary 模式的输出：路径、大小、章节目录（行号和字节偏移）和图像数量，不包含 markdown 正文
+
+    需要某一节的内容时用 paper_reader.PaperReader 按章节或行号读取。
+    """
+    output = {"paper_id": result['paper_id'], "paper_dir": result['backup_dir']}
+    output.update(paper_reader.summarize(result['backup_dir']))
+    if 'markdown_file' in result:
+        # 已导出到输出目录时给出导出后的路径
+        output["markdown_file"] = result['markdown_file']
+        output["images_dir"] = result['images_dir']
+    for key in ('source', 'cached', 'merged_from', 'poll_stats', 'io_stats'):
+        if key in result:
+            output[key] = result[key]
+    if 'image_diff' in result:
+        output['image_diff'] = {k: len(v) for k, v in result['image_diff'].items()}
+    return output
+
+
+def read_url_list(path):
+    """读取 URL 列表文件（每行一个 URL，忽略空行和 # 注释），path 为 '-' 时从 stdin 读取"""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def print_connection_stats():
+    """在 stderr 输出各端点的连接复用情况"""
+    for endpoint, stats in http_client.connection_stats().items():
+        print(f"HTTP 连接 [{endpoint}]: 新建 {stats['connections']} 个，请求 {stats['requests']} 次，"
+              f"复用 {stats['reused']} 次", file=sys.stderr)
 
-    pdf_url = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else None
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='MinerU PDF 解析工具',
+        epilog='Example: python parser.py https://arxiv.org/pdf/2602.12852v1 /tmp/paper_output'
+    )
+    parser.add_argument('pdf_url', metavar='PDF_URL', nargs='?', default=None,
+                        help='PDF 文件 URL、本地 PDF 路径或 arXiv 标识（如 2602.12852v1）')
+    parser.add_argument('output_dir', metavar='OUTPUT_DIR', nargs='?', default=None, help='可选，保存文件的目录')
+    parser.add_argument('--refresh', action='store_true', help='忽略缓存，强制重新解析')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='缓存有效期（天），过期后重新解析并参与淘汰')
+    parser.add_argument('--cache-max-size', type=float, default=None, help='backup 目录总大小上限（MB），超出后按 LRU 淘汰')
+    parser.add_argument('--poll-deadline', type=float, default=3600, help='等待 MinerU 任务完成的总体超时（秒，默认：3600）')
+    parser.add_argument('--batch', metavar='URLS_FILE', default=None,
+                        help='批量模式：从文件读取 PDF URL 列表（每行一个，- 表示 stdin），每完成一篇输出一行 JSON')
+    parser.add_argument('--workers', type=int, default=4, help='批量模式下并发下载/解压的线程数，同时决定每个主机的连接池大小（默认：4）')
+    parser.add_argument('--summary', action='store_true',
+                        help='紧凑输出：只给出路径、大小、章节目录（行号和字节偏移）和图像数量，不包含 markdown 正文')
+    parser.add_argument('--metrics', metavar='FILE', default=None,
+                        help='把每次 API 调用的耗时、字节数、状态码和重试次数追加写入 JSONL 文件')
+    parser.add_argument('--metrics-summary', action='store_true', help='结束时在 stderr 输出每篇论文、每个端点的调用汇总表')
+    args = parser.parse_args()
+
+    pdf_url = args.pdf_url
+    output_dir = args.output_dir
+    if args.batch and output_dir is None:
+        # 批量模式下唯一的位置参数是输出目录
+        pdf_url, output_dir = None, pdf_url
+    if not args.batch and not pdf_url:
+        parser.error("需要提供 PDF_URL 或 --batch URLS_FILE")
+    cache_ttl = args.cache_ttl * 86400 if args.cache_ttl is not None else None
+    cache_max_bytes = int(args.cache_max_size * 1024 * 1024) if args.cache_max_size is not None else None
     api_key = read_api_key()
+    metrics.configure(args.metrics)
+
+    if args.batch:
+        http_client.configure_pool_size(args.workers)
+        failed = 0
+        for item in parse_many(read_url_list(args.batch), api_key, output_dir, refresh=args.refresh,
+                               max_workers=args.workers, cache_ttl=cache_ttl, cache_max_bytes=cache_max_bytes,
+                               poll_deadline=args.poll_deadline):
+            if item['status'] == 'ok':
+                line = {"pdf_url": item['pdf_url'], "status": "ok"}
+                line.update(format_summary(item['result']) if args.summary
+                            else format_output(item['result'], include_markdown=False))
+            elif item['status'] == 'duplicate':
+                line = item
+            else:
+                failed += 1
+                line = item
+            print(json.dumps(line, ensure_ascii=False), flush=True)
+        print_connection_stats()
+        if args.metrics_summary:
+            metrics.print_summary()
+        metrics.close()
+        sys.exit(1 if failed else 0)
 
     try:
-        result = parse_pdf(pdf_url, api_key, output_dir)
+        result = parse_pdf(pdf_url, api_key, output_dir, refresh=args.refresh,
+                           cache_ttl=cache_ttl, cache_max_bytes=cache_max_bytes,
+                           poll_deadline=args.poll_deadline)
 
         # 以 JSON 格式输出结果
-        # download_and_extract_zip 总是返回字典
-        paper_id = result.get('paper_id', get_paper_id(pdf_url))
-
-        if 'markdown_file' in result:
-            # 已保存到指定输出目录的情况
-            output = {
-                "paper_id": paper_id,
-                "markdown_file": result['markdown_file'],
-                "images_dir": result['images_dir'],
-                "image_files": result['image_files'],
-                "markdown": result['markdown_content'],
-                "paper_dir": result['backup_dir']  # 使用备份目录作为论文目录
-            }
+        if args.summary:
+            print(json.dumps(format_summary(result), ensure_ascii=False))
         else:
-            # 仅保存到 backup 目录的情况
-            output = {
-                "paper_id": paper_id,
-                "markdown": result['markdown_content'],
-                "images": result.get('image_files', []),
-                "paper_dir": result['backup_dir']  # 使用备份目录作为论文目录
-            }
-
-        print(json.dumps(output, ensure_ascii=False, indent=2))
+            print(json.dumps(format_output(result), ensure_ascii=False, indent=2))
+        print_connection_stats()
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    finally:
+        if args.metrics_summary:
+            metrics.print_summary()
+        metrics.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""论文库流水线：解析 → 收集图像 → 图像分析
+
+把 parser.py 和 analyze_images.py 串成三个重叠执行的阶段，各阶段之间用有界队列连接：
+论文 B 还在 MinerU 解析时，论文 A 的图像已经在分析。队列满时上游阶段阻塞等待，
+因此处理很长的论文列表时内存占用保持平稳。
+
+每篇论文的分析结果仍写入 backup/{paper_id}/image_analysis.json（格式与 analyze_images.py 相同），
+并使用同样的进度日志支持中断后续传；每完成一篇论文向 stdout 输出一行 JSON。
+"""
+
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import parser as paper_parser
+import analyze_images
+import http_client
+import parse_cache
+import metrics
+import catalog
+import search_index
+import image_preprocess
+from analysis_cache import AnalysisCache
+from analysis_journal import AnalysisJournal, journal_path_for, replay
+from image_dedup import Deduplicator, DedupIndex, DEFAULT_THRESHOLD as DEDUP_THRESHOLD
+
+# 队列中表示上游已结束的哨兵
+_STOP = object()
+
+
+class PaperJob:
+    """一篇论文在流水线中的状态"""
+
+    def __init__(self, pdf_url: str, parse_result: Dict, markdown_content: str, images: List[Path],
+                 output_path: Path, journal: AnalysisJournal, resumed: Dict[int, Dict]):
+        self.pdf_url = pdf_url
+        self.parse_result = parse_result
+        self.markdown_content = markdown_content
+        self.images = images
+        self.output_path = output_path
+        self.journal = journal
+        self.slots = [None] * len(images)
+        for i, result in resumed.items():
+            self.slots[i - 1] = result
+        self.remaining = len(images) - len(resumed)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+
+class Pipeline:
+    """三阶段流水线
+
+    Args:
+        mineru_api_key: MinerU API key
+        nvidia_api_key: NVIDIA API key
+        model: 视觉模型（见 analyze_images.MODEL_CONFIGS），auto 表示由路由器为每个请求选择模型
+        parse_workers: 同时解析的论文数
+        analyze_workers: 同时分析的图像数
+        queue_size: 各阶段之间队列的容量
+        dedup_threshold: 近似重复图像的最大感知哈希距离，None 表示不去重
+        triage: 调用模型前在本地分诊（见 image_triage.py）
+        nvidia_api_keys: 可选，全部 NVIDIA API key；多个 key 或 model 为 auto 时通过 ModelRouter 分配请求
+        hedge_percentile: 对冲阈值分位数（见 model_router.py），0 表示不对冲
+        其余参数与 parser.parse_pdf / analyze_images.analyze_image 相同
+    """
+
+    def __init__(self, mineru_api_key: str, nvidia_api_key: str, model: str = 'qwen',
+                 parse_workers: int = 2, analyze_workers: int = 4, queue_size: int = 8,
+                 output_dir: Optional[str] = None, refresh: bool = False, poll_deadline: float = 3600,
+                 context_lines: int = 10, context_budget: int = analyze_images.DEFAULT_CONTEXT_BUDGET,
+                 rate_limit: float = 40, image_options: Optional[Dict] = None,
+                 use_cache: bool = True, restart: bool = False, dedup_threshold: Optional[int] = DEDUP_THRESHOLD,
+                 triage: bool = True, nvidia_api_keys: Optional[List[str]] = None,
+                 hedge_percentile: float = analyze_images.HEDGE_PERCENTILE):
+        self.mineru_api_key = mineru_api_key
+        self.nvidia_api_key = nvidia_api_key
+        self.model = model
+        self.parse_workers = max(1, parse_workers)
+        self.analyze_workers = max(1, analyze_workers)
+        self.queue_size = max(1, queue_size)
+        self.output_dir = output_dir
+        self.refresh = refresh
+        self.poll_deadline = poll_deadline
+        self.context_lines = context_lines
+        self.context_budget = context_budget
+        self.image_options = image_options
+        self.restart = restart
+        self.triage = triage
+        self.rate_limiter = analyze_images.RateLimiter(rate=rate_limit / 60, burst=self.analyze_workers)
+        self.router = analyze_images.build_router(model, nvidia_api_keys or [nvidia_api_key], rate_limit,
+                                                  self.analyze_workers, hedge_percentile)
+        self.cache = AnalysisCache() if use_cache else None
+        # 流水线同时处理多篇论文，去重范围始终包含整个论文库
+        self.dedup = Deduplicator(DedupIndex(), threshold=dedup_threshold) if dedup_threshold is not None else None
+
+        self.url_queue = queue.Queue(maxsize=self.queue_size)
+        self.paper_queue = queue.Queue(maxsize=self.queue_size)
+        # 图像队列决定了同时在内存中的论文数，容量与分析并发数相当即可
+        self.image_queue = queue.Queue(maxsize=max(self.queue_size, self.analyze_workers * 2))
+        self.done_queue = queue.Queue()
+        self._parse_alive = self.parse_workers
+        self._analyze_alive = self.analyze_workers
+        self._stage_lock = threading.Lock()
+
+    # ---- 阶段 0：读取 URL 列表 ----
+
+    def _feed(self, pdf_urls: Iterable[str]):
+        # 与 parser.parse_many 相同，按规范化后的来源去重：同一篇论文的不同链接只处理一次，
+        # 避免多个线程同时写入同一个备份目录、进度日志和 image_analysis.json
+        seen = {}
+        try:
+            for pdf_url in pdf_urls:
+                try:
+                    source = paper_parser.resolve_source(pdf_url)
+                    paper_id = paper_parser.get_paper_id(source["key"])
+                except Exception as e:
+                    self.done_queue.put({"pdf_url": pdf_url, "status": "error", "stage": "resolve", "error": str(e)})
+                    continue
+                if paper_id in seen:
+                    self.done_queue.put({"pdf_url": pdf_url, "status": "duplicate", "duplicate_of": seen[paper_id],
+                                         "paper_id": paper_id})
+                    continue
+                seen[paper_id] = pdf_url
+                self.url_queue.put((pdf_url, source, paper_id))
+        finally:
+            for _ in range(self.parse_workers):
+                self.url_queue.put(_STOP)
+
+    # ---- 阶段 1：解析 PDF ----
+
+    def _parse_worker(self):
+        try:
+            while True:
+                item = self.url_queue.get()
+                if item is _STOP:
+                    break
+                pdf_url, source, paper_id = item
+                started = time.monotonic()
+                # 与 parse_many 相同，每篇论文导出到 output_dir/{paper_id}，互不覆盖
+                output_dir = str(Path(self.output_dir) / paper_id) if self.output_dir else None
+                try:
+                    result = paper_parser.parse_pdf(pdf_url, self.mineru_api_key, output_dir, refresh=self.refresh,
+                                                    poll_deadline=self.poll_deadline, source=source)
+                except Exception as e:
+                    self.done_queue.put({"pdf_url": pdf_url, "status": "error", "stage": "parse", "error": str(e)})
+                    continue
+                result["parse_seconds"] = round(time.monotonic() - started, 3)
+                self.paper_queue.put((pdf_url, result))
+        finally:
+            with self._stage_lock:
+                self._parse_alive -= 1
+                last = self._parse_alive == 0
+            if last:
+                self.paper_queue.put(_STOP)
+
+    # ---- 阶段 2：收集图像 ----
+
+    def _collect_worker(self):
+        try:
+            while True:
+                item = self.paper_queue.get()
+                if item is _STOP:
+                    break
+                pdf_url, result = item
+                try:
+                    job = self._open_job(pdf_url, result)
+                except Exception as e:
+                    self.done_queue.put({"pdf_url": pdf_url, "status": "error", "stage": "collect", "error": str(e)})
+                    continue
+                if job.remaining == 0:
+                    self._finish(job)
+                    continue
+                for i, image_path in enumerate(job.images, 1):
+                    if job.slots[i - 1] is None:
+                        # 队列满时在此阻塞，避免提前把后续论文读入内存
+                        self.image_queue.put((job, i, image_path))
+        finally:
+            for _ in range(self.analyze_workers):
+                self.image_queue.put(_STOP)
+
+    def _open_job(self, pdf_url: str, result: Dict) -> PaperJob:
+        paper_dir = Path(result['backup_dir'])
+        markdown_content = result.get('markdown_content')
+        markdown_path, images_dir = analyze_images.find_paper_files(paper_dir)
+        if markdown_content is None:
+            if markdown_path is None:
+                raise FileNotFoundError(f"在 {paper_dir} 中未找到 paper.md 文件")
+            markdown_content = markdown_path.read_text(encoding='utf-8')
+        images = analyze_images.collect_images(images_dir, markdown_content) if images_dir else []
+
+        output_path = paper_dir / 'image_analysis.json'
+        journal_path = journal_path_for(output_path)
+        image_keys = [str(p) for p in images]
+        resumed = {}
+        header = None
+        if not self.restart:
+            header, journaled = replay(journal_path)
+            if header is not None and header.get("model") == self.model and header.get("images") == image_keys:
+                resumed = {i: r for i, r in journaled.items() if "error" not in r and not r.get("incomplete")}
+            else:
+                header = None
+        journal = AnalysisJournal(journal_path, truncate=header is None)
+        if header is None:
+            journal.write_header(self.model, image_keys)
+
+        job = PaperJob(pdf_url, result, markdown_content, images, output_path, journal, resumed)
+        parse_cache.write_json_atomic(output_path, analyze_images.build_output_data(self.model, job.slots))
+        print(f"[{result['paper_id']}] 待分析图像 {job.remaining}/{len(images)}", file=sys.stderr)
+        return job
+
+    # ---- 阶段 3：图像分析 ----
+
+    def _analyze_worker(self):
+        try:
+            while True:
+                item = self.image_queue.get()
+                if item is _STOP:
+                    break
+                job, i, image_path = item
+                try:
+                    with metrics.tags(paper_id=job.parse_result['paper_id']):
+                        analysis = analyze_images.analyze_image(
+                            image_path, job.markdown_content, self.nvidia_api_key, self.model, i, len(job.images),
+                            rate_limiter=self.rate_limiter, cache=self.cache, context_lines=self.context_lines,
+                            image_options=self.image_options, dedup=self.dedup,
+                            triage=self.triage, context_budget=self.context_budget, router=self.router)
+                except Exception as e:
+                    analysis = {
+                        "image_path": str(image_path),
+                        "image_name": image_path.name,
+                        "error": str(e),
+                        "progress": {"current": i, "total": len(job.images)}
+                    }
+                try:
+                    job.journal.write_result(i, analysis)
+                except Exception as e:
+                    # 结果仍然保留在内存中，只是中断后无法从日志续传这一张
+                    print(f"写入进度日志失败 ({job.pdf_url} 第 {i} 张): {e}", file=sys.stderr)
+                with job.lock:
+                    job.slots[i - 1] = analysis
+                    job.remaining -= 1
+                    finished = job.remaining == 0
+                if finished:
+                    self._finish(job)
+        finally:
+            # 无论如何都要登记退出，否则最后一个线程不会发出 _STOP，run() 会一直等待
+            with self._stage_lock:
+                self._analyze_alive -= 1
+                last = self._analyze_alive == 0
+            if last:
+                self.done_queue.put(_STOP)
+
+    def _finish(self, job: PaperJob):
+        """压缩进度日志，生成该论文的 image_analysis.json；失败时产出一条错误结果"""
+        try:
+            self._write_output(job)
+        except Exception as e:
+            self.done_queue.put({"pdf_url": job.pdf_url, "status": "error", "stage": "finish", "error": str(e)})
+        finally:
+            # 释放论文全文，保证内存只与在途论文数相关
+            job.markdown_content = None
+
+    def _write_output(self, job: PaperJob):
+        output_data = analyze_images.build_output_data(self.model, job.slots)
+        parse_cache.write_json_atomic(job.output_path, output_data)
+        catalog.record_analysis(Path(job.parse_result['backup_dir']), output_data)
+        search_index.record_analysis(Path(job.parse_result['backup_dir']), output_data, job.markdown_content)
+        job.journal.remove()
+        self.done_queue.put({
+            "pdf_url": job.pdf_url,
+            "status": "ok",
+            "paper_id": job.parse_result['paper_id'],
+            "paper_dir": job.parse_result['backup_dir'],
+            "analysis_file": str(job.output_path),
+            "total_images": output_data["total_images"],
+            "analyzed_images": output_data["analyzed_images"],
+            "skipped_images": output_data["skipped_images"],
+            "failed_images": output_data["failed_images"],
+            "model_calls_saved": output_data["model_calls_saved"],
+            "models_used": output_data.get("models_used"),
+            "cached": bool(job.parse_result.get('cached')),
+            "parse_seconds": job.parse_result.get('parse_seconds'),
+            "analyze_seconds": round(time.monotonic() - job.started, 3)
+        })
+
+    def run(self, pdf_urls: Iterable[str]) -> Iterator[Dict]:
+        """运行流水线，每完成（或失败）一篇论文产出一个结果字典"""
+        threads = [threading.Thread(target=self._feed, args=(pdf_urls,), daemon=True),
+                   threading.Thread(target=self._collect_worker, daemon=True)]
+        threads += [threading.Thread(target=self._parse_worker, daemon=True) for _ in range(self.parse_workers)]
+        threads += [threading.Thread(target=self._analyze_worker, daemon=True) for _ in range(self.analyze_workers)]
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                item = self.done_queue.get()
+                if item is _STOP:
+                    break
+                yield item
+        finally:
+            if self.cache:
+                self.cache.close()
+            image_preprocess.evict_cache()
+            if self.dedup:
+                self.dedup.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='论文库流水线：解析 PDF 的同时分析已解析论文的图像',
+        epilog='Example: python pipeline.py --batch urls.txt --parse-workers 2 --analyze-workers 4'
+    )
+    parser.add_argument('pdf_urls', metavar='PDF_URL', nargs='*', help='PDF 文件 URL、本地 PDF 路径或 arXiv 标识')
+    parser.add_argument('--batch', metavar='URLS_FILE', default=None,
+                        help='从文件读取 PDF URL 列表（每行一个，- 表示 stdin）')
+    parser.add_argument('--output-dir', default=None, help='可选，同时把每篇论文的解析结果导出到 OUTPUT_DIR/{paper_id}')
+    parser.add_argument('--parse-workers', type=int, default=2, help='同时解析的论文数（默认：2）')
+    parser.add_argument('--analyze-workers', type=int, default=4, help='同时分析的图像数（默认：4）')
+    parser.add_argument('--queue-size', type=int, default=8, help='阶段之间队列的容量（默认：8）')
+    parser.add_argument('--model', type=str, default='qwen', choices=list(analyze_images.MODEL_CONFIGS) + [analyze_images.AUTO_MODEL],
+                        help='使用的视觉模型；auto 表示每个请求发给当前最快的健康模型（默认：qwen）')
+    parser.add_argument('--hedge-percentile', type=float, default=analyze_images.HEDGE_PERCENTILE,
+                        help=f'使用多个模型或 API key 时的对冲阈值分位数（默认：{analyze_images.HEDGE_PERCENTILE}；'
+                             f'0 表示不对冲）')
+    parser.add_argument('--context-lines', type=int, default=10,
+                        help='--context-budget 为 0 时，图像前后的上下文行数（默认：10）')
+    parser.add_argument('--context-budget', type=int, default=analyze_images.DEFAULT_CONTEXT_BUDGET,
+                        help=f'每个图像上下文的 token 预算（默认：{analyze_images.DEFAULT_CONTEXT_BUDGET}；'
+                             f'0 表示使用 --context-lines 的固定窗口）')
+    parser.add_argument('--rate-limit', type=float, default=40, help='每分钟最多发起的模型请求数（默认：40）')
+    parser.add_argument('--refresh', action='store_true', help='忽略解析缓存，强制重新解析')
+    parser.add_argument('--restart', action='store_true', help='丢弃图像分析进度日志，从头分析')
+    parser.add_argument('--poll-deadline', type=float, default=3600, help='等待 MinerU 任务完成的总体超时（秒，默认：3600）')
+    parser.add_argument('--no-cache', action='store_true', help='不读取也不写入分析结果缓存')
+    parser.add_argument('--no-triage', action='store_true', help='关闭本地分诊，所有图像都完整分析')
+    parser.add_argument('--no-dedup', action='store_true', help='不做重复图像检测')
+    parser.add_argument('--dedup-threshold', type=int, default=DEDUP_THRESHOLD,
+                        help=f'近似重复的最大感知哈希汉明距离（默认：{DEDUP_THRESHOLD}）')
+    parser.add_argument('--metrics', metavar='FILE', default=None,
+                        help='把每次 MinerU/NIM 调用的耗时、字节数、状态码、重试次数和 token 用量追加写入 JSONL 文件')
+    parser.add_argument('--metrics-summary', action='store_true', help='结束时在 stderr 输出每篇论文、每个端点的调用汇总表')
+    args = parser.parse_args()
+
+    if args.batch:
+        pdf_urls = paper_parser.read_url_list(args.batch)
+    elif args.pdf_urls:
+        pdf_urls = args.pdf_urls
+    else:
+        parser.error("需要提供 PDF_URL 或 --batch URLS_FILE")
+
+    try:
+        mineru_api_key = paper_parser.read_api_key()
+        nvidia_api_keys = analyze_images.read_nvidia_api_keys()
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    http_client.configure_pool_size(max(args.parse_workers, args.analyze_workers))
+    metrics.configure(args.metrics)
+    pipeline = Pipeline(mineru_api_key, nvidia_api_keys[0], model=args.model,
+                        parse_workers=args.parse_workers, analyze_workers=args.analyze_workers,
+                        queue_size=args.queue_size, output_dir=args.output_dir, refresh=args.refresh,
+                        poll_deadline=args.poll_deadline, context_lines=args.context_lines,
+                        context_budget=args.context_budget,
+                        rate_limit=args.rate_limit, use_cache=not args.no_cache, restart=args.restart,
+                        dedup_threshold=None if args.no_dedup else args.dedup_threshold,
+                        triage=not args.no_triage, nvidia_api_keys=nvidia_api_keys,
+                        hedge_percentile=args.hedge_percentile)
+
+    failed = 0
+    try:
+        for item in pipeline.run(pdf_urls):
+            if item['status'] not in ('ok', 'duplicate'):
+                failed += 1
+            print(json.dumps(item, ensure_ascii=False), flush=True)
+    finally:
+        if pipeline.router:
+            print(f"模型路由: {json.dumps(pipeline.router.stats(), ensure_ascii=False)}", file=sys.stderr)
+        if args.metrics_summary:
+            metrics.print_summary()
+        metrics.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""论文库全文检索
+
+backup/search.sqlite 用 SQLite FTS5 为所有论文的 paper.md 和 image_analysis.json 建立倒排索引。
+paper.md 按 markdown 标题切分为章节，长章节再按段落切分为不超过 CHUNK_CHARS 的块，
+每块记录所属章节和行号区间；每个图像的分析结果作为一个块，挂在图像引用所在的章节和行上。
+查询按 bm25 排序（章节标题命中的权重更高），返回论文 / 章节 / 行号和摘录。
+
+索引是增量维护的：parser.py 解析完成、analyze_images.py 和 pipeline.py 写出分析结果时
+只重建该论文对应部分的块；内容哈希未变化时不做任何写入。
+
+用法：
+    python3 search_index.py query contrastive loss imagenet
+    python3 search_index.py query --raw '"contrastive loss" AND imagenet' --kind figure
+    python3 search_index.py rebuild
+"""
+
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+import parse_cache
+import catalog
+from figure_index import HEADING_RE, get_figure_index
+
+INDEX_FILENAME = 'search.sqlite'
+ANALYSIS_FILENAME = 'image_analysis.json'
+
+# 单个正文块的最大字符数（按段落边界切分，单个超长段落不再拆开）
+CHUNK_CHARS = 1500
+
+# 摘录的长度（词数，每个汉字算一个词）
+SNIPPET_TOKENS = 32
+
+# 块的类型
+SECTION = 'section'
+FIGURE = 'figure'
+
+# bm25 的列权重：章节标题、正文
+SECTION_WEIGHT = 4.0
+TEXT_WEIGHT = 1.0
+
+# unicode61 分词器把连续的汉字/假名当作一个词，索引和查询时在每个字两侧加空格，
+# 中文检索词按逐字短语匹配（"准确率" -> "准 确 率"）
+CJK_RE = re.compile(r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff])')
+CJK_SPACING_RE = re.compile(r'(?<=[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef\[\]]) '
+                            r'(?=[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef\[\]])')
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def segment_cjk(text: str) -> str:
+    return CJK_RE.sub(r' \1 ', text)
+
+
+def unsegment_cjk(text: str) -> str:
+    """去掉 segment_cjk 在汉字之间加入的空格（用于显示摘录）"""
+    return CJK_SPACING_RE.sub('', ' '.join(text.split()))
+
+
+def chunk_markdown(markdown_content: str, max_chars: int = CHUNK_CHARS) -> List[Dict]:
+    """按标题和段落把 markdown 切分为块
+
+    Returns:
+        [{"section": 章节标题, "line_start": 起始行, "line_end": 结束行, "text": 文本}]，行号从 1 开始
+    """
+    chunks = []
+    section = None
+    buffer, start, end = [], None, None
+
+    def flush():
+        nonlocal buffer, start
+        text = '\n'.join(buffer).strip()
+        if text:
+            chunks.append({"section": section, "line_start": start + 1, "line_end": end + 1, "text": text})
+        buffer, start = [], None
+
+    size = 0
+    for i, line in enumerate(markdown_content.split('\n')):
+        heading = HEADING_RE.match(line)
+        if heading:
+            flush()
+            size = 0
+            section = heading.group(2)
+            continue
+        if not line.strip():
+            # 段落边界：块已经够大时在这里切开
+            if size >= max_chars:
+                flush()
+                size = 0
+            continue
+        if start is None:
+            start = i
+        buffer.append(line)
+        end = i
+        size += len(line) + 1
+    flush()
+    return chunks
+
+
+def figure_chunks(analysis_data: Dict, markdown_content: str) -> List[Dict]:
+    """image_analysis.json 中每个成功的分析结果作为一个块，定位到图像引用所在的章节和行"""
+    index = get_figure_index(markdown_content)
+    chunks = []
+    for result in analysis_data.get("results", []):
+        analysis = result.get("analysis")
+        if not analysis or "error" in result:
+            continue
+        name = result.get("image_name") or Path(result.get("image_path", '')).name
+        line = index.image_line(name)
+        chunks.append({
+            "section": index.section_for_line(line) if line is not None else None,
+            "line_start": line + 1 if line is not None else None,
+            "line_end": line + 1 if line is not None else None,
+            "image": name,
+            "text": analysis
+        })
+    return chunks
+
+
+def to_match_query(text: str) -> str:
+    """把普通的检索词转换为 FTS5 查询：每个词加引号（中文词按逐字短语），词之间为 AND"""
+    terms = [' '.join(segment_cjk(t.replace('"', '""')).split()) for t in text.split() if t.strip('"')]
+    return ' '.join(f'"{t}"' for t in terms)
+
+
+class SearchIndex:
+    """基于 SQLite FTS5 的全文索引（线程安全）"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path) if path else parse_cache.get_backup_base_dir() / INDEX_FILENAME
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # 块的元数据放在普通表中（paper_id 有索引，便于按论文删除），rowid 与 FTS 表一致
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                paper_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                section TEXT,
+                line_start INTEGER,
+                line_end INTEGER,
+                image TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_paper ON chunks(paper_id, kind)")
+        self.conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(section, text, tokenize='porter unicode61')")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                paper_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                indexed_at REAL NOT NULL,
+                PRIMARY KEY (paper_id, kind)
+            )
+        """)
+        self.conn.commit()
+
+    def _replace(self, paper_id: str, kind: str, content_hash: str, make_chunks: Callable[[], List[Dict]]) -> bool:
+        """在一个事务中替换论文某一部分的全部块；内容哈希未变化时跳过（不调用 make_chunks）"""
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT content_hash FROM sources WHERE paper_id = ? AND kind = ?",
+                                    (paper_id, kind)).fetchone()
+            if row and row[0] == content_hash:
+                return False
+            self._delete(paper_id, kind)
+            for chunk in make_chunks():
+                rowid = self.conn.execute(
+                    "INSERT INTO chunks (paper_id, kind, section, line_start, line_end, image) VALUES (?, ?, ?, ?, ?, ?)",
+                    (paper_id, kind, chunk["section"], chunk["line_start"], chunk["line_end"],
+                     chunk.get("image"))).lastrowid
+                self.conn.execute("INSERT INTO chunks_fts (rowid, section, text) VALUES (?, ?, ?)",
+                                  (rowid, segment_cjk(chunk["section"] or ''), segment_cjk(chunk["text"])))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sources (paper_id, kind, content_hash, indexed_at) VALUES (?, ?, ?, ?)",
+                (paper_id, kind, content_hash, time.time()))
+        return True
+
+    def _delete(self, paper_id: str, kind: Optional[str] = None) -> None:
+        """删除论文的块（调用方持有锁并处于事务中）"""
+        where, params = "paper_id = ?", [paper_id]
+        if kind:
+            where += " AND kind = ?"
+            params.append(kind)
+        self.conn.execute(f"DELETE FROM chunks_fts WHERE rowid IN (SELECT id FROM chunks WHERE {where})", params)
+        self.conn.execute(f"DELETE FROM chunks WHERE {where}", params)
+        self.conn.execute(f"DELETE FROM sources WHERE {where}", params)
+
+    def index_markdown(self, paper_id: str, markdown_content: str) -> bool:
+        """索引论文正文，返回是否有更新"""
+        return self._replace(paper_id, SECTION, hash_text(markdown_content), lambda: chunk_markdown(markdown_content))
+
+    def index_analysis(self, paper_id: str, analysis_data: Dict, markdown_content: str) -> bool:
+        """索引图像分析结果，返回是否有更新"""
+        chunks = figure_chunks(analysis_data, markdown_content)
+        content_hash = hash_text(json.dumps([(c["image"], c["line_start"], c["text"]) for c in chunks],
+                                            ensure_ascii=False))
+        return self._replace(paper_id, FIGURE, content_hash, lambda: chunks)
+
+    def index_paper_dir(self, paper_dir: Path) -> bool:
+        """索引一个备份目录中的 paper.md 和 image_analysis.json"""
+        paper_dir = Path(paper_dir)
+        try:
+            markdown_content = (paper_dir / 'paper.md').read_text(encoding='utf-8')
+        except OSError:
+            return False
+        changed = self.index_markdown(paper_dir.name, markdown_content)
+        try:
+            with open(paper_dir / ANALYSIS_FILENAME, 'r', encoding='utf-8') as f:
+                analysis_data = json.load(f)
+        except (OSError, ValueError):
+            return changed
+        return self.index_analysis(paper_dir.name, analysis_data, markdown_content) or changed
+
+    def remove(self, paper_ids: Iterable[str]) -> None:
+        with self.lock, self.conn:
+            for paper_id in paper_ids:
+                self._delete(paper_id)
+
+    def search(self, query: str, limit: int = 20, kind: Optional[str] = None, paper_id: Optional[str] = None,
+               raw: bool = False) -> List[Dict]:
+        """全文检索
+
+        Args:
+            query: 检索词（所有词都要出现）；raw 为 True 时按 FTS5 查询语法解释
+            limit: 最多返回的命中数
+            kind: 只检索 section（正文）或 figure（图像分析）
+            paper_id: 只检索某篇论文
+            raw: 直接使用 FTS5 查询语法（短语、OR、NOT、前缀 * 等）
+
+        Returns:
+            按相关度排序的命中：paper_id、kind、section、line_start、line_end、image、score、snippet
+        """
+        match = segment_cjk(query) if raw else to_match_query(query)
+        if not match:
+            return []
+        sql = ("SELECT c.paper_id, c.kind, c.section, c.line_start, c.line_end, c.image, "
+               f"bm25(chunks_fts, {SECTION_WEIGHT}, {TEXT_WEIGHT}) AS score, "
+               f"snippet(chunks_fts, 1, '[', ']', '…', {SNIPPET_TOKENS}) "
+               "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid WHERE chunks_fts MATCH ?")
+        params = [match]
+        if kind:
+            sql += " AND c.kind = ?"
+            params.append(kind)
+        if paper_id:
+            sql += " AND c.paper_id = ?"
+            params.append(paper_id)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        keys = ("paper_id", "kind", "section", "line_start", "line_end", "image", "score", "snippet")
+        hits = [dict(zip(keys, row)) for row in rows]
+        for hit in hits:
+            hit["snippet"] = unsegment_cjk(hit["snippet"])
+        return hits
+
+    def stats(self) -> Dict:
+        with self.lock:
+            papers = self.conn.execute("SELECT COUNT(DISTINCT paper_id) FROM sources").fetchone()[0]
+            by_kind = dict(self.conn.execute("SELECT kind, COUNT(*) FROM chunks GROUP BY kind").fetchall())
+        return {"path": str(self.path), "file_size": self.path.stat().st_size if self.path.exists() else 0,
+                "papers": papers, "chunks": by_kind}
+
+    def rebuild(self, backup_base_dir: Optional[Path] = None) -> int:
+        """清空索引并重新索引 backup/ 中的所有论文
+
+        Returns:
+            索引的论文数
+        """
+        backup_base_dir = Path(backup_base_dir or parse_cache.get_backup_base_dir())
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM chunks_fts")
+            self.conn.execute("DELETE FROM chunks")
+            self.conn.execute("DELETE FROM sources")
+        count = 0
+        for child in sorted(backup_base_dir.iterdir()) if backup_base_dir.is_dir() else []:
+            if child.is_dir() and (child / 'paper.md').is_file():
+                self.index_paper_dir(child)
+                count += 1
+        with self.lock:
+            self.conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('optimize')")
+            self.conn.commit()
+        return count
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
+_indexes: Dict[Path, SearchIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index() -> SearchIndex:
+    """当前 backup 目录的共享索引（随 PAPER_READER_BACKUP_DIR 切换）"""
+    path = parse_cache.get_backup_base_dir() / INDEX_FILENAME
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = SearchIndex(path)
+            _indexes[path] = index
+    return index
+
+
+def update(method: str, *args, **kwargs) -> None:
+    """在共享索引上调用 SearchIndex 的更新方法；索引出错（例如 SQLite 不支持 FTS5）只打印警告"""
+    try:
+        getattr(get_index(), method)(*args, **kwargs)
+    except sqlite3.Error as e:
+        print(f"更新全文索引失败: {e}", file=sys.stderr)
+
+
+def record_analysis(paper_dir: Path, output_data: Dict, markdown_content: str) -> None:
+    """analyze_images.py / pipeline.py 写出分析结果后调用；只索引 backup/ 中的论文"""
+    paper_dir = Path(paper_dir).resolve()
+    if paper_dir.parent != parse_cache.get_backup_base_dir().resolve():
+        return
+    update('index_markdown', paper_dir.name, markdown_content)
+    update('index_analysis', paper_dir.name, output_data, markdown_content)
+
+
+def print_hits(hits: List[Dict], titles: Dict[str, str], file=sys.stdout) -> None:
+    for hit in hits:
+        lines = f"L{hit['line_start']}" if hit["line_start"] else '-'
+        if hit["line_end"] and hit["line_end"] != hit["line_start"]:
+            lines += f"-{hit['line_end']}"
+        where = f"图像 {hit['image']}" if hit["kind"] == FIGURE else "正文"
+        title = titles.get(hit["paper_id"])
+        print(f"{hit['paper_id']}  {lines}  {where}  § {hit['section'] or '-'}" + (f"  《{title}》" if title else ''),
+              file=file)
+        print(f"    {hit['snippet']}", file=file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='论文库全文检索（正文章节与图像分析）')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    query_parser = sub.add_parser('query', help='检索论文库')
+    query_parser.add_argument('terms', nargs='+', help='检索词（所有词都要出现）')
+    query_parser.add_argument('--raw', action='store_true', help='按 FTS5 查询语法解释检索词（短语、OR、NOT、前缀 *）')
+    query_parser.add_argument('--kind', choices=[SECTION, FIGURE], help='只检索正文（section）或图像分析（figure）')
+    query_parser.add_argument('--paper', help='只检索该 paper_id 的论文')
+    query_parser.add_argument('--limit', type=int, default=20, help='最多返回的命中数（默认：20）')
+    query_parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+
+    index_parser = sub.add_parser('index', help='增量索引指定的论文目录（内容未变化的跳过）')
+    index_parser.add_argument('paper_dirs', nargs='+')
+    sub.add_parser('rebuild', help='清空并重新索引 backup/ 中的所有论文')
+    sub.add_parser('stats', help='索引统计信息')
+    args = parser.parse_args()
+
+    try:
+        index = get_index()
+        if args.command == 'rebuild':
+            started = time.monotonic()
+            count = index.rebuild()
+            print(f"已重建全文索引: {count} 篇论文，耗时 {time.monotonic() - started:.1f} 秒", file=sys.stderr)
+        elif args.command == 'index':
+            for paper_dir in args.paper_dirs:
+                changed = index.index_paper_dir(Path(paper_dir))
+                print(f"{'已更新' if changed else '未变化'}: {paper_dir}", file=sys.stderr)
+        elif args.command == 'stats':
+            print(json.dumps(index.stats(), ensure_ascii=False, indent=2))
+        else:
+            started = time.monotonic()
+            hits = index.search(' '.join(args.terms), limit=args.limit, kind=args.kind, paper_id=args.paper,
+                                raw=args.raw)
+            elapsed = time.monotonic() - started
+            if args.json:
+                print(json.dumps(hits, ensure_ascii=False, indent=2))
+            else:
+                titles = {}
+                for paper_id in {h["paper_id"] for h in hits}:
+                    row = catalog.get_catalog().get(paper_id)
+                    if row and row["title"]:
+                        titles[paper_id] = row["title"]
+                print_hits(hits, titles)
+            print(f"{len(hits)} 条命中，耗时 {elapsed * 1000:.1f} ms", file=sys.stderr)
+    except sqlite3.Error as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+"""测试公共设置：脚本目录和基准测试的替身服务加入 sys.path，每个测试使用独立的 backup 目录"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / 'benchmarks'))
+sys.path.insert(0, str(ROOT / 'scripts'))
+
+
+@pytest.fixture(autouse=True)
+def backup_dir(tmp_path, monkeypatch):
+    path = tmp_path / 'backup'
+    monkeypatch.setenv('PAPER_READER_BACKUP_DIR', str(path))
+    return path
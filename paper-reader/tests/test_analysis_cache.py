@@ -0,0 +1,58 @@
+import time
+
+import analyze_images
+import fixtures
+from analysis_cache import AnalysisCache, hash_config, make_key
+
+
+def test_make_key_depends_on_every_part():
+    parts = ['image', 'context', 'config', 'prompt']
+    key = make_key(*parts)
+    assert make_key(*parts) == key
+    for i in range(len(parts)):
+        changed = list(parts)
+        changed[i] += 'x'
+        assert make_key(*changed) != key
+    assert hash_config({"a": 1, "b": [1, 2]}) == hash_config({"b": [1, 2], "a": 1})
+
+
+def test_analysis_key_is_invalidated_by_inputs(tmp_path, monkeypatch):
+    image = tmp_path / 'a.png'
+    image.write_bytes(fixtures.make_png(32, 32, seed=1))
+    copy = tmp_path / 'copy.png'
+    copy.write_bytes(image.read_bytes())
+
+    def key(path=image, context='ctx', model='qwen', image_options=None, detail='full'):
+        return analyze_images.analysis_cache_key(path, context, model, image_options, detail)[0]
+
+    base = key()
+    # 内容相同的图像（不同路径、不同论文）共用缓存
+    assert key(copy) == base
+    variants = [key(context='other'), key(model='kimi'), key(image_options={"max_edge": 1024}),
+                key(detail=analyze_images.TRIAGE_LIGHT)]
+    assert len({base, *variants}) == len(variants) + 1
+
+    monkeypatch.setattr(analyze_images, 'build_analysis_prompt', lambda context: f"new template {context}")
+    assert key() != base
+
+    image.write_bytes(fixtures.make_png(32, 32, seed=2))
+    assert analyze_images.analysis_cache_key(image, 'ctx', 'qwen')[1] != \
+        analyze_images.analysis_cache_key(copy, 'ctx', 'qwen')[1]
+
+
+def test_cache_round_trip_and_lru_eviction(backup_dir):
+    cache = AnalysisCache()
+    for i in range(3):
+        cache.put(f'k{i}', f'analysis {i}', f'h{i}', 'qwen')
+        time.sleep(0.01)
+    assert cache.get('missing') is None
+    assert cache.get('k0') == 'analysis 0'
+
+    assert cache.evict(max_entries=2) == 1
+    assert cache.get('k1') is None and cache.get('k0') == 'analysis 0'
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["total_hits"] == 2
+
+    assert cache.evict(max_age=3600) == 0
+    assert cache.evict(max_age=0) == 2
+    cache.close()
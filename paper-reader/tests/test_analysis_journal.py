@@ -0,0 +1,20 @@
+from analysis_journal import AnalysisJournal, replay
+
+
+def test_append_after_truncated_line(tmp_path):
+    path = tmp_path / 'image_analysis.journal.jsonl'
+    journal = AnalysisJournal(path, truncate=True)
+    journal.write_header('qwen', ['a.png', 'b.png'])
+    journal.write_result(1, {"analysis": "a"})
+    journal.close()
+    # 模拟写入中途崩溃：最后一行只有一半
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"type": "result", "index": 2, "res')
+
+    journal = AnalysisJournal(path)
+    journal.write_result(2, {"analysis": "b"})
+    journal.close()
+
+    header, results = replay(path)
+    assert header["model"] == 'qwen'
+    assert results == {1: {"analysis": "a"}, 2: {"analysis": "b"}}
@@ -0,0 +1,103 @@
+import json
+import sys
+import threading
+
+import pytest
+
+import analyze_images
+import fixtures
+from analysis_cache import AnalysisCache
+from fake_services import FakeServices, ServiceProfile
+
+MARKDOWN = """# Results
+
+The ablation in Figure 3 compares the three variants.
+
+![](images/fig3a.png)
+![](images/fig3b.png)
+![](images/fig3c.png)
+Figure 3: (a) baseline, (b) baseline again, (c) ours.
+"""
+
+
+@pytest.fixture
+def services(monkeypatch):
+    with FakeServices(mineru=ServiceProfile(), nim=ServiceProfile(seed=1)) as services:
+        monkeypatch.setattr(analyze_images, 'NVIDIA_API_BASE', services.nim_base)
+        monkeypatch.setattr(analyze_images, 'read_nvidia_api_key', lambda: 'key')
+        yield services
+
+
+@pytest.fixture
+def paper_dir(tmp_path):
+    duplicate = fixtures.make_png(64, 48, seed=1)
+    return fixtures.write_paper_dir({
+        'paper.md': MARKDOWN.encode('utf-8'),
+        'images/fig3a.png': duplicate,
+        'images/fig3b.png': duplicate,
+        'images/fig3c.png': fixtures.make_png(64, 48, seed=2),
+    }, tmp_path / 'paper')
+
+
+def run_main(monkeypatch, *argv, timeout=60):
+    """在后台线程中运行 analyze_images.main，超时未结束视为死锁"""
+    monkeypatch.setattr(sys, 'argv', ['analyze_images.py', *argv])
+    thread = threading.Thread(target=analyze_images.main, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "analyze_images.main 没有结束"
+
+
+def test_duplicate_sub_figures_in_one_batch(services, paper_dir, tmp_path, monkeypatch):
+    output = tmp_path / 'analysis.json'
+    run_main(monkeypatch, '--paper-dir', str(paper_dir), '--output', str(output), '--batch-size', '4',
+             '--no-triage', '--no-cache', '--dedup-scope', 'run')
+
+    data = json.loads(output.read_text(encoding='utf-8'))
+    by_name = {r["image_name"]: r for r in data["results"]}
+    assert by_name["fig3b.png"]["duplicate_of"] == by_name["fig3a.png"]["image_path"]
+    assert by_name["fig3b.png"]["dedup"] == {"match": "exact", "distance": 0, "scope": "batch"}
+    assert by_name["fig3b.png"]["analysis"] == by_name["fig3a.png"]["analysis"]
+    assert by_name["fig3a.png"]["batch"]["images"] == ['fig3a.png', 'fig3c.png']
+    assert services.reset_counters().get('nim.chat') == 1
+
+
+def test_batch_results_use_batch_cache_keys(services, paper_dir, backup_dir):
+    images = [paper_dir / 'images' / 'fig3a.png', paper_dir / 'images' / 'fig3c.png']
+    cache = AnalysisCache(backup_dir / 'analysis_cache.sqlite')
+
+    def run():
+        return analyze_images.analyze_image_batch(images, [1, 3], MARKDOWN, 'key', 'qwen', 3, cache=cache)
+
+    first = run()
+    assert all(r["batch"]["size"] == 2 for r in first)
+    assert services.reset_counters().get('nim.chat') == 1
+
+    # 完全相同的批次命中批量缓存
+    second = run()
+    assert all(r.get("cached") for r in second)
+    assert [r["analysis"] for r in second] == [r["analysis"] for r in first]
+    assert not services.reset_counters().get('nim.chat')
+
+    # 批量结果不能以单独请求的键存入：单独分析仍然调用模型
+    single = analyze_images.analyze_image(images[0], MARKDOWN, 'key', 'qwen', 1, 3, cache=cache)
+    assert not single.get("cached")
+    assert services.reset_counters().get('nim.chat') == 1
+    cache.close()
+
+
+def test_context_and_analysis_go_to_stderr_only_when_verbose(services, paper_dir, tmp_path, monkeypatch, capsys):
+    args = ['--paper-dir', str(paper_dir), '--no-triage', '--no-cache', '--no-dedup', '--concurrency', '3']
+    run_main(monkeypatch, *args, '--output', str(tmp_path / 'quiet.json'))
+    out, err = capsys.readouterr()
+    assert out == '' and '分析 =====' not in err
+
+    run_main(monkeypatch, *args, '--output', str(tmp_path / 'verbose.json'), '--verbose', '--restart')
+    out, err = capsys.readouterr()
+    assert out == ''
+    data = json.loads((tmp_path / 'verbose.json').read_text(encoding='utf-8'))
+    for result in data["results"]:
+        name = result["image_name"]
+        block = f"===== {name} 上下文 =====\n"
+        assert err.count(block) == 1
+        assert f"===== {name} 分析 =====\n{result['analysis']}\n" in err
@@ -0,0 +1,68 @@
+import sqlite3
+
+from catalog import Catalog
+
+TITLES = {
+    'a': 'Attention Is All You Need',
+    'b': 'Deep Residual Learning for Image Recognition',
+    'c': '注意力机制综述',
+    'd': '50% Sparse "Transformers"',
+}
+
+
+def make_catalog(path):
+    catalog = Catalog(path)
+    for paper_id, title in TITLES.items():
+        catalog.upsert(paper_id, title=title, parsed_at=0)
+    return catalog
+
+
+def found(catalog, title):
+    return sorted(row["paper_id"] for row in catalog.query(title=title, limit=None))
+
+
+def test_title_lookup_matches_substrings_case_insensitively(tmp_path):
+    catalog = make_catalog(tmp_path / 'catalog.sqlite')
+    assert found(catalog, 'all you need') == ['a']
+    assert found(catalog, 'ATTENTION') == ['a']
+    assert found(catalog, 'ing') == ['b']
+    assert found(catalog, '机制综') == ['c']
+    assert found(catalog, '50% sparse "trans') == ['d']
+    # 少于 3 个字符时退回 LIKE
+    assert found(catalog, 'de') == ['b']
+    assert found(catalog, '注意') == ['c']
+    catalog.close()
+
+
+def test_title_lookup_uses_the_trigram_index(tmp_path):
+    catalog = make_catalog(tmp_path / 'catalog.sqlite')
+    plan = catalog.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM papers WHERE rowid IN "
+        "(SELECT rowid FROM papers_title WHERE papers_title MATCH ?)", ('"residual"',)).fetchall()
+    assert not any(row[-1] == 'SCAN papers' for row in plan)
+    catalog.close()
+
+
+def test_title_index_follows_updates_and_removals(tmp_path):
+    catalog = make_catalog(tmp_path / 'catalog.sqlite')
+    catalog.upsert('a', title='Attention Sinks')
+    catalog.remove(['b'])
+    assert found(catalog, 'you need') == []
+    assert found(catalog, 'sinks') == ['a']
+    assert found(catalog, 'residual') == []
+    assert catalog.rebuild(tmp_path / 'empty') == 0
+    assert found(catalog, 'attention') == []
+    catalog.close()
+
+
+def test_existing_catalog_is_indexed_on_open(tmp_path):
+    path = tmp_path / 'catalog.sqlite'
+    make_catalog(path).close()
+    conn = sqlite3.connect(str(path))
+    conn.executescript("DROP TRIGGER papers_title_insert; DROP TRIGGER papers_title_delete; "
+                       "DROP TRIGGER papers_title_update; DROP TABLE papers_title;")
+    conn.close()
+
+    catalog = Catalog(path)
+    assert found(catalog, 'residual') == ['b']
+    catalog.close()
@@ -0,0 +1,81 @@
+import re
+
+import pytest
+
+from context_builder import build_context
+from figure_index import FigureIndex
+
+FILLER = ' '.join(f'Sentence {i} discusses unrelated details of the training setup.' for i in range(12))
+
+MARKDOWN = f"""# Paper
+
+## Introduction
+
+{FILLER} As Figure 3 shows, the new method converges faster. {FILLER}
+
+## Experiments
+
+We describe the setup before the figure.
+
+![](images/fig3.png)
+Figure 3: Convergence of the three methods.
+
+The curve flattens after 10 epochs.
+
+## Discussion
+
+{FILLER}
+
+Figure 3 also suggests that warmup matters.
+"""
+
+BUDGETS = [20, 40, 60, 80, 200, 1000]
+
+
+@pytest.fixture(scope='module')
+def index():
+    return FigureIndex(MARKDOWN)
+
+
+def line_numbers(context):
+    return {int(m.group(1)) for m in re.finditer(r'^(\d+)\. ', context["text"], re.MULTILINE)}
+
+
+def test_context_stays_within_budget(index):
+    previous = set()
+    for budget in BUDGETS:
+        context = build_context(index, 'fig3.png', budget)
+        assert context["tokens"] <= budget
+        # 预算越大包含的行越多，已选的行不会被挤掉
+        assert previous <= line_numbers(context)
+        previous = line_numbers(context)
+
+
+def test_anchor_is_kept_even_over_budget(index):
+    context = build_context(index, 'fig3.png', 1)
+    assert context["text"] == "11. ![](images/fig3.png)"
+    assert [s["kind"] for s in context["snippets"]] == ['anchor']
+
+
+def test_small_budget_prefers_caption_heading_and_mentions(index):
+    context = build_context(index, 'fig3.png', 40)
+    assert [s["kind"] for s in context["snippets"]] == ['heading', 'anchor', 'caption', 'mention']
+    assert "12. Figure 3: Convergence of the three methods." in context["text"]
+    assert "20. Figure 3 also suggests that warmup matters." in context["text"]
+
+
+def test_long_mention_paragraph_is_trimmed_to_sentence(index):
+    context = build_context(index, 'fig3.png', 60)
+    assert "5. … As Figure 3 shows, the new method converges faster. …" in context["text"]
+    assert 'unrelated' not in context["text"]
+    assert {"kind": 'mention', "lines": [5, 5], "partial": True} in context["snippets"]
+
+    full = build_context(index, 'fig3.png', 1000)
+    assert {"kind": 'mention', "lines": [5, 5], "partial": False} in full["snippets"]
+    assert f"5. {FILLER} As Figure 3 shows" in full["text"]
+
+
+def test_gaps_are_marked_and_missing_images_return_none(index):
+    text = build_context(index, 'fig3.png', 80)["text"].split('\n')
+    assert text[-2:] == ['...', "20. Figure 3 also suggests that warmup matters."]
+    assert build_context(index, 'missing.png', 100) is None
@@ -0,0 +1,32 @@
+from figure_index import FigureIndex
+
+
+def test_stacked_subfigures_share_caption():
+    markdown = "# Results\n\n![](images/a.png)\n![](images/b.png)\n![](images/c.png)\n![](images/d.png)\n\n" \
+               "Figure 3: Four panels.\n"
+    index = FigureIndex(markdown)
+    caption_line = markdown.split('\n').index("Figure 3: Four panels.")
+    for name in ('a.png', 'b.png', 'c.png', 'd.png'):
+        entry = index.lookup(name)
+        assert entry.caption_line == caption_line
+        assert entry.figure_number == '3'
+
+
+def test_blank_separated_subfigures_share_caption():
+    markdown = "![](images/a.png)\n\n![](images/b.png)\n\n![](images/c.png)\n\n![](images/d.png)\n\n" \
+               "Figure 2: Panels separated by blank lines.\n"
+    index = FigureIndex(markdown)
+    assert [index.lookup(n).figure_number for n in ('a.png', 'b.png', 'c.png', 'd.png')] == ['2'] * 4
+
+
+def test_prose_between_image_and_caption_breaks_group():
+    markdown = "![](images/a.png)\n\nSome prose about something else.\n\n![](images/b.png)\n\nFigure 4: Only b.\n"
+    index = FigureIndex(markdown)
+    assert index.lookup('a.png').caption_line is None
+    assert index.lookup('b.png').figure_number == '4'
+
+
+def test_caption_too_far_from_last_image():
+    markdown = "![](images/a.png)\n\n\n\n\nFigure 5: Too far.\n"
+    index = FigureIndex(markdown)
+    assert index.lookup('a.png').caption_line is None
@@ -0,0 +1,88 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_client
+
+
+@pytest.fixture
+def server():
+    """按脚本依次返回状态码的本地 HTTP/1.1 服务（keep-alive），记录收到的请求"""
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def respond(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            self.rfile.read(length)
+            with lock:
+                received.append(self.command)
+                status = statuses.pop(0) if statuses else 200
+            body = b'{}'
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_POST = respond
+
+        def log_message(self, *args):
+            pass
+
+    lock = threading.Lock()
+    statuses, received = [], []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    httpd.statuses, httpd.received = statuses, received
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/"
+    # 其它测试创建的会话里可能已有连接，计数从零开始
+    http_client.close_all()
+    yield httpd
+    http_client.close_all()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_sessions_are_shared_per_endpoint():
+    sessions = []
+    threads = [threading.Thread(target=lambda: sessions.append(http_client.get_session('nim'))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(s) for s in sessions}) == 1
+    assert http_client.get_session('mineru') is not sessions[0]
+    with pytest.raises(ValueError):
+        http_client.get_session('unknown')
+    http_client.close_all()
+
+
+def test_connections_are_reused(server):
+    session = http_client.get_session('mineru')
+    for _ in range(5):
+        assert session.get(server.url, timeout=5).status_code == 200
+    assert http_client.connection_stats()["mineru"] == {"connections": 1, "requests": 5, "reused": 4}
+
+
+def test_get_is_retried_but_post_is_not(server):
+    session = http_client.get_session('mineru')
+    server.statuses[:] = [503]
+    assert session.get(server.url, timeout=5).status_code == 200
+    assert server.received == ['GET', 'GET']
+
+    server.received.clear()
+    server.statuses[:] = [503]
+    assert session.post(server.url, json={}, timeout=5).status_code == 503
+    assert server.received == ['POST']
+
+
+def test_pool_size_change_rebuilds_sessions(server):
+    old = http_client.get_session('download')
+    http_client.configure_pool_size(http_client.DEFAULT_POOL_SIZE + 1)
+    try:
+        new = http_client.get_session('download')
+        assert new is not old
+        assert new.get_adapter(server.url)._pool_maxsize == http_client.DEFAULT_POOL_SIZE + 1
+    finally:
+        http_client.configure_pool_size(http_client.DEFAULT_POOL_SIZE)
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+from pathlib import Path
+
+import fixtures
+import parser as paper_parser
+from fake_services import FakeServices
+from image_dedup import Deduplicator, DedupIndex
+
+
+def test_claims_in_opposite_order_do_not_deadlock(tmp_path):
+    """两个线程各自持有一个认领，再认领对方持有的重复图像时不能互相等待"""
+    paths = {}
+    for name, seed in (('x1', 1), ('x2', 1), ('y1', 2), ('y2', 2)):
+        paths[name] = tmp_path / f'{name}.png'
+        paths[name].write_bytes(fixtures.make_png(32, 32, seed=seed))
+
+    dedup = Deduplicator()
+    claimed = threading.Barrier(2)
+    matches = {}
+
+    def worker(first, second):
+        own, _ = dedup.claim(paths[first], 'qwen')
+        claimed.wait()
+        fingerprint, matches[second] = dedup.claim(paths[second], 'qwen')
+        dedup.release(own, 'qwen', f'analysis of {first}')
+        dedup.release(fingerprint, 'qwen', f'analysis of {second}')
+
+    threads = [threading.Thread(target=worker, args=('x1', 'y2'), daemon=True),
+               threading.Thread(target=worker, args=('y1', 'x2'), daemon=True)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert not any(t.is_alive() for t in threads), "两个线程互相等待"
+    # 持有认领的线程不等待：要么自行分析（None），要么对方已经完成
+    assert set(matches) == {'x2', 'y2'}
+    assert all(m is None or m["analysis"] for m in matches.values())
+
+    # 全部释放后，新的重复图像正常复用
+    _, match = dedup.claim(paths['x2'], 'qwen')
+    assert match["scope"] == 'run' and match["distance"] == 0
+
+
+def test_claim_waits_when_holding_nothing(tmp_path):
+    path = tmp_path / 'a.png'
+    path.write_bytes(fixtures.make_png(32, 32, seed=1))
+    dedup = Deduplicator()
+    own, _ = dedup.claim(path, 'qwen')
+    result = {}
+    waiter = threading.Thread(target=lambda: result.update(match=dedup.claim(path, 'qwen')[1]), daemon=True)
+    waiter.start()
+    waiter.join(0.2)
+    assert waiter.is_alive()
+    dedup.release(own, 'qwen', 'done')
+    waiter.join(10)
+    assert result["match"]["analysis"] == 'done'
+
+
+def test_library_match_disappears_after_eviction(tmp_path, monkeypatch):
+    with FakeServices() as services:
+        monkeypatch.setattr(paper_parser, 'MINERU_API_BASE', services.mineru_base)
+        urls = ['https://example.invalid/a.pdf', 'https://example.invalid/b.pdf']
+        for seed, url in enumerate(urls, 1):
+            services.add_paper(url, fixtures.build_zip(fixtures.build_paper(2, 4, seed=seed)))
+
+        first = paper_parser.parse_pdf(urls[0], 'key')
+        image = Path(first["image_files"][0])
+        copy = tmp_path / 'copy.png'
+        copy.write_bytes(image.read_bytes())
+
+        dedup = Deduplicator(DedupIndex())
+        fingerprint, _ = dedup.claim(image, 'qwen')
+        dedup.release(fingerprint, 'qwen', 'analysis')
+        _, match = Deduplicator(DedupIndex()).claim(copy, 'qwen')
+        assert match["scope"] == 'library' and match["image_path"] == str(image)
+
+        # 解析第二篇论文时按大小上限淘汰第一篇
+        paper_parser.parse_pdf(urls[1], 'key', cache_max_bytes=1)
+        assert not image.exists()
+        _, match = Deduplicator(DedupIndex()).claim(copy, 'qwen')
+        assert match is None
+
+
+def test_old_index_gets_paper_ids(backup_dir):
+    path = backup_dir / 'image_index.sqlite'
+    backup_dir.mkdir(parents=True)
+    conn = sqlite3.connect(str(path))
+    conn.execute("CREATE TABLE figures (id INTEGER PRIMARY KEY, image_hash TEXT NOT NULL, dhash TEXT, "
+                 "model TEXT NOT NULL, image_path TEXT NOT NULL, analysis TEXT NOT NULL, created_at REAL NOT NULL, "
+                 "UNIQUE (image_hash, model))")
+    conn.execute("INSERT INTO figures VALUES (1, 'h', NULL, 'qwen', ?, 'a', 0)",
+                 (str(backup_dir / 'abc' / 'images' / 'x.png'),))
+    conn.commit()
+    conn.close()
+
+    index = DedupIndex(path)
+    assert index.remove(['abc']) == 1
+    index.close()
@@ -0,0 +1,41 @@
+import os
+
+import fixtures
+import image_preprocess
+
+
+def test_encoding_cache_is_evicted_by_least_recent_use(tmp_path, backup_dir):
+    paths = []
+    for seed in range(3):
+        path = tmp_path / f'{seed}.png'
+        path.write_bytes(fixtures.make_png(64, 64, seed=seed))
+        paths.append(path)
+        assert not image_preprocess.prepare_image(path, max_edge=32)["cached"]
+
+    cache_dir = backup_dir / image_preprocess.CACHE_DIRNAME
+    files = sorted(cache_dir.glob('*/*'), key=lambda p: p.stat().st_mtime)
+    assert len(files) == 3
+    for age, path in enumerate(reversed(files)):
+        os.utime(path, (1000 - age, 1000 - age))
+
+    # 命中缓存会刷新使用时间，最早写入的文件变成最近使用的
+    assert image_preprocess.prepare_image(paths[0], max_edge=32)["cached"]
+    sizes = {p: p.stat().st_size for p in files}
+    newest = max(files, key=lambda p: p.stat().st_mtime)
+
+    assert image_preprocess.evict_cache(max_bytes=sizes[newest]) == 2
+    assert list(cache_dir.glob('*/*')) == [newest]
+    assert image_preprocess.prepare_image(paths[0], max_edge=32)["cached"]
+    assert not image_preprocess.prepare_image(paths[1], max_edge=32)["cached"]
+
+
+def test_encoding_cache_age_limit(tmp_path, backup_dir):
+    path = tmp_path / 'a.png'
+    path.write_bytes(fixtures.make_png(64, 64, seed=1))
+    image_preprocess.prepare_image(path, max_edge=32)
+    cached = next((backup_dir / image_preprocess.CACHE_DIRNAME).glob('*/*'))
+
+    assert image_preprocess.evict_cache(max_bytes=None, max_age=3600) == 0
+    os.utime(cached, (0, 0))
+    assert image_preprocess.evict_cache(max_bytes=None, max_age=3600) == 1
+    assert image_preprocess.evict_cache(cache_dir=tmp_path / 'missing') == 0
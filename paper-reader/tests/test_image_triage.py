@@ -0,0 +1,87 @@
+import pytest
+
+import fixtures
+import image_triage
+from figure_index import FigureIndex
+from image_triage import FULL, LIGHT, SKIP, triage_image
+
+Image = pytest.importorskip('PIL.Image')
+ImageDraw = pytest.importorskip('PIL.ImageDraw')
+
+MARKDOWN = """# Paper
+
+![](images/icon.png)
+
+![](images/blank.png)
+
+$$
+L = \\sum_i \\log p(x_i)
+$$
+![](images/equation.png)
+
+Table 1: Results on the benchmark.
+![](images/table.png)
+| Method | Accuracy |
+| --- | --- |
+| Ours | 95.1 |
+
+![](images/small.png)
+
+![](images/lines.png)
+
+![](images/photo.png)
+"""
+
+
+def text_like(width, height, rows):
+    """白底黑字风格的图：若干条黑色横线"""
+    img = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(img)
+    for k in range(rows):
+        y = (k + 1) * height // (rows + 1)
+        draw.line([(10, y), (width - 10, y)], fill='black', width=2)
+    return img
+
+
+@pytest.fixture
+def images(tmp_path):
+    images_dir = tmp_path / 'images'
+    images_dir.mkdir()
+    (images_dir / 'icon.png').write_bytes(fixtures.make_png(24, 24, seed=1))
+    Image.new('RGB', (400, 400), 'white').save(images_dir / 'blank.png')
+    text_like(600, 100, 1).save(images_dir / 'equation.png')
+    text_like(600, 300, 5).save(images_dir / 'table.png')
+    (images_dir / 'small.png').write_bytes(fixtures.make_png(200, 150, seed=2))
+    text_like(800, 600, 12).save(images_dir / 'lines.png')
+    (images_dir / 'photo.png').write_bytes(fixtures.make_png(640, 480, seed=3))
+    return images_dir
+
+
+@pytest.mark.parametrize('name, decision', [
+    ('icon.png', SKIP),
+    ('blank.png', SKIP),
+    ('equation.png', SKIP),
+    ('table.png', SKIP),
+    ('small.png', LIGHT),
+    ('lines.png', LIGHT),
+    ('photo.png', FULL),
+])
+def test_triage_decisions(images, name, decision):
+    result = triage_image(images / name, FigureIndex(MARKDOWN))
+    assert result["decision"] == decision, result
+
+
+def test_screenshots_without_markdown_counterpart_are_analyzed(images):
+    # markdown 中没有对应的 LaTeX 或表格时，公式/表格形状的图不能跳过
+    index = FigureIndex("![](images/equation.png)\n\n![](images/table.png)\n")
+    assert triage_image(images / 'equation.png', index)["decision"] != SKIP
+    assert triage_image(images / 'table.png', index)["decision"] != SKIP
+
+
+def test_nearby_markdown_flags():
+    index = FigureIndex(MARKDOWN)
+    assert image_triage.nearby_markdown(index, 'table.png') == \
+        {"table_nearby": True, "latex_nearby": False, "table_caption": True}
+    assert image_triage.nearby_markdown(index, 'equation.png')["latex_nearby"]
+    assert image_triage.nearby_markdown(index, 'missing.png') == \
+        {"table_nearby": False, "latex_nearby": False, "table_caption": False}
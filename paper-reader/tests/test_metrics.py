@@ -0,0 +1,90 @@
+import io
+import json
+import threading
+
+import pytest
+import requests
+
+import analyze_images
+import fixtures
+import metrics
+from fake_services import FakeServices, ServiceProfile
+
+
+@pytest.fixture
+def sink(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    metrics.reset()
+    metrics.configure(str(path))
+    yield path
+    metrics.close()
+    metrics.reset()
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+
+class FakeResponse:
+    def __init__(self, status, length=0):
+        self.status_code = status
+        self.headers = {'Content-Length': str(length)}
+
+
+def test_spans_are_written_and_summarized_per_paper(sink):
+    with metrics.tags(paper_id='p1'):
+        with metrics.span('nim.chat', bytes_up=100) as span:
+            span.response(FakeResponse(429))
+            span.retry()
+            span.response(FakeResponse(200, 50))
+            span.set(usage={"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15,
+                            "completion_tokens_details": {"reasoning_tokens": 3}})
+        with pytest.raises(requests.HTTPError):
+            with metrics.span('nim.chat'):
+                raise requests.HTTPError("server error", response=FakeResponse(503))
+    with metrics.span('mineru.status', pdf_url='https://example.invalid/a.pdf') as span:
+        span.response(FakeResponse(200, 20))
+
+    first, failed, other = read_records(sink)
+    assert first["paper_id"] == 'p1' and first["status"] == 200 and first["retries"] == 1
+    assert first["bytes_up"] == 100 and first["bytes_down"] == 50
+    assert first["usage"] == {"prompt_tokens": 10, "completion_tokens": 5, "reasoning_tokens": 3, "total_tokens": 15}
+    assert failed["status"] == 503 and failed["error"].startswith('HTTPError')
+    assert "paper_id" not in other
+
+    rows = {(r["paper"], r["endpoint"]): r for r in metrics.summary()}
+    assert set(rows) == {('p1', 'nim.chat'), ('https://example.invalid/a.pdf', 'mineru.status')}
+    chat = rows[('p1', 'nim.chat')]
+    assert (chat["calls"], chat["errors"], chat["retries"]) == (2, 1, 1)
+    assert (chat["prompt_tokens"], chat["completion_tokens"], chat["reasoning_tokens"]) == (10, 5, 3)
+
+    out = io.StringIO()
+    metrics.print_summary(file=out)
+    assert len(out.getvalue().splitlines()) == 4
+
+
+def test_tags_are_per_thread_and_restored():
+    seen = {}
+    with metrics.tags(paper_id='outer'):
+        with metrics.tags(paper_id='inner', stage=None):
+            seen["inner"] = metrics.current_tags()
+        seen["outer"] = metrics.current_tags()
+        thread = threading.Thread(target=lambda: seen.update(thread=metrics.current_tags()))
+        thread.start()
+        thread.join()
+    assert seen == {"inner": {"paper_id": 'inner'}, "outer": {"paper_id": 'outer'}, "thread": {}}
+    assert metrics.current_tags() == {}
+
+
+def test_vision_call_records_tokens_and_bytes(sink, tmp_path, monkeypatch):
+    image = tmp_path / 'fig.png'
+    image.write_bytes(fixtures.make_png(32, 32, seed=1))
+    with FakeServices(nim=ServiceProfile(seed=1)) as services:
+        monkeypatch.setattr(analyze_images, 'NVIDIA_API_BASE', services.nim_base)
+        with metrics.tags(paper_id='p1'):
+            analyze_images.call_vision_model(image, 'context', 'key', 'qwen')
+
+    record, = read_records(sink)
+    assert record["endpoint"] == 'nim.chat' and record["status"] == 200 and record["paper_id"] == 'p1'
+    assert record["image"] == 'fig.png' and record["bytes_up"] > 0 and record["bytes_down"] > 0
+    assert record["usage"]["completion_tokens"] > 0
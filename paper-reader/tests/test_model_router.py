@@ -0,0 +1,154 @@
+import threading
+
+import pytest
+import requests
+
+from model_router import Backend, ModelRouter, is_backend_error
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def make_router(*names, **kwargs):
+    return ModelRouter([Backend(name, 'qwen', f'key-{name}') for name in names], **kwargs)
+
+
+def test_is_backend_error():
+    assert is_backend_error(requests.ConnectionError())
+    assert is_backend_error(requests.Timeout())
+    assert is_backend_error(http_error(503))
+    assert is_backend_error(http_error(429))
+    assert not is_backend_error(http_error(400))
+    assert not is_backend_error(http_error(401))
+    assert not is_backend_error(ValueError("无法解码图像"))
+    # 流中断后包装成其它异常的仍算后端故障
+    try:
+        try:
+            raise requests.exceptions.ChunkedEncodingError()
+        except requests.exceptions.ChunkedEncodingError as e:
+            raise RuntimeError("部分结果") from e
+    except RuntimeError as wrapped:
+        assert is_backend_error(wrapped)
+
+
+def test_failover_to_another_backend():
+    router = make_router('a', 'b', hedge_percentile=0)
+    calls = []
+
+    def fn(backend):
+        calls.append(backend.name)
+        if backend.name == 'a':
+            raise http_error(502)
+        return 'ok'
+
+    result, backend, info = router.call(fn)
+    assert (result, backend.name, info) == ('ok', 'b', {"attempts": 2, "hedged": False})
+    assert calls == ['a', 'b']
+    stats = router.stats()
+    assert stats["failovers"] == 1
+    assert stats["backends"]["a"]["errors"] == 1
+
+
+def test_all_backends_failing_raises_last_error():
+    router = make_router('a', 'b', hedge_percentile=0)
+
+    def fn(backend):
+        raise requests.ConnectionError(backend.name)
+
+    with pytest.raises(requests.ConnectionError):
+        router.call(fn)
+    assert all(b.inflight == 0 for b in router.backends)
+
+
+def test_breaker_opens_after_consecutive_failures():
+    router = make_router('a', hedge_percentile=0, failure_threshold=3, cooldown=60)
+
+    def fail(backend):
+        raise requests.Timeout()
+
+    for _ in range(2):
+        with pytest.raises(requests.Timeout):
+            router.call(fail)
+        assert router.stats()["backends"]["a"]["circuit"] == 'closed'
+    with pytest.raises(requests.Timeout):
+        router.call(fail)
+    assert router.stats()["backends"]["a"]["circuit"] == 'open'
+    assert router.stats()["backends"]["a"]["circuit_opened"] == 1
+
+    # 熔断的后端在有健康后端时不再被选中
+    router.backends.append(Backend('b', 'qwen', 'key-b'))
+    _, backend, _ = router.call(lambda b: b.name)
+    assert backend.name == 'b'
+
+
+def test_local_errors_are_raised_without_failover():
+    router = make_router('a', 'b', hedge_percentile=0, failure_threshold=1)
+    calls = []
+
+    def fn(backend):
+        calls.append(backend.name)
+        raise ValueError("无法解码图像")
+
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            router.call(fn)
+    assert calls == ['a', 'a', 'a']
+
+    def client_error(backend):
+        raise http_error(400)
+
+    with pytest.raises(requests.HTTPError):
+        router.call(client_error)
+    stats = router.stats()
+    assert stats["failovers"] == 0
+    assert all(b["errors"] == 0 and b["circuit"] == 'closed' for b in stats["backends"].values())
+    assert all(b.inflight == 0 for b in router.backends)
+
+
+def test_slow_request_is_hedged():
+    router = make_router('a', 'b', hedge_percentile=90)
+    for backend in router.backends:
+        for _ in range(5):
+            backend.inflight += 1
+            router.record(backend, 'full', 0.01, True)
+    assert router.hedge_delay('full') == pytest.approx(0.01)
+
+    unblock = threading.Event()
+    lock = threading.Lock()
+    order = []
+
+    def fn(backend):
+        with lock:
+            order.append(backend.name)
+            first = len(order) == 1
+        if first:
+            unblock.wait(10)
+            return 'slow'
+        return 'fast'
+
+    try:
+        result, backend, info = router.call(fn, 'full')
+    finally:
+        unblock.set()
+    assert result == 'fast' and backend.name == order[1]
+    assert info == {"attempts": 2, "hedged": True}
+    assert router.stats()["hedged"] == 1 and router.stats()["hedge_wins"] == 1
+
+
+def test_no_hedge_when_disabled_for_call():
+    router = make_router('a', 'b', hedge_percentile=90)
+    for backend in router.backends:
+        for _ in range(5):
+            backend.inflight += 1
+            router.record(backend, 'full', 0.001, True)
+    event = threading.Event()
+
+    def fn(backend):
+        event.wait(0.05)
+        return backend.name
+
+    _, _, info = router.call(fn, 'full', hedge=False)
+    assert info == {"attempts": 1, "hedged": False}
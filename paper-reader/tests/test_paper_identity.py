@@ -0,0 +1,28 @@
+from paper_identity import IdentityIndex, resolve_paper_id
+
+
+def test_known_alias_is_resolved_without_writing(tmp_path):
+    index = IdentityIndex(tmp_path / 'identity.sqlite')
+    url = 'https://arxiv.org/abs/2401.00001v1'
+    paper_id = resolve_paper_id(url, index)
+    assert {a["alias"]: a["kind"] for a in index.aliases(paper_id)} == {
+        url: "input", "arxiv:2401.00001v1": "identity"}
+
+    changes = index.conn.total_changes
+    for _ in range(3):
+        assert resolve_paper_id(url, index) == paper_id
+    assert index.conn.total_changes == changes
+
+    # 同一身份的新写法只登记一次
+    assert resolve_paper_id('arXiv:2401.00001v1', index) == paper_id
+    assert index.conn.total_changes == changes + 1
+    assert resolve_paper_id('arXiv:2401.00001v1', index) == paper_id
+    assert index.conn.total_changes == changes + 1
+    index.close()
+
+
+def test_identity_input_keeps_identity_kind(tmp_path):
+    index = IdentityIndex(tmp_path / 'identity.sqlite')
+    paper_id = resolve_paper_id('sha256:abc', index)
+    assert [(a["alias"], a["kind"]) for a in index.aliases(paper_id)] == [('sha256:abc', 'identity')]
+    index.close()
@@ -0,0 +1,82 @@
+import pytest
+
+from paper_reader import PaperReader
+
+MARKDOWN = """Preamble line
+# Title
+
+Intro text.
+## Method
+方法的细节。
+### Loss
+loss text
+## Related Work
+related
+"""
+
+
+def open_reader(tmp_path, content, name='paper.md'):
+    path = tmp_path / name
+    path.write_bytes(content.encode('utf-8') if isinstance(content, str) else content)
+    return PaperReader(path)
+
+
+def test_outline_covers_whole_file(tmp_path):
+    with open_reader(tmp_path, MARKDOWN) as reader:
+        outline = reader.outline()
+        assert [(s["index"], s["level"], s["title"], s["line"], s["end_line"]) for s in outline] == [
+            (0, None, None, 1, 1),
+            (1, 1, 'Title', 2, 4),
+            (2, 2, 'Method', 5, 6),
+            (3, 3, 'Loss', 7, 8),
+            (4, 2, 'Related Work', 9, 10),
+        ]
+        # 各节的字节区间首尾相接，覆盖整个文件
+        assert outline[0]["offset"] == 0
+        for prev, cur in zip(outline, outline[1:]):
+            assert prev["offset"] + prev["bytes"] == cur["offset"]
+        assert outline[-1]["offset"] + outline[-1]["bytes"] == reader.size
+        assert reader.line_count == 10
+
+
+def test_no_preamble_and_crlf_headings(tmp_path):
+    with open_reader(tmp_path, b"# A ##\r\nbody\r\n## B\r\n") as reader:
+        assert [(s["title"], s["line"], s["end_line"]) for s in reader.outline()] == [('A', 1, 2), ('B', 3, 3)]
+
+
+def test_sections(tmp_path):
+    with open_reader(tmp_path, MARKDOWN) as reader:
+        assert reader.section('method') == "## Method\n方法的细节。\n"
+        assert reader.section('Method', include_subsections=True) == "## Method\n方法的细节。\n### Loss\nloss text\n"
+        assert reader.section('related') == "## Related Work\nrelated\n"
+        assert reader.section('3') == reader.section(3) == "### Loss\nloss text\n"
+        assert reader.section(0) == "Preamble line\n"
+        assert reader.section(5) is None and reader.section('missing') is None
+
+
+@pytest.mark.parametrize('start, end, expected', [
+    (1, 1, "Preamble line"),
+    (0, 2, "Preamble line\n# Title"),
+    (6, 6, "方法的细节。"),
+    (9, None, "## Related Work\nrelated"),
+    (10, 99, "related"),
+    (11, None, ""),
+    (5, 4, ""),
+])
+def test_line_ranges(tmp_path, start, end, expected):
+    with open_reader(tmp_path, MARKDOWN) as reader:
+        assert reader.lines(start, end) == expected
+
+
+def test_file_without_trailing_newline(tmp_path):
+    with open_reader(tmp_path, "# A\nlast") as reader:
+        assert reader.line_count == 2
+        assert reader.lines(2) == "last"
+        assert reader.outline()[-1]["end_line"] == 2
+
+
+def test_empty_file(tmp_path):
+    with open_reader(tmp_path, b"") as reader:
+        assert reader.outline() == []
+        assert reader.line_count == 0
+        assert reader.lines(1) == ""
@@ -0,0 +1,31 @@
+import json
+
+import parse_cache
+
+
+def write_paper(base, paper_id, last_accessed):
+    paper_dir = base / paper_id
+    (paper_dir / 'images').mkdir(parents=True)
+    (paper_dir / 'paper.md').write_text(f"# {paper_id}\n", encoding='utf-8')
+    manifest = parse_cache.build_manifest(paper_dir, f'https://example.invalid/{paper_id}.pdf', 'vlm')
+    manifest["last_accessed"] = last_accessed
+    parse_cache.write_manifest(paper_dir, manifest)
+    return paper_dir
+
+
+def test_files_written_after_parsing_count_towards_size_limit(backup_dir):
+    old = write_paper(backup_dir, 'old', 1)
+    new = write_paper(backup_dir, 'new', 2)
+    # 解析完成后才写入的分析结果不在 manifest 的文件列表里
+    (old / 'image_analysis.json').write_text(json.dumps({"results": ['x' * 10000]}), encoding='utf-8')
+
+    assert parse_cache.evict(max_bytes=5000) == ['old']
+    assert not old.exists() and new.is_dir()
+
+
+def test_manifest_size_covers_whole_directory(backup_dir):
+    paper_dir = write_paper(backup_dir, 'paper', 1)
+    (paper_dir / 'notes.txt').write_bytes(b'x' * 100)
+    manifest = parse_cache.build_manifest(paper_dir, 'https://example.invalid/paper.pdf', 'vlm')
+    assert manifest["total_size"] == parse_cache.directory_size(paper_dir)
+    assert manifest["total_size"] >= 100 + len('# paper\n')
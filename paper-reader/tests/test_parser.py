@@ -0,0 +1,116 @@
+import io
+import time
+import zipfile
+from pathlib import Path
+
+import pytest
+import requests
+
+import fixtures
+import paper_identity
+import parser as paper_parser
+from fake_services import FakeServices
+
+
+def test_arxiv_version_is_looked_up_once_and_kept_on_failure(monkeypatch):
+    calls = []
+    answers = iter(['v2', None])
+
+    def latest(arxiv_id):
+        calls.append(arxiv_id)
+        return next(answers)
+    monkeypatch.setattr(paper_parser, 'latest_arxiv_version', latest)
+
+    first = paper_parser.resolve_source('2401.00001')
+    second = paper_parser.resolve_source('https://arxiv.org/abs/2401.00001')
+    assert first["key"] == second["key"] == 'https://arxiv.org/pdf/2401.00001v2'
+    assert calls == ['2401.00001']
+
+    # 记录过期后重新查询；查询失败时沿用上次的版本
+    monkeypatch.setattr(time, 'time', lambda now=time.time(): now + paper_identity.ARXIV_VERSION_TTL + 1)
+    third = paper_parser.resolve_source('arXiv:2401.00001')
+    assert calls == ['2401.00001', '2401.00001']
+    assert third["key"] == first["key"]
+    assert paper_parser.get_paper_id(third["key"]) == paper_parser.get_paper_id(first["key"])
+
+
+def test_explicit_arxiv_version_is_not_looked_up(monkeypatch):
+    monkeypatch.setattr(paper_parser, 'latest_arxiv_version', lambda arxiv_id: pytest.fail("不应查询 arXiv API"))
+    assert paper_parser.resolve_source('2401.00001v1')["key"] == 'https://arxiv.org/pdf/2401.00001v1'
+
+
+def test_parse_many_reports_duplicate_inputs(monkeypatch):
+    with FakeServices() as services:
+        monkeypatch.setattr(paper_parser, 'MINERU_API_BASE', services.mineru_base)
+        services.add_paper('https://arxiv.org/pdf/2401.00001v1', fixtures.build_zip(fixtures.build_paper(1, 2)))
+        inputs = ['https://arxiv.org/abs/2401.00001v1', 'arXiv:2401.00001v1', 'https://arxiv.org/pdf/2401.00001v1']
+        items = list(paper_parser.parse_many(inputs, 'key', check_interval=0.01))
+
+    assert sorted(item["pdf_url"] for item in items) == sorted(inputs)
+    by_url = {item["pdf_url"]: item for item in items}
+    assert by_url[inputs[0]]["status"] == 'ok'
+    paper_id = by_url[inputs[0]]["result"]["paper_id"]
+    for duplicate in inputs[1:]:
+        assert by_url[duplicate] == {"pdf_url": duplicate, "status": "duplicate", "duplicate_of": inputs[0],
+                                     "paper_id": paper_id}
+    assert services.reset_counters().get('mineru.submit') == 1
+
+
+def test_sync_writes_only_added_and_changed_images(tmp_path, monkeypatch):
+    def sync(files, known_hashes=None):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            for name, data in files.items():
+                zf.writestr(name, data)
+        with zipfile.ZipFile(buffer) as zf:
+            members = [(info, Path(info.filename)) for info in zf.infolist()]
+            return paper_parser.sync_image_members(zf, members, tmp_path / 'images', known_hashes)
+
+    same, old, new = (fixtures.make_png(32, 32, seed=seed) for seed in (1, 2, 3))
+    _, hashes, written = sync({'a.png': same, 'b.png': old})
+    assert written == len(same) + len(old)
+
+    streamed = []
+    stream_member = paper_parser._stream_member
+
+    def recording_stream_member(zip_ref, info, *args, **kwargs):
+        streamed.append(info.filename)
+        return stream_member(zip_ref, info, *args, **kwargs)
+    monkeypatch.setattr(paper_parser, '_stream_member', recording_stream_member)
+
+    changed = fixtures.make_png(32, 32, seed=4)
+    diff, new_hashes, written = sync({'a.png': same, 'b.png': changed, 'c.png': new}, hashes)
+    assert diff == {"added": ['c.png'], "changed": ['b.png'], "removed": [], "unchanged": ['a.png']}
+    assert sorted(streamed) == ['b.png', 'c.png']
+    assert written == len(changed) + len(new)
+    assert new_hashes["a.png"] == hashes["a.png"]
+    assert (tmp_path / 'images' / 'b.png').read_bytes() == changed
+    assert not list((tmp_path / 'images').glob('.*.tmp'))
+
+
+def test_wait_for_many_reports_each_task_once(monkeypatch):
+    polls = {}
+    states = {'ok': ['running', 'running', 'done'], 'fail': ['failed']}
+
+    def check_task_status(task_id, api_key):
+        polls[task_id] = polls.get(task_id, 0) + 1
+        if task_id == 'flaky':
+            raise requests.ConnectionError("connection reset")
+        if task_id == 'slow':
+            return {"data": {"state": 'running'}}
+        return {"data": {"state": states[task_id].pop(0), "err_msg": 'bad pdf'}}
+    monkeypatch.setattr(paper_parser, 'check_task_status', check_task_status)
+
+    start = time.monotonic()
+    results = {task_id: (info, error) for task_id, info, error in paper_parser.wait_for_many(
+        ['ok', 'fail', 'flaky', 'slow'], 'key', deadline=0.3, max_errors=3, check_interval=0.01)}
+    elapsed = time.monotonic() - start
+
+    assert set(results) == {'ok', 'fail', 'flaky', 'slow'}
+    assert results['ok'][1] is None and results['ok'][0]["poll_stats"]["polls"] == 3
+    assert isinstance(results['fail'][1], ValueError) and 'bad pdf' in str(results['fail'][1])
+    assert isinstance(results['flaky'][1], requests.ConnectionError)
+    flaky_stats = results['flaky'][0]["poll_stats"]
+    assert (flaky_stats["polls"], flaky_stats["errors"]) == (3, 3) and polls['flaky'] == 3
+    assert isinstance(results['slow'][1], TimeoutError)
+    assert 0.3 <= elapsed < 2
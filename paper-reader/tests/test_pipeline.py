@@ -0,0 +1,93 @@
+import hashlib
+import threading
+from pathlib import Path
+
+import pytest
+
+import analyze_images
+import fixtures
+import parse_cache
+import parser as paper_parser
+import pipeline
+import search_index
+from fake_services import FakeServices, ServiceProfile
+
+ARXIV_ABS = 'https://arxiv.org/abs/2401.00001v1'
+ARXIV_PDF = 'https://arxiv.org/pdf/2401.00001v1'
+OTHER_PDF = 'https://example.invalid/papers/other.pdf'
+
+
+@pytest.fixture
+def services(monkeypatch):
+    with FakeServices(mineru=ServiceProfile(), nim=ServiceProfile(seed=1)) as services:
+        services.add_paper(ARXIV_PDF, fixtures.build_zip(fixtures.build_paper(2, 4, seed=1)))
+        services.add_paper(OTHER_PDF, fixtures.build_zip(fixtures.build_paper(2, 4, seed=2)))
+        monkeypatch.setattr(paper_parser, 'MINERU_API_BASE', services.mineru_base)
+        monkeypatch.setattr(analyze_images, 'NVIDIA_API_BASE', services.nim_base)
+        yield services
+
+
+def run_pipeline(urls, timeout=60, **kwargs):
+    """在后台线程中运行流水线，超时未结束视为挂起"""
+    results = []
+    pipe = pipeline.Pipeline('key', 'key', analyze_workers=2, **kwargs)
+    thread = threading.Thread(target=lambda: results.extend(pipe.run(urls)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "流水线没有结束"
+    return results
+
+
+def test_same_paper_is_processed_once_and_exported_per_paper(services, tmp_path):
+    output_dir = tmp_path / 'out'
+    results = run_pipeline([ARXIV_ABS, ARXIV_PDF, OTHER_PDF], output_dir=str(output_dir))
+
+    assert sorted(r["status"] for r in results) == ['duplicate', 'ok', 'ok']
+    duplicate = next(r for r in results if r["status"] == 'duplicate')
+    ok = {r["pdf_url"]: r for r in results if r["status"] == 'ok'}
+    assert duplicate["pdf_url"] == ARXIV_PDF and duplicate["duplicate_of"] == ARXIV_ABS
+    assert duplicate["paper_id"] == ok[ARXIV_ABS]["paper_id"]
+    assert services.reset_counters().get('mineru.submit') == 2
+    exported = sorted(p.name for p in output_dir.iterdir())
+    assert exported == sorted(r["paper_id"] for r in ok.values())
+    for paper_id in exported:
+        assert (output_dir / paper_id / 'paper.md').is_file()
+
+
+def test_failure_while_writing_output_is_reported(services, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(search_index, 'record_analysis', fail)
+
+    results = run_pipeline([ARXIV_PDF, OTHER_PDF])
+
+    assert len(results) == 2
+    assert all(r["status"] == 'error' and r["stage"] == 'finish' for r in results)
+    assert "disk full" in results[0]["error"]
+
+
+def test_unresolvable_source_is_reported(services, tmp_path):
+    results = run_pipeline([str(tmp_path / 'missing.pdf'), OTHER_PDF])
+
+    by_url = {r["pdf_url"]: r for r in results}
+    assert by_url[str(tmp_path / 'missing.pdf')]["stage"] == 'resolve'
+    assert by_url[OTHER_PDF]["status"] == 'ok'
+
+
+def test_local_pdf_is_resolved_once(services, tmp_path, monkeypatch):
+    pdf = tmp_path / 'local.pdf'
+    pdf.write_bytes(fixtures.make_pdf(4, seed=3))
+    services.add_paper(f"sha256:{hashlib.sha256(pdf.read_bytes()).hexdigest()}",
+                       fixtures.build_zip(fixtures.build_paper(1, 2, seed=3)))
+    hashed = []
+    hash_file = parse_cache.hash_file
+
+    def counting_hash_file(path, *args, **kwargs):
+        hashed.append(Path(path))
+        return hash_file(path, *args, **kwargs)
+    monkeypatch.setattr(parse_cache, 'hash_file', counting_hash_file)
+
+    results = run_pipeline([str(pdf)])
+
+    assert [r["status"] for r in results] == ['ok']
+    assert hashed.count(pdf) == 1
@@ -0,0 +1,66 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+import analyze_images
+import fixtures
+from analyze_images import RateLimiter, parse_retry_after
+from fake_services import FakeServices, ServiceProfile
+
+
+def test_throttle_pauses_and_halves_rate():
+    limiter = RateLimiter(rate=100, burst=1)
+    limiter.acquire()
+    limiter.on_throttle(0.2)
+    assert limiter.rate == 50 and limiter.throttled == 1
+
+    start = time.monotonic()
+    limiter.acquire()
+    assert 0.2 <= time.monotonic() - start < 1
+
+
+def test_throttle_without_retry_after_uses_rate_and_floor():
+    limiter = RateLimiter(rate=8, burst=4, min_rate=1)
+    limiter.on_throttle()
+    # 没有 Retry-After 时暂停一个（降速后的）令牌间隔，且清空积攒的令牌
+    assert limiter.rate == 4 and limiter.tokens == 0
+    assert limiter.paused_until - time.monotonic() == pytest.approx(0.25, abs=0.05)
+    for _ in range(5):
+        limiter.on_throttle(0)
+    assert limiter.rate == 1
+
+
+def test_success_recovers_rate_up_to_max():
+    limiter = RateLimiter(rate=100, recovery=0.05)
+    limiter.on_throttle(0)
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(55)
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.rate == 100
+
+
+def test_parse_retry_after():
+    assert parse_retry_after('2') == 2.0
+    assert parse_retry_after('-1') == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(formatdate(time.time() + 30, usegmt=True)) == pytest.approx(30, abs=2)
+
+
+def test_vision_calls_back_off_on_429(tmp_path, monkeypatch):
+    image = tmp_path / 'fig.png'
+    image.write_bytes(fixtures.make_png(32, 32, seed=1))
+    with FakeServices(nim=ServiceProfile(throttle_rate=0.5, retry_after=0.1, seed=3)) as services:
+        monkeypatch.setattr(analyze_images, 'NVIDIA_API_BASE', services.nim_base)
+        limiter = RateLimiter(rate=1000, burst=1)
+        start = time.monotonic()
+        for _ in range(4):
+            assert analyze_images.call_vision_model(image, 'context', 'key', 'qwen', rate_limiter=limiter,
+                                                    max_retries=10)
+        elapsed = time.monotonic() - start
+
+    assert limiter.throttled > 0
+    # 每次 429 都按 Retry-After 暂停
+    assert elapsed >= 0.1 * limiter.throttled
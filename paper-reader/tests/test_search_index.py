@@ -0,0 +1,97 @@
+import pytest
+
+import search_index
+from search_index import FIGURE, SECTION, SearchIndex, figure_chunks, segment_cjk, to_match_query, unsegment_cjk
+
+MARKDOWN = """# A Paper
+
+## Method
+
+We train with a contrastive loss.
+
+![](images/arch.png)
+Figure 1: Architecture.
+
+## 实验
+
+本文方法的准确率达到了 95%。
+
+![](images/results.png)
+"""
+
+
+@pytest.fixture
+def index(backup_dir):
+    index = SearchIndex()
+    yield index
+    index.close()
+
+
+def test_unchanged_content_is_not_reindexed(index, monkeypatch):
+    calls = []
+    chunk_markdown = search_index.chunk_markdown
+
+    def counting_chunk_markdown(*args, **kwargs):
+        calls.append(1)
+        return chunk_markdown(*args, **kwargs)
+    monkeypatch.setattr(search_index, 'chunk_markdown', counting_chunk_markdown)
+
+    assert index.index_markdown('p1', MARKDOWN)
+    assert not index.index_markdown('p1', MARKDOWN)
+    assert len(calls) == 1
+
+    changed = MARKDOWN.replace('contrastive loss', 'triplet loss')
+    assert index.index_markdown('p1', changed)
+    assert len(calls) == 2
+    assert not index.search('contrastive')
+    assert [h["paper_id"] for h in index.search('triplet')] == ['p1']
+    assert index.stats()["chunks"][SECTION] == len(chunk_markdown(changed))
+
+
+def test_cjk_queries_match_character_phrases():
+    assert to_match_query('准确率 loss') == '"准 确 率" "loss"'
+    assert to_match_query('say "hi"') == '"say" """hi"""'
+    assert to_match_query('""') == ''
+    text = '本文方法的准确率达到了 95%, see Table 2。'
+    assert unsegment_cjk(segment_cjk(text)) == text
+
+
+def test_cjk_search_and_snippet(index):
+    index.index_markdown('p1', MARKDOWN)
+    hits = index.search('准确率')
+    assert len(hits) == 1
+    assert hits[0]["section"] == '实验' and hits[0]["line_start"] == 12
+    assert '本文方法的[准确率]达到了 95%' in hits[0]["snippet"]
+    # 逐字短语匹配：字序不同不命中
+    assert not index.search('率准确')
+
+
+def test_figure_chunks_point_at_image_lines():
+    analysis = {"results": [
+        {"image_name": 'results.png', "analysis": '准确率对比'},
+        {"image_path": '/backup/p1/images/arch.png', "analysis": 'encoder and decoder'},
+        {"image_name": 'arch.png', "analysis": 'partial', "error": 'timeout'},
+        {"image_name": 'missing.png', "analysis": 'not referenced'},
+        {"image_name": 'empty.png', "analysis": None},
+    ]}
+    chunks = figure_chunks(analysis, MARKDOWN)
+    assert [(c["image"], c["section"], c["line_start"], c["line_end"]) for c in chunks] == [
+        ('results.png', '实验', 14, 14),
+        ('arch.png', 'Method', 7, 7),
+        ('missing.png', None, None, None),
+    ]
+
+
+def test_remove_drops_chunks_and_hashes(index):
+    analysis = {"results": [{"image_name": 'arch.png', "analysis": 'encoder diagram'}]}
+    for paper_id in ('p1', 'p2'):
+        index.index_markdown(paper_id, MARKDOWN)
+        index.index_analysis(paper_id, analysis, MARKDOWN)
+    assert {h["paper_id"] for h in index.search('encoder', kind=FIGURE)} == {'p1', 'p2'}
+
+    index.remove(['p1'])
+    assert {h["paper_id"] for h in index.search('contrastive')} == {'p2'}
+    assert {h["paper_id"] for h in index.search('encoder', kind=FIGURE)} == {'p2'}
+    assert index.stats()["papers"] == 1
+    # 删除后同样的内容需要重新索引
+    assert index.index_markdown('p1', MARKDOWN)